@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+三方合并性能测试
+
+生成多兆字节的 MEMORY.md 和 skills.json，测量 merge_content 在常见冲突场景下的耗时：
+
+    python benchmarks/bench_merge.py
+    python benchmarks/bench_merge.py --sizes 1,4,8 --repeat 5 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from merge import merge_content
+
+
+def make_memory(size_mb: float, rng: random.Random) -> list:
+    """生成约 size_mb 兆字节的记忆文件（按行）"""
+    lines = []
+    total = 0
+    n = 0
+    while total < size_mb * 1024 * 1024:
+        if n % 50 == 0:
+            line = f"\n## Session {n // 50}\n"
+        else:
+            line = f"- [{n}] remembered {rng.random():.10f}: user prefers option {rng.randint(0, 999)}\n"
+        lines.append(line)
+        total += len(line)
+        n += 1
+    return lines
+
+
+def scenario_append(lines: list, rng: random.Random):
+    """两个 agent 同时在末尾追加"""
+    base = ''.join(lines)
+    return base, base + '- appended by this device\n' * 5, base + '- appended by the other device\n' * 5
+
+
+def scenario_scattered(lines: list, rng: random.Random, edits: int = 100):
+    """两边各自在不同位置修改若干行"""
+    ours = list(lines)
+    theirs = list(lines)
+    positions = rng.sample(range(len(lines)), edits * 2)
+    for k, i in enumerate(positions[:edits]):
+        ours[i] = f"- edited here {k}\n"
+    for k, i in enumerate(positions[edits:]):
+        theirs[i] = f"- edited there {k}\n"
+    return ''.join(lines), ''.join(ours), ''.join(theirs)
+
+
+def scenario_rewrite_section(lines: list, rng: random.Random):
+    """一边整理中间一段，另一边追加"""
+    start = len(lines) // 2
+    ours = lines[:start] + ['- summarized section\n'] + lines[start + 200:]
+    base = ''.join(lines)
+    return base, ''.join(ours), base + '- appended by the other device\n'
+
+
+def make_skills(count: int, rng: random.Random):
+    """生成 skills.json 的三个版本：两边分别修改、新增不同的技能"""
+    skills = [{'name': f'skill-{i}', 'enabled': True, 'level': rng.randint(1, 5)} for i in range(count)]
+    base = {'version': 1, 'skills': skills}
+    ours = json.loads(json.dumps(base))
+    theirs = json.loads(json.dumps(base))
+    for i in rng.sample(range(count), 20):
+        ours['skills'][i]['level'] += 1
+    for i in rng.sample(range(count), 20):
+        theirs['skills'][i]['enabled'] = False
+    ours['skills'].append({'name': 'skill-ours'})
+    theirs['skills'].append({'name': 'skill-theirs'})
+    return tuple(json.dumps(value, indent=2) for value in (base, ours, theirs))
+
+
+def measure(file_path: str, base: str, ours: str, theirs: str, repeat: int) -> dict:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = merge_content(file_path, base, ours, theirs)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    size = len(base.encode('utf-8'))
+    return {
+        'file': file_path,
+        'bytes': size,
+        'lines': base.count('\n'),
+        'clean': result.clean,
+        'best_ms': round(best * 1000, 2),
+        'median_ms': round(sorted(timings)[len(timings) // 2] * 1000, 2),
+        'mb_per_s': round(size / best / 1024 / 1024, 1) if best else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SoulSync three-way merge benchmark')
+    parser.add_argument('--sizes', default='1,4', help='MEMORY.md sizes in MB, comma separated')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for size in [float(value) for value in args.sizes.split(',')]:
+        lines = make_memory(size, rng)
+        for name, build in (('append', scenario_append), ('scattered', scenario_scattered),
+                            ('rewrite_section', scenario_rewrite_section)):
+            entry = measure('MEMORY.md', *build(lines, rng), repeat=args.repeat)
+            entry['scenario'] = name
+            results.append(entry)
+
+    entry = measure('skills.json', *make_skills(2000, rng), repeat=args.repeat)
+    entry['scenario'] = 'skills'
+    results.append(entry)
+
+    if args.json:
+        print(json.dumps({'benchmark': 'merge', 'results': results}, indent=2))
+        return
+    print(f"{'scenario':<16}{'file':<13}{'size':>10}{'best ms':>10}{'median ms':>11}{'MB/s':>8}  clean")
+    for entry in results:
+        print(f"{entry['scenario']:<16}{entry['file']:<13}{entry['bytes'] / 1024 / 1024:>8.2f}MB"
+              f"{entry['best_ms']:>10}{entry['median_ms']:>11}{entry['mb_per_s']:>8}  {entry['clean']}")
+
+
+if __name__ == '__main__':
+    main()
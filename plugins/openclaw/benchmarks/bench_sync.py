@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+同步管道性能测试
+
+在进程内启动替身服务器（stub_server），用真实的客户端、ProfileSync、上传队列和
+WebSocket 通知路径测量：
+
+    cold_pull    空工作区全量拉取（pull_all）
+    push         稳态下单个文件修改后 push_file 的延迟
+    push_large   启用块存储时大文件的修改：追加应走增量，整段移动应走分块
+    burst        一次写入 N 个文件，经上传队列全部上传完成的耗时
+    fan_in       其他设备连续写入 M 个文件，经 /ws 通知和增量同步全部落到本地的耗时
+    echo_pull    监听中的工作区拉取 N 个云端文件，断言没有事件进入上传队列、上传次数为 0
+
+    python benchmarks/bench_sync.py
+    python benchmarks/bench_sync.py --files 500 --burst 1000 --engine asyncio --json
+    python benchmarks/bench_sync.py --output results/sync.json
+
+结果中带有当前提交号，便于在不同提交之间对比。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from chunking import ChunkStore
+from client import OpenClawClient
+from cursor import SyncCursor
+from echo import EchoRegistry
+from manifest import SyncManifest
+from profiles import ProfilesClient
+from remote_batcher import RemoteChangeBatcher
+from stub_server import StubCloudServer
+from sync import ProfileSync
+from sync_queue import SyncQueue
+from transport import Transport
+from version_manager import VersionManager
+from watcher import OpenClawMultiWatcher
+
+
+def percentiles(samples: list) -> dict:
+    """延迟分布（毫秒）"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        'p50_ms': pick(0.5),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3)
+    }
+
+
+def make_content(size: int, rng: random.Random, tag: str) -> str:
+    """生成约 size 字节的 Markdown 内容"""
+    lines = [f"# {tag}\n"]
+    total = len(lines[0])
+    while total < size:
+        line = f"- note {rng.randint(0, 10 ** 9)}: user prefers option {rng.randint(0, 999)}\n"
+        lines.append(line)
+        total += len(line)
+    return ''.join(lines)
+
+
+def commit_id() -> str:
+    """当前 git 提交号，不在仓库中时返回 None"""
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR,
+                                capture_output=True, text=True, timeout=5)
+        return output.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Device:
+    """一台设备：独立的工作区、版本号、清单、游标和客户端
+
+    chunks 为 True 时使用设备自己的块存储（大文件分块上传）。
+    """
+
+    def __init__(self, server: StubCloudServer, root: str, config: dict, engine=None, chunks: bool = False):
+        self.server = server
+        self.root = root
+        self.workspace = os.path.join(root, 'workspace')
+        os.makedirs(self.workspace, exist_ok=True)
+        self.engine = engine
+        config = dict(config, cloud_url=server.url)
+        self.chunk_store = ChunkStore(os.path.join(root, 'chunks')) if chunks else None
+
+        if engine is not None:
+            self.transport, self.client, self.profiles_client = engine.create_clients(
+                config, chunk_store=self.chunk_store)
+        else:
+            self.transport = Transport.from_config(config)
+            self.client = OpenClawClient(config, self.transport)
+            self.profiles_client = ProfilesClient(server.url, transport=self.transport,
+                                                  chunk_store=self.chunk_store,
+                                                  chunk_min_size=config.get('chunk_min_size', 65536))
+
+        token = self._login(config)
+        # 直接设置 token，不写插件目录下的 token 文件
+        if engine is not None:
+            self.client._target.token = token
+        else:
+            self.client.token = token
+        self.profiles_client.set_token(token)
+
+        self.version_manager = VersionManager(os.path.join(root, 'versions.json'),
+                                              group_commit_interval=1.0, group_commit_size=200)
+        self.manifest = SyncManifest(os.path.join(root, 'manifest.json'), save_interval=1.0)
+        self.cursor = SyncCursor(os.path.join(root, 'sync_cursor.json'), scope=server.url)
+        self.echo = EchoRegistry()
+        self.sync = ProfileSync(
+            self.profiles_client,
+            self.version_manager,
+            self.workspace,
+            manifest=self.manifest,
+            pull_concurrency=config.get('pull_concurrency', 8),
+            stream_threshold=config.get('stream_threshold', 262144),
+            cursor=self.cursor,
+            echo=self.echo
+        )
+
+    def _login(self, config: dict) -> str:
+        """经 /api/auth/device 取得 token"""
+        response = self.transport.post(f"{self.server.url}/api/auth/device", json={
+            'device_id': os.path.basename(self.root),
+            'email': config.get('email', 'bench@example.com'),
+            'password': config.get('password', 'bench')
+        })
+        return response.json()['token']
+
+    def write(self, file_path: str, content: str):
+        absolute_path = os.path.join(self.workspace, file_path)
+        os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+        with open(absolute_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def close(self):
+        self.sync.flush()
+        self.client.close()
+        self.transport.close()
+
+
+def seed_remote(server: StubCloudServer, count: int, size: int, large: int, large_size: int,
+                rng: random.Random) -> int:
+    """在服务端预置文件，返回总字节数"""
+    total = 0
+    with server.state.lock:
+        for i in range(count):
+            content = make_content(size, rng, f"remote {i}")
+            server.state.put_profile(f"memory/note-{i:05d}.md", content)
+            total += len(content.encode('utf-8'))
+        for i in range(large):
+            content = make_content(large_size, rng, f"large {i}")
+            server.state.put_profile(f"memory/large-{i}.md", content)
+            total += len(content.encode('utf-8'))
+    return total
+
+
+def bench_cold_pull(server, tmp, config, engine, args, rng) -> dict:
+    seeded = seed_remote(server, args.files, args.size, args.large, args.large_size, rng)
+    device = Device(server, os.path.join(tmp, 'cold'), config, engine)
+    requests_before = server.state.stats['requests']
+    started = time.perf_counter()
+    summary = device.sync.pull_all()
+    seconds = time.perf_counter() - started
+    device.close()
+    return {
+        'scenario': 'cold_pull',
+        'files': summary['files'],
+        'errors': summary['errors'],
+        'bytes': seeded,
+        'seconds': round(seconds, 4),
+        'files_per_s': round(summary['files'] / seconds, 1) if seconds else None,
+        'mb_per_s': round(seeded / seconds / 1024 / 1024, 2) if seconds else None,
+        'requests': server.state.stats['requests'] - requests_before
+    }
+
+
+def bench_push(server, tmp, config, engine, args, rng) -> dict:
+    device = Device(server, os.path.join(tmp, 'push'), config, engine)
+    file_path = 'MEMORY.md'
+    content = make_content(args.push_size, rng, 'memory')
+    device.write(file_path, content)
+    device.sync.push_file(file_path)
+
+    received_before = server.state.stats['bytes_received']
+    latencies = []
+    for i in range(args.push_ops):
+        content += f"- appended {i}: {rng.random():.8f}\n"
+        device.write(file_path, content)
+        started = time.perf_counter()
+        device.sync.push_file(file_path)
+        latencies.append(time.perf_counter() - started)
+    received = server.state.stats['bytes_received'] - received_before
+    delta = dict(device.profiles_client.delta_stats)
+    device.close()
+    return dict({
+        'scenario': 'push',
+        'ops': args.push_ops,
+        'file_bytes': len(content.encode('utf-8')),
+        'wire_bytes_per_op': round(received / args.push_ops) if args.push_ops else 0,
+        'delta_uploads': delta['delta_uploads']
+    }, **percentiles(latencies))
+
+
+def bench_push_large(server, tmp, config, engine, args, rng) -> dict:
+    device = Device(server, os.path.join(tmp, 'push_large'), config, engine, chunks=True)
+    file_path = 'MEMORY.md'
+    lines = make_content(args.large_size, rng, 'memory').splitlines(keepends=True)
+    device.write(file_path, ''.join(lines))
+    device.sync.push_file(file_path)
+
+    received_before = server.state.stats['bytes_received']
+    requests_before = server.state.stats['requests']
+    latencies = []
+    for i in range(args.push_ops):
+        if i % 10 == 9:
+            # 整段移动：行级补丁要带上整段内容，分块只需发送边界附近的块
+            quarter = len(lines) // 4
+            lines = lines[quarter:] + lines[:quarter]
+        else:
+            lines.append(f"- appended {i}: {rng.random():.8f}\n")
+        device.write(file_path, ''.join(lines))
+        started = time.perf_counter()
+        device.sync.push_file(file_path)
+        latencies.append(time.perf_counter() - started)
+    received = server.state.stats['bytes_received'] - received_before
+    delta = dict(device.profiles_client.delta_stats)
+    chunks = dict(device.profiles_client.chunk_stats)
+    device.close()
+    return dict({
+        'scenario': 'push_large',
+        'ops': args.push_ops,
+        'file_bytes': len(''.join(lines).encode('utf-8')),
+        'wire_bytes_per_op': round(received / args.push_ops) if args.push_ops else 0,
+        'delta_uploads': delta['delta_uploads'],
+        'chunked_uploads': chunks['chunked_uploads'],
+        'requests': server.state.stats['requests'] - requests_before
+    }, **percentiles(latencies))
+
+
+def bench_burst(server, tmp, config, engine, args, rng) -> dict:
+    device = Device(server, os.path.join(tmp, 'burst'), config, engine)
+    paths = [f"burst/file-{i:05d}.md" for i in range(args.burst)]
+    for file_path in paths:
+        device.write(file_path, make_content(args.size, rng, file_path))
+
+    queue = SyncQueue(
+        device.sync.push_files,
+        workers=config.get('sync_workers', 2),
+        batch_size=config.get('push_batch_size', 50),
+        batch_window=config.get('push_batch_window', 0.5)
+    )
+    requests_before = server.state.stats['requests']
+    uploads_before = server.state.stats['uploads']
+    started = time.perf_counter()
+    queue.start()
+    for file_path in paths:
+        queue.submit(file_path)
+    # 等待队列按正常节奏（包括 batch_window）处理完，再停止
+    deadline = time.monotonic() + args.timeout
+    while queue.get_stats()['processed'] < len(paths) and time.monotonic() < deadline:
+        time.sleep(0.005)
+    seconds = time.perf_counter() - started
+    queue.stop()
+    stats = queue.get_stats()
+    device.close()
+    return {
+        'scenario': 'burst',
+        'files': args.burst,
+        'uploaded': server.state.stats['uploads'] - uploads_before,
+        'seconds': round(seconds, 4),
+        'files_per_s': round(args.burst / seconds, 1) if seconds else None,
+        'batches': stats['batches'],
+        'requests': server.state.stats['requests'] - requests_before,
+        'errors': stats['errors']
+    }
+
+
+def bench_fan_in(server, tmp, config, engine, args, rng) -> dict:
+    device = Device(server, os.path.join(tmp, 'fan_in'), config, engine)
+    # 先完成一次同步，取得游标
+    device.sync.sync_since_cursor()
+    batcher = RemoteChangeBatcher(device.sync.apply_remote_changes,
+                                  window=config.get('remote_batch_window', 0.5))
+    batcher.start()
+
+    def on_message(data: dict):
+        if data.get('event') == 'file_updated':
+            batcher.add(data.get('file_path'), data.get('version'))
+
+    device.client.connect_websocket(on_message)
+    deadline = time.monotonic() + 10
+    while server.state.stats['ws_connections'] == 0 or not server.state.sockets:
+        if time.monotonic() > deadline:
+            raise RuntimeError('WebSocket did not connect to the stub server')
+        time.sleep(0.01)
+
+    requests_before = server.state.stats['requests']
+    written = {}
+    started = time.perf_counter()
+    for i in range(args.fan_in):
+        file_path = f"remote/change-{i:05d}.md"
+        record = server.remote_write(file_path, make_content(args.size, rng, file_path))
+        written[file_path] = (record['version'], time.perf_counter())
+        if args.fan_in_interval:
+            time.sleep(args.fan_in_interval)
+
+    # 轮询本地版本号，记录每个文件落地的时间
+    landed = {}
+    deadline = time.monotonic() + args.timeout
+    while len(landed) < len(written) and time.monotonic() < deadline:
+        now = time.perf_counter()
+        for file_path, (version, _) in written.items():
+            if file_path not in landed and device.version_manager.get_version(file_path) >= version:
+                landed[file_path] = now
+        time.sleep(0.005)
+    seconds = time.perf_counter() - started
+
+    batcher.stop()
+    device.client.disconnect_websocket()
+    remote_stats = batcher.get_stats()
+    device.close()
+    latencies = [landed[file_path] - written[file_path][1] for file_path in landed]
+    return dict({
+        'scenario': 'fan_in',
+        'files': args.fan_in,
+        'landed': len(landed),
+        'seconds': round(seconds, 4),
+        'notifications': remote_stats['notifications'],
+        'sync_batches': remote_stats['batches'],
+        'requests': server.state.stats['requests'] - requests_before
+    }, **percentiles(latencies))
+
+
+def bench_echo_pull(server, tmp, config, engine, args, rng) -> dict:
+    with server.state.lock:
+        for i in range(args.echo_files):
+            server.state.put_profile(f"memory/echo-{i:05d}.md", make_content(args.size, rng, f"echo {i}"))
+    device = Device(server, os.path.join(tmp, 'echo_pull'), config, engine)
+    queue = SyncQueue(
+        device.sync.push_files,
+        workers=config.get('sync_workers', 2),
+        batch_size=config.get('push_batch_size', 50),
+        batch_window=config.get('push_batch_window', 0.5)
+    )
+    queue.start()
+    debounce = config.get('watch_debounce', 1)
+    watcher = OpenClawMultiWatcher(
+        device.workspace,
+        ['memory/'],
+        lambda event_type, file_path, absolute_path=None: queue.submit(file_path),
+        debounce_seconds=debounce,
+        max_wait_seconds=config.get('watch_max_wait', 5),
+        suppress=device.echo.is_echo
+    )
+    watcher.start()
+
+    uploads_before = server.state.stats['uploads']
+    started = time.perf_counter()
+    summary = device.sync.pull_all()
+    seconds = time.perf_counter() - started
+
+    # 等待监听器把拉取产生的事件全部合并处理完，上传队列也空闲
+    time.sleep(debounce)
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        stats = queue.get_stats()
+        if watcher.coalescer.get_stats()['pending'] == 0 and stats['depth'] == 0 and stats['in_flight'] == 0:
+            break
+        time.sleep(0.05)
+    watcher.stop()
+    queue.stop()
+    echo = device.echo.get_stats()
+    queued = queue.get_stats()['submitted']
+    device.close()
+
+    uploads = server.state.stats['uploads'] - uploads_before
+    if summary['files'] != args.echo_files:
+        raise RuntimeError(f"echo_pull: pulled {summary['files']} of {args.echo_files} files")
+    if uploads:
+        raise RuntimeError(f"echo_pull: pulling into a watched workspace caused {uploads} uploads")
+    # 上传前的哈希比对也会跳过未变化的文件，这里单独确认事件在进入队列之前就被抑制
+    if queued:
+        raise RuntimeError(f"echo_pull: {queued} echo events reached the upload queue")
+    return {
+        'scenario': 'echo_pull',
+        'files': summary['files'],
+        'seconds': round(seconds, 4),
+        'suppressed': echo['suppressed'],
+        'queued': queued,
+        'uploads': uploads
+    }
+
+
+SCENARIOS = {
+    'cold_pull': bench_cold_pull,
+    'push': bench_push,
+    'push_large': bench_push_large,
+    'burst': bench_burst,
+    'fan_in': bench_fan_in,
+    'echo_pull': bench_echo_pull
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SoulSync sync pipeline benchmark')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated scenario names')
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads')
+    parser.add_argument('--files', type=int, default=200, help='files seeded for cold_pull')
+    parser.add_argument('--size', type=int, default=4096, help='bytes per generated file')
+    parser.add_argument('--large', type=int, default=2, help='large (streamed) files seeded for cold_pull')
+    parser.add_argument('--large-size', type=int, default=1024 * 1024,
+                        help='size of large files (cold_pull) and of the file pushed in push_large')
+    parser.add_argument('--push-ops', type=int, default=100)
+    parser.add_argument('--push-size', type=int, default=64 * 1024, help='size of the pushed MEMORY.md')
+    parser.add_argument('--burst', type=int, default=200, help='files written at once for burst')
+    parser.add_argument('--fan-in', type=int, default=100, help='remote changes for fan_in')
+    parser.add_argument('--fan-in-interval', type=float, default=0.0, help='seconds between remote changes')
+    parser.add_argument('--echo-files', type=int, default=1000, help='files pulled into the watched workspace for echo_pull')
+    parser.add_argument('--timeout', type=float, default=60.0, help='fan_in / echo_pull wait limit in seconds')
+    parser.add_argument('--config', help='config.json whose sync/http settings to use')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help='keep the plugin log output')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    # 测试不访问真实服务器，也不使用上传限流
+    config.pop('upload_limit', None)
+
+    engine = None
+    if args.engine == 'asyncio':
+        from async_client import AsyncEngine
+        engine = AsyncEngine()
+
+    rng = random.Random(args.seed)
+    tmp = tempfile.mkdtemp(prefix='soulsync-bench-')
+    results = []
+    log = io.StringIO()
+    try:
+        for name in [value.strip() for value in args.scenarios.split(',') if value.strip()]:
+            if name not in SCENARIOS:
+                parser.error(f"unknown scenario: {name}")
+            # 每个场景使用新的服务端，互不影响
+            with StubCloudServer() as server:
+                with contextlib.ExitStack() as stack:
+                    if not args.verbose:
+                        stack.enter_context(contextlib.redirect_stdout(log))
+                    results.append(SCENARIOS[name](server, tmp, config, engine, args, rng))
+    finally:
+        if engine is not None:
+            engine.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        'benchmark': 'sync',
+        'commit': commit_id(),
+        'engine': args.engine,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"SoulSync sync benchmark ({args.engine}, commit {report['commit']})")
+    for entry in results:
+        details = ', '.join(f"{key}={value}" for key, value in entry.items() if key != 'scenario')
+        print(f"{entry['scenario']:<10} {details}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,665 @@
+"""
+asyncio 客户端引擎
+
+与 OpenClawClient / ProfilesClient 接口相同，但所有网络操作都是协程，
+在一个事件循环上并发执行。需要安装 aiohttp，在 config.json 中设置
+"engine": "asyncio" 启用。
+"""
+
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from backoff import backoff_delay
+from client import OpenClawClient
+from fsutil import AtomicWriter
+from profiles import ProfilesClient
+from ratelimit import LIMITED_RETRY_STATUSES
+from resilience import ApiError, CircuitOpenError, RETRY_STATUSES
+from transport import Transport
+
+
+class AsyncResponse:
+    """已读取完毕的响应，提供与 requests.Response 相同的常用属性"""
+
+    def __init__(self, status_code: int, headers, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+def _request_sent(error: Exception) -> bool:
+    """请求是否可能已经发出（连接建立之后才失败）
+
+    aiohttp 3.10 起连接超时有单独的 ConnectionTimeoutError；更早的版本
+    无法与读取超时区分，按已发出处理（非幂等请求不重试）。
+    """
+    if isinstance(error, aiohttp.ClientConnectorError):
+        return False
+    connect_timeout = getattr(aiohttp, 'ConnectionTimeoutError', None)
+    return connect_timeout is None or not isinstance(error, connect_timeout)
+
+
+class ResilientStream:
+    """AsyncTransport.stream 返回的上下文管理器
+
+    进入时检查熔断，收到响应头或连接失败后把结果回报给熔断器；
+    网络错误和超时转为 ApiError。
+    """
+
+    def __init__(self, transport: 'AsyncTransport', url: str, headers: dict = None):
+        self.transport = transport
+        self.url = url
+        self.headers = dict(headers or {})
+        self.context = None
+
+    async def __aenter__(self):
+        resilience = self.transport.resilience
+        parsed = urlparse(self.url)
+        host = parsed.netloc
+        resilience.check(host, 'GET', parsed.path)
+        self.headers['Accept-Encoding'] = self.transport.accept_encoding()
+        timeout = aiohttp.ClientTimeout(sock_connect=resilience.connect_timeout,
+                                        sock_read=resilience.read_timeout)
+        try:
+            self.context = self.transport._get_session().get(self.url, headers=self.headers, timeout=timeout)
+            response = await self.context.__aenter__()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            resilience.record_error(host, isinstance(e, asyncio.TimeoutError))
+            raise ApiError(f"GET {parsed.path} failed: {str(e) or type(e).__name__}") from e
+        except BaseException:
+            resilience.release(host)
+            raise
+        resilience.record_response(host, response.status)
+        return response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self.context.__aexit__(exc_type, exc, tb)
+
+
+class AsyncTransport(Transport):
+    """基于 aiohttp 的传输层，压缩与统计逻辑与 Transport 相同"""
+
+    def _create_session(self):
+        # aiohttp 会话必须在事件循环内创建，首次请求时再建立
+        self.session = None
+
+    @staticmethod
+    def accept_encoding() -> str:
+        """aiohttp 自动解压 gzip/deflate"""
+        return 'gzip, deflate'
+
+    def _trace_config(self):
+        """统计建连次数和耗时"""
+        trace = aiohttp.TraceConfig()
+
+        async def on_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def on_end(session, context, params):
+            self._on_connect(time.perf_counter() - context.connect_started)
+
+        trace.on_connection_create_start.append(on_start)
+        trace.on_connection_create_end.append(on_end)
+        return trace
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_hosts * self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=self.idle_timeout
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[self._trace_config()]
+            )
+        return self.session
+
+    async def request(self, method: str, url: str, json_body=None, headers: dict = None,
+                      idempotent: bool = None, retry_statuses: frozenset = RETRY_STATUSES, **kwargs):
+        """发送请求，超时、重试与熔断规则与 Transport.request 相同
+
+        Returns:
+            AsyncResponse
+        """
+        parsed = urlparse(url)
+        host = parsed.netloc
+        policy = self.resilience.retry
+        idempotent = policy.is_idempotent(method, idempotent)
+        kwargs.setdefault('timeout', aiohttp.ClientTimeout(sock_connect=self.resilience.connect_timeout,
+                                                           sock_read=self.resilience.read_timeout))
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.resilience.check(host, method, parsed.path)
+            except CircuitOpenError as e:
+                e.sent = attempt > 1
+                raise
+            try:
+                response, response_wire, body, wire_body, encoding = await self._attempt_async(
+                    method, url, host, json_body, headers, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.resilience.record_error(host, isinstance(e, asyncio.TimeoutError))
+                delay = policy.error_delay(attempt, idempotent, _request_sent(e))
+                if delay is None:
+                    raise ApiError(f"{method} {parsed.path} failed: {str(e) or type(e).__name__}") from e
+            except BaseException:
+                self.resilience.release(host)
+                raise
+            else:
+                self.resilience.record_response(host, response.status_code)
+                delay = policy.response_delay(attempt, response, idempotent, retry_statuses)
+                if delay is None:
+                    break
+            self.resilience.count_retry()
+            await asyncio.sleep(delay)
+
+        self._learn_encodings(host, response)
+        self._count(body, wire_body, encoding, len(response.content), response_wire)
+        return response
+
+    async def _attempt_async(self, method: str, url: str, host: str, json_body, headers: dict, **kwargs):
+        headers, body, wire_body, encoding = self._prepare(host, json_body, headers)
+        response, response_wire = await self._send_async(method, url, wire_body, headers, **kwargs)
+
+        if encoding and response.status_code == 415:
+            self.server_encodings[host] = []
+            headers, body, wire_body, encoding = self._prepare(host, json_body, headers)
+            response, response_wire = await self._send_async(method, url, wire_body, headers, **kwargs)
+        return response, response_wire, body, wire_body, encoding
+
+    async def _send_async(self, method: str, url: str, data: bytes, headers: dict, **kwargs):
+        session = self._get_session()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            async with session.request(method, url, data=data, headers=headers, **kwargs) as response:
+                content = await response.read()
+                wire = int(response.headers.get('Content-Length') or len(content))
+                return AsyncResponse(response.status, response.headers, content), wire
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.last_used = time.monotonic()
+
+    def stream(self, url: str, headers: dict = None) -> 'ResilientStream':
+        """流式 GET（调用方用 async with 读取正文），带超时，熔断期间直接失败，不重试"""
+        return ResilientStream(self, url, headers)
+
+    async def get(self, url: str, headers: dict = None, **kwargs):
+        return await self.request('GET', url, headers=headers, **kwargs)
+
+    async def post(self, url: str, json=None, headers: dict = None, **kwargs):
+        return await self.request('POST', url, json_body=json, headers=headers, **kwargs)
+
+    async def close(self):
+        """关闭连接池"""
+        if self.session is not None:
+            await self.session.close()
+
+
+class AsyncOpenClawClient(OpenClawClient):
+    """OpenClawClient 的协程版本，设备 ID 和 token 的存储方式不变"""
+
+    async def authenticate(self, email: str = None, password: str = None) -> dict:
+        """认证：注册或登录"""
+        self.token = self._load_token()
+
+        if self.token:
+            try:
+                profile = await self.get_profile()
+                print(f"Using existing token, user: {profile.get('email', 'unknown')}")
+                return profile
+            except Exception as e:
+                print(f"Token invalid, re-authenticating: {e}")
+                self.token = None
+
+        if not email:
+            email = self.config.get('email', '')
+        if not password:
+            password = self.config.get('password', '')
+
+        if not email or not password:
+            raise ValueError("Email and password required for first-time authentication")
+
+        url = f"{self.cloud_url}/api/auth/device"
+        data = {
+            'device_id': self.device_id,
+            'email': email,
+            'password': password
+        }
+
+        response = await self.transport.post(url, json=data, headers={'Content-Type': 'application/json'},
+                                             idempotent=True)
+
+        if response.status_code in (200, 201):
+            result = response.json()
+            self.token = result.get('token')
+            self.user_id = result.get('user_id')
+            self._save_token(self.token)
+            print(f"{'Registered new user' if response.status_code == 201 else 'Logged in'}: {email}")
+            return result
+        else:
+            raise ApiError.from_response(response, "Authentication failed")
+
+    async def upload_memory(self, content: str) -> dict:
+        """上传记忆"""
+        url = f"{self.cloud_url}/api/memories"
+        response = await self.transport.post(url, json={'content': content}, headers=self._get_headers())
+
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 403:
+            raise ApiError.from_response(response, "Upload failed", 'Subscription required')
+        else:
+            raise ApiError.from_response(response, "Upload failed")
+
+    async def download_memory(self) -> dict:
+        """下载记忆"""
+        url = f"{self.cloud_url}/api/memories"
+        response = await self.transport.get(url, headers=self._get_headers())
+
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 404:
+            return {'content': '', 'version': 0}
+        else:
+            raise ApiError.from_response(response, "Download failed")
+
+    async def download_memory_to(self, dest_path: str, chunk_size: int = 65536) -> dict:
+        """流式下载记忆并原子写入 dest_path"""
+        url = f"{self.cloud_url}/api/memories/raw"
+        async with self.transport.stream(url, headers=self._get_headers()) as response:
+            if response.status == 200:
+                writer = AtomicWriter(dest_path)
+                with writer:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        writer.write(chunk)
+                    writer.commit()
+                wire = int(response.headers.get('Content-Length') or writer.size)
+                self.transport._count(None, None, None, writer.size, wire)
+                return {
+                    'version': int(response.headers.get('X-Memory-Version') or 0),
+                    'bytes': writer.size,
+                    'sha256': writer.sha256
+                }
+            elif response.status != 404:
+                content = await response.read()
+                raise ApiError.from_response(AsyncResponse(response.status, response.headers, content),
+                                             "Download failed")
+
+        result = await self.download_memory()
+        if not result.get('version'):
+            return {'version': 0, 'bytes': 0, 'sha256': None}
+        writer = AtomicWriter(dest_path)
+        with writer:
+            writer.write(result.get('content', '').encode('utf-8'))
+        return {'version': result['version'], 'bytes': writer.size, 'sha256': writer.sha256}
+
+    async def get_profile(self) -> dict:
+        """获取用户信息"""
+        url = f"{self.cloud_url}/api/memories/profile"
+        response = await self.transport.get(url, headers=self._get_headers())
+
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise ApiError.from_response(response, "Get profile failed")
+
+    async def reauthenticate(self):
+        """丢弃旧 token 后重新登录"""
+        self._discard_token()
+        self.ws_need_reauth = False
+        with self.ws_stats_lock:
+            self.ws_stats['reauths'] += 1
+        return await self.authenticate()
+
+    async def subscribe(self, on_message_callback, on_connected=None):
+        """订阅 WebSocket 消息，直到连接关闭
+
+        回调在默认线程池中执行，回调里的阻塞调用不会卡住事件循环。
+        aiohttp 每 ws_ping_interval 秒发送 ping，收不到 pong 时关闭连接。
+        """
+        ws_url = self.cloud_url.replace('http', 'ws') + '/ws'
+        loop = asyncio.get_running_loop()
+        session = self.transport._get_session()
+
+        async with session.ws_connect(ws_url, heartbeat=self.ws_ping_interval) as ws:
+            self.ws = ws
+            self.ws_authenticated = False
+            print("WebSocket connected")
+            if self.token:
+                await ws.send_str(json.dumps({'type': 'auth', 'token': self.token}))
+            self._ws_opened()
+            if on_connected:
+                loop.run_in_executor(None, self._run_on_connected, on_connected)
+
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(message.data)
+                except ValueError as e:
+                    print(f"WebSocket message error: {e}")
+                    continue
+                if self._ws_check_auth(data):
+                    await ws.close()
+                loop.run_in_executor(None, on_message_callback, data)
+
+            if isinstance(ws.exception(), asyncio.TimeoutError):
+                with self.ws_stats_lock:
+                    self.ws_stats['dead_peers'] += 1
+
+        self.ws = None
+        print("WebSocket closed")
+
+    async def connect_websocket(self, on_message_callback, on_connected=None):
+        """在事件循环上启动 WebSocket 订阅任务（断线后自动重连）"""
+        self.ws_stop.clear()
+        self.ws_disconnected_at = time.monotonic()
+        self.ws_thread = asyncio.ensure_future(self._subscribe_logged(on_message_callback, on_connected))
+
+    async def _subscribe_logged(self, on_message_callback, on_connected=None):
+        """订阅、等待断开、退避后重连，直到 disconnect_websocket"""
+        attempt = 0
+        while not self.ws_stop.is_set():
+            if self.ws_need_reauth:
+                try:
+                    await self.reauthenticate()
+                except Exception as e:
+                    print(f"WebSocket re-authentication failed: {e}")
+
+            started = time.monotonic()
+            try:
+                await self.subscribe(on_message_callback, on_connected)
+            except asyncio.CancelledError:
+                raise
+            except aiohttp.WSServerHandshakeError as e:
+                if e.status in (401, 403):
+                    self.ws_need_reauth = True
+                print(f"WebSocket error: {e}")
+            except Exception as e:
+                print(f"WebSocket error: {e}")
+            self.ws = None
+
+            attempt = self._ws_closed(started, attempt)
+            if self.ws_stop.is_set():
+                break
+            delay = backoff_delay(attempt, self.ws_backoff_base, self.ws_backoff_max)
+            attempt += 1
+            print(f"WebSocket reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def disconnect_websocket(self):
+        """断开 WebSocket 连接并停止重连"""
+        self.ws_stop.set()
+        if self.ws is not None:
+            await self.ws.close()
+            self.ws = None
+        if self.ws_thread is not None:
+            self.ws_thread.cancel()
+            self.ws_thread = None
+
+    async def close(self):
+        """关闭 WebSocket 连接"""
+        await self.disconnect_websocket()
+
+    async def send_ping(self):
+        """发送 ping 保持连接"""
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.send_str(json.dumps({'type': 'ping'}))
+
+
+class AsyncProfilesClient(ProfilesClient):
+    """ProfilesClient 的协程版本：请求构造和响应处理复用 ProfilesClient 的方法，这里只做网络 I/O"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 启用限流时，等待并发名额的协程在名额释放时被唤醒（在事件循环内首次使用时创建）
+        self.slot_released = None
+
+    async def get_profiles(self, path: str = None, inline_max: int = None) -> dict:
+        """获取 profiles"""
+        response = await self.transport.get(self._url('/api/profiles', path=path, inline_max=inline_max),
+                                            headers=self._get_headers())
+        return self._profiles_result(response)
+
+    async def download_profile_to(self, file_path: str, dest_path: str, chunk_size: int = 65536,
+                                  size: int = None) -> dict:
+        """流式下载单个 profile 并原子写入 dest_path（启用分块时先按块下载）"""
+        chunked = self._download_by_chunks(size)
+        if chunked:
+            result = await self._download_chunked(file_path, dest_path)
+            if result is not None:
+                return result
+
+        async with self.transport.stream(self._url('/api/profiles/raw', path=file_path),
+                                         headers=self._get_headers()) as response:
+            if response.status == 200:
+                writer = AtomicWriter(dest_path)
+                with writer:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        writer.write(chunk)
+                    st = writer.commit()
+                wire = int(response.headers.get('Content-Length') or writer.size)
+                self.transport._count(None, None, None, writer.size, wire)
+                return self._streamed(file_path, dest_path, writer, st, response.headers, chunked)
+            elif response.status != 404:
+                content = await response.read()
+                raise ApiError.from_response(AsyncResponse(response.status, response.headers, content),
+                                             "Download failed")
+
+        return self._write_downloaded(file_path, dest_path, (await self.get_profiles(file_path)).get('files', []))
+
+    async def upload_profile(self, file_path: str, content: str, version: int) -> dict:
+        """上传 profile（可分块或增量）"""
+        url = self._url('/api/profiles')
+        self.delta_stats['uploads'] += 1
+
+        deltas = self._build_deltas([(file_path, content, version)])
+        prepared = await self._prepare_chunked([(file_path, content, version)], deltas)
+        for body in self._upload_bodies(file_path, content, version, deltas, prepared):
+            response = await self._post_upload(url, body, [file_path])
+            result = self._upload_outcome(response, body, file_path, content, version, prepared)
+            if result is not None:
+                return result
+
+    async def _post_upload(self, url: str, body: dict, file_paths: list):
+        """发送上传请求，启用限流时先等待令牌和并发名额（不阻塞事件循环），按幂等请求重试"""
+        if self.limiter is None:
+            return await self.transport.post(url, json=body, headers=self._get_headers(), idempotent=True)
+        wait = self.limiter.delay(file_paths)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        if self.slot_released is None:
+            self.slot_released = asyncio.Condition()
+        async with self.slot_released:
+            await self.slot_released.wait_for(self.limiter.concurrency.try_acquire)
+        self.limiter.started()
+        started = time.monotonic()
+        response = None
+        rejected = False
+        try:
+            response = await self.transport.post(url, json=body, headers=self._get_headers(), idempotent=True,
+                                                 retry_statuses=LIMITED_RETRY_STATUSES)
+            return response
+        except CircuitOpenError as e:
+            rejected = not e.sent
+            raise
+        finally:
+            if rejected:
+                self.limiter.cancelled()
+            else:
+                self.limiter.finished(response, time.monotonic() - started)
+            async with self.slot_released:
+                self.slot_released.notify_all()
+
+    async def _prepare_chunked(self, entries: list, deltas: dict) -> dict:
+        """分块上传的准备：查询服务端缺少的块，补丁更小的文件改用增量，其余文件的缺失块先上传"""
+        plan = self._plan_chunked(entries, deltas)
+        if not plan:
+            return {}
+        chunks = {cid: chunk for _, _, _, pieces in plan.values() for cid, chunk in pieces}
+        missing = await self._find_missing_chunks(list(chunks))
+        if missing is None:
+            return {}
+        plan, needed = self._select_chunked(plan, deltas, set(missing))
+        await self._send_chunks(needed)
+        return self._chunked_items(plan, set(missing))
+
+    async def _find_missing_chunks(self, chunk_ids: list) -> list:
+        """查询服务端缺少的块；服务端不支持分块时返回 None"""
+        response = await self.transport.post(self._url('/api/chunks/missing'), json={'chunks': chunk_ids},
+                                             headers=self._get_headers(), idempotent=True)
+        return self._missing_chunks_result(response)
+
+    async def _send_chunks(self, chunks: dict):
+        """并发上传块，按 chunk_batch_bytes 分批"""
+        url = self._url('/api/chunks')
+
+        async def send(batch):
+            self._check_chunks_sent(await self._post_upload(url, self._chunks_body(batch), []))
+
+        await asyncio.gather(*(send(batch) for batch in self._chunk_batches(chunks)))
+
+    async def _fetch_chunks(self, chunk_ids: list) -> dict:
+        """并发下载块"""
+        url = self._url('/api/chunks/get')
+
+        async def fetch(ids):
+            response = await self.transport.post(url, json={'chunks': ids}, headers=self._get_headers(),
+                                                 idempotent=True)
+            return self._fetched_chunks(response)
+
+        chunks = {}
+        for part in await asyncio.gather(*(fetch(ids) for ids in self._fetch_batches(chunk_ids))):
+            chunks.update(part)
+        return chunks
+
+    async def _get_chunk_manifest(self, file_path: str) -> dict:
+        """获取文件的块列表；不存在或服务端不支持时返回 None"""
+        response = await self.transport.get(self._url('/api/profiles/chunks', path=file_path),
+                                            headers=self._get_headers())
+        return self._manifest_result(response)
+
+    async def _download_chunked(self, file_path: str, dest_path: str) -> dict:
+        """按块下载，本地已有的块不再下载"""
+        manifest = await self._get_chunk_manifest(file_path)
+        if manifest is None:
+            return None
+        missing = self._missing_local_chunks(manifest.get('chunks', []), dest_path)
+        fetched = await self._fetch_chunks(missing) if missing else {}
+        return self._assemble_chunks(file_path, dest_path, manifest, fetched)
+
+    async def upload_profiles_batch(self, entries: list, chunked: bool = True) -> dict:
+        """批量上传 profiles（一次请求），请求体和结果处理与同步版本相同
+
+        Returns:
+            {file_path: 成功结果、ConflictError 或 Exception}
+        """
+        if not entries:
+            return {}
+
+        deltas = self._build_deltas(entries)
+        prepared = await self._prepare_chunked(entries, deltas) if chunked else {}
+        items = self._batch_items(entries, prepared, deltas)
+
+        response = await self._post_upload(self._url('/api/profiles/batch'), {'files': items},
+                                           [item['file_path'] for item in items])
+
+        if self._batch_unsupported(response, entries):
+            return await self._upload_individually(entries)
+
+        results, retry = self._batch_results(entries, items, prepared, response)
+        if retry:
+            results.update(await self.upload_profiles_batch(retry, chunked=False))
+        return results
+
+    async def _upload_individually(self, entries: list) -> dict:
+        """在事件循环上并发执行单文件上传"""
+        outcomes = await asyncio.gather(
+            *(self.upload_profile(file_path, content, version) for file_path, content, version in entries),
+            return_exceptions=True
+        )
+        return {entry[0]: outcome for entry, outcome in zip(entries, outcomes)}
+
+    async def sync_profiles(self, since: str = '0') -> dict:
+        """增量同步 profiles"""
+        response = await self.transport.get(self._url('/api/profiles/sync', since=since), headers=self._get_headers())
+        return self._sync_result(response)
+
+
+class BlockingFacade:
+    """把异步客户端包装成阻塞接口，供线程中的同步逻辑（ProfileSync 等）调用"""
+
+    def __init__(self, engine: 'AsyncEngine', target):
+        self._engine = engine
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if asyncio.iscoroutinefunction(attr):
+            return lambda *args, **kwargs: self._engine.run(attr(*args, **kwargs))
+        return attr
+
+
+class AsyncEngine:
+    """在后台线程中运行的事件循环"""
+
+    def __init__(self):
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for the asyncio engine (pip install aiohttp)")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout: float = None):
+        """在事件循环上执行协程并等待结果（不可在循环线程内调用）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def facade(self, target) -> BlockingFacade:
+        return BlockingFacade(self, target)
+
+    def create_clients(self, config: dict, chunk_store=None, base_cache=None, limiter=None):
+        """创建异步传输层和两个客户端
+
+        Args:
+            config: 插件配置
+            chunk_store: 可选的本地块存储，启用分块去重
+            base_cache: 可选的已确认版本缓存
+            limiter: 可选的上传限流器
+
+        Returns:
+            (transport, client, profiles_client)，均为阻塞包装
+        """
+        transport = AsyncTransport.from_config(config)
+        client = AsyncOpenClawClient(config, transport)
+        profiles_client = AsyncProfilesClient(
+            config.get('cloud_url'),
+            delta_upload=config.get('delta_upload', True),
+            delta_max_ratio=config.get('delta_max_ratio', 0.5),
+            transport=transport,
+            chunk_store=chunk_store,
+            chunk_min_size=config.get('chunk_min_size', 65536),
+            base_cache=base_cache,
+            limiter=limiter
+        )
+        return self.facade(transport), self.facade(client), self.facade(profiles_client)
+
+    def stop(self):
+        """停止事件循环"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
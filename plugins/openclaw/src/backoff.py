@@ -0,0 +1,15 @@
+import random
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """指数退避加 full jitter 的等待时间
+
+    在 [0, min(cap, base * 2^attempt)] 内均匀取值，大量客户端同时断线时
+    重连不会集中在同一时刻。
+
+    Args:
+        attempt: 已连续失败的次数（从 0 开始）
+        base: 第一次重试的最大等待秒数
+        cap: 等待时间上限
+    """
+    return random.uniform(0, min(cap, base * (2 ** min(attempt, 32))))
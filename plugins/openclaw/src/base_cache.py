@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from chunking import ChunkStore
+
+
+class BaseCache:
+    """服务端已确认版本的本地缓存
+
+    每个路径保留最近 keep_versions 个版本 (version, sha256)，内容按 SHA-256
+    内容寻址存放（相同内容只存一份）。增量上传的基准、冲突合并的共同祖先和回滚
+    都从这里取，不需要访问网络。
+
+    root 为 None 时内容只保存在内存中；否则内容存于 root/objects（总大小超过
+    max_bytes 时按最近使用时间淘汰），索引存于 root/index.json。
+    save_interval > 0 时索引的修改在间隔到期后才合并写盘，需要落盘时调用 flush()。
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = 64 * 1024 * 1024, keep_versions: int = 4,
+                 max_entry_bytes: int = None, save_interval: float = 0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.keep_versions = max(1, keep_versions)
+        # 单个文件超过该大小时不缓存，避免一个文件挤掉所有其他基准
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self.save_interval = save_interval
+        self.lock = threading.RLock()
+        # file_path -> [(version, sha256), ...]，新版本在前
+        self.index = {}
+        self.dirty = False
+        self.save_timer = None
+        self.stats = {'puts': 0, 'hits': 0, 'misses': 0, 'skipped': 0}
+
+        if root:
+            self.index_file = os.path.join(root, 'index.json')
+            self.objects = ChunkStore(os.path.join(root, 'objects'), max_bytes=max_bytes)
+            self.blobs = None
+            self.load()
+        else:
+            self.index_file = None
+            self.objects = None
+            # sha256 -> bytes，按最近使用排序
+            self.blobs = OrderedDict()
+            self.blob_bytes = 0
+
+    def load(self):
+        """加载索引文件"""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.index = {path: [tuple(entry) for entry in entries] for path, entries in data.items()}
+        except Exception as e:
+            print(f"Failed to load base cache index: {e}")
+            self.index = {}
+
+    def _save(self):
+        self.dirty = False
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_file = self.index_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            print(f"Failed to save base cache index: {e}")
+
+    def _schedule_save(self):
+        if not self.index_file:
+            return
+        if not self.save_interval:
+            self._save()
+            return
+        self.dirty = True
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_interval, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        """立即写入尚未保存的索引修改"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            if self.dirty:
+                self._save()
+
+    def _read_blob(self, sha256: str) -> bytes:
+        if self.objects is not None:
+            return self.objects.get(sha256)
+        data = self.blobs.get(sha256)
+        if data is not None:
+            self.blobs.move_to_end(sha256)
+        return data
+
+    def _write_blob(self, sha256: str, data: bytes):
+        if self.objects is not None:
+            self.objects.put(sha256, data)
+            return
+        if sha256 in self.blobs:
+            self.blobs.move_to_end(sha256)
+            return
+        self.blobs[sha256] = data
+        self.blob_bytes += len(data)
+        while self.blob_bytes > self.max_bytes and len(self.blobs) > 1:
+            _, evicted = self.blobs.popitem(last=False)
+            self.blob_bytes -= len(evicted)
+
+    def put(self, file_path: str, version: int, content: str):
+        """记录服务端确认的一个版本
+
+        Args:
+            file_path: 相对路径
+            version: 服务端版本号
+            content: 该版本的内容
+        """
+        if version is None:
+            return
+        data = content.encode('utf-8')
+        if len(data) > self.max_entry_bytes:
+            with self.lock:
+                self.stats['skipped'] += 1
+                self._remove_version(file_path, version)
+            return
+        sha256 = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self._write_blob(sha256, data)
+            entries = [entry for entry in self.index.get(file_path, []) if entry[0] != version]
+            entries.insert(0, (version, sha256))
+            entries.sort(key=lambda entry: entry[0], reverse=True)
+            self.index[file_path] = entries[:self.keep_versions]
+            self.stats['puts'] += 1
+            self._schedule_save()
+
+    def put_file(self, file_path: str, version: int, absolute_path: str):
+        """从本地文件记录一个版本（流式下载后调用），文件过大时跳过"""
+        try:
+            if os.path.getsize(absolute_path) > self.max_entry_bytes:
+                with self.lock:
+                    self.stats['skipped'] += 1
+                    self._remove_version(file_path, version)
+                return
+            with open(absolute_path, 'rb') as f:
+                content = f.read().decode('utf-8')
+        except (OSError, UnicodeDecodeError):
+            return
+        self.put(file_path, version, content)
+
+    def get(self, file_path: str, version: int = None):
+        """获取缓存的版本
+
+        Args:
+            file_path: 相对路径
+            version: 版本号，默认为缓存中最新的版本
+
+        Returns:
+            (version, content)；没有缓存或内容已被淘汰时返回 None
+        """
+        with self.lock:
+            entries = self.index.get(file_path, [])
+            entry = entries[0] if version is None and entries else None
+            for candidate in entries:
+                if candidate[0] == version:
+                    entry = candidate
+                    break
+            data = self._read_blob(entry[1]) if entry else None
+            if data is None:
+                if entry:
+                    self._remove_version(file_path, entry[0])
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+        return entry[0], data.decode('utf-8')
+
+    def versions(self, file_path: str) -> list:
+        """缓存中该路径的版本号，新版本在前"""
+        with self.lock:
+            return [entry[0] for entry in self.index.get(file_path, [])]
+
+    def discard(self, file_path: str, version: int = None):
+        """删除某个版本（默认删除该路径的所有版本）的索引"""
+        with self.lock:
+            if version is None:
+                if self.index.pop(file_path, None) is not None:
+                    self._schedule_save()
+            else:
+                self._remove_version(file_path, version)
+
+    def _remove_version(self, file_path: str, version: int):
+        """删除一个版本的索引（调用方持有锁）"""
+        entries = self.index.get(file_path)
+        if not entries:
+            return
+        remaining = [entry for entry in entries if entry[0] != version]
+        if len(remaining) == len(entries):
+            return
+        if remaining:
+            self.index[file_path] = remaining
+        else:
+            del self.index[file_path]
+        self._schedule_save()
+
+    def get_stats(self) -> dict:
+        """获取缓存统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['paths'] = len(self.index)
+            stats['versions'] = sum(len(entries) for entries in self.index.values())
+            if self.objects is not None:
+                stats['evicted'] = self.objects.stats['evicted']
+            else:
+                stats['bytes'] = self.blob_bytes
+            return stats
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import threading
+
+from fsutil import atomic_write_bytes
+
+
+def _gear_table() -> list:
+    """gear 哈希表：256 个固定的 64 位随机数（客户端与服务端必须一致）"""
+    return [
+        int.from_bytes(hashlib.sha256(b'soulsync-gear-%d' % i).digest()[:8], 'little')
+        for i in range(256)
+    ]
+
+
+GEAR = _gear_table()
+MASK64 = (1 << 64) - 1
+
+# 默认的最小块长度（文件末尾的最后一块可能更短）
+MIN_CHUNK_SIZE = 4096
+
+
+def chunk_boundaries(data: bytes, min_size: int = MIN_CHUNK_SIZE, avg_size: int = 16384, max_size: int = 65536) -> list:
+    """内容定义分块（FastCDC 风格的 gear 滚动哈希）
+
+    切点只取决于附近的内容，文件中间插入或删除内容时，只有附近的块会变化，
+    其余块的哈希保持不变。块长度在 [min_size, max_size] 之间，平均约 avg_size。
+
+    Returns:
+        [(offset, length), ...]
+    """
+    bits = max(avg_size.bit_length() - 1, 4)
+    # 归一化分块：未到平均长度时用更严格的掩码，超过后用更宽松的掩码
+    mask_strict = ((1 << (bits + 2)) - 1) << (64 - bits - 2)
+    mask_loose = ((1 << (bits - 2)) - 1) << (64 - bits + 2)
+
+    boundaries = []
+    n = len(data)
+    start = 0
+    while start < n:
+        remaining = n - start
+        if remaining <= min_size:
+            boundaries.append((start, remaining))
+            break
+
+        end = start + min(remaining, max_size)
+        normal = start + min(remaining, avg_size)
+        i = start + min_size
+        h = 0
+        cut = end
+        while i < normal:
+            h = ((h << 1) + GEAR[data[i]]) & MASK64
+            i += 1
+            if not h & mask_strict:
+                cut = i
+                break
+        else:
+            while i < end:
+                h = ((h << 1) + GEAR[data[i]]) & MASK64
+                i += 1
+                if not h & mask_loose:
+                    cut = i
+                    break
+
+        boundaries.append((start, cut - start))
+        start = cut
+    return boundaries
+
+
+def chunk_id(chunk: bytes) -> str:
+    """块的 ID（内容的 SHA-256）"""
+    return hashlib.sha256(chunk).hexdigest()
+
+
+def split_chunks(data: bytes, min_size: int = MIN_CHUNK_SIZE, avg_size: int = 16384, max_size: int = 65536) -> list:
+    """分块并计算每块的 ID
+
+    Returns:
+        [(chunk_id, chunk_bytes), ...]，按在文件中的顺序
+    """
+    return [
+        (chunk_id(data[offset:offset + length]), data[offset:offset + length])
+        for offset, length in chunk_boundaries(data, min_size, avg_size, max_size)
+    ]
+
+
+class ChunkStore:
+    """本地块存储
+
+    每个块按 ID 存为 root/ab/abcdef... 一个文件（原子写入）。总大小超过
+    max_bytes 时按最近使用时间淘汰，直到低于上限的 80%。
+    """
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        self.stats = {'puts': 0, 'hits': 0, 'misses': 0, 'evicted': 0}
+
+    def _path(self, chunk_id: str) -> str:
+        return os.path.join(self.root, chunk_id[:2], chunk_id)
+
+    def has(self, chunk_id: str) -> bool:
+        """本地是否有该块"""
+        return os.path.exists(self._path(chunk_id))
+
+    def get(self, chunk_id: str) -> bytes:
+        """读取块；不存在或内容损坏时返回 None"""
+        path = self._path(chunk_id)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.stats['misses'] += 1
+            return None
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            self.stats['misses'] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats['hits'] += 1
+        return data
+
+    def put(self, chunk_id: str, data: bytes):
+        """保存块（已存在时只刷新使用时间）"""
+        path = self._path(chunk_id)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return
+        atomic_write_bytes(path, data)
+        self.stats['puts'] += 1
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self._scan_size()
+            else:
+                self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan_size(self) -> int:
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return total
+
+    def _evict(self):
+        """按最近使用时间淘汰（调用方持有锁）"""
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.8
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats['evicted'] += 1
+        self.total_bytes = total
@@ -1,21 +1,49 @@
 import json
 import os
+import threading
+import time
 import uuid
-import requests
 import websocket
 
+from backoff import backoff_delay
+from fsutil import AtomicWriter, atomic_write_bytes
+from resilience import ApiError
+from transport import Transport
+
 
 class OpenClawClient:
     """OpenClaw 插件的 API/WS 客户端"""
     
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, transport: Transport = None):
         self.config = config
+        self.transport = transport or Transport.from_config(config)
         self.cloud_url = config.get('cloud_url', '').rstrip('/')
         self.token = None
         self.user_id = None
         self.device_id = self._load_or_generate_device_id()
         self.ws = None
         self.ws_thread = None
+        # WebSocket 断线重连与心跳
+        self.ws_ping_interval = config.get('ws_ping_interval', 30)
+        self.ws_ping_timeout = config.get('ws_ping_timeout', 10)
+        self.ws_backoff_base = config.get('ws_backoff_base', 1.0)
+        self.ws_backoff_max = config.get('ws_backoff_max', 60.0)
+        self.ws_stable_seconds = config.get('ws_stable_seconds', 30)
+        self.ws_stop = threading.Event()
+        self.ws_authenticated = False
+        self.ws_need_reauth = False
+        self.ws_connected = False
+        self.ws_disconnected_at = None
+        self.ws_stats_lock = threading.Lock()
+        self.ws_stats = {
+            'connects': 0,
+            'reconnects': 0,
+            'disconnects': 0,
+            'failed_attempts': 0,
+            'dead_peers': 0,
+            'reauths': 0,
+            'disconnected_seconds': 0.0
+        }
     
     def _load_or_generate_device_id(self) -> str:
         """加载或生成设备ID"""
@@ -41,6 +69,14 @@ class OpenClawClient:
             f.write(token)
         self.token = token
     
+    def _discard_token(self):
+        """丢弃当前 token（服务端拒绝时），下次认证重新登录"""
+        plugin_dir = os.path.dirname(os.path.dirname(__file__))
+        token_file = os.path.join(plugin_dir, 'token')
+        if os.path.exists(token_file):
+            os.remove(token_file)
+        self.token = None
+    
     def _load_token(self) -> str:
         """加载 token"""
         plugin_dir = os.path.dirname(os.path.dirname(__file__))
@@ -95,7 +131,9 @@ class OpenClawClient:
             'password': password
         }
         
-        response = requests.post(url, json=data, headers={'Content-Type': 'application/json'})
+        # 重发注册请求只会变成登录，可以安全重试
+        response = self.transport.post(url, json=data, headers={'Content-Type': 'application/json'},
+                                       idempotent=True)
         
         if response.status_code == 201:
             result = response.json()
@@ -112,8 +150,7 @@ class OpenClawClient:
             print(f"Logged in: {email}")
             return result
         else:
-            error = response.json().get('error', 'Unknown error')
-            raise Exception(f"Authentication failed: {error}")
+            raise ApiError.from_response(response, "Authentication failed")
     
     def upload_memory(self, content: str) -> dict:
         """上传记忆
@@ -127,16 +164,14 @@ class OpenClawClient:
         url = f"{self.cloud_url}/api/memories"
         data = {'content': content}
         
-        response = requests.post(url, json=data, headers=self._get_headers())
+        response = self.transport.post(url, json=data, headers=self._get_headers())
         
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 403:
-            error = response.json().get('error', 'Subscription required')
-            raise Exception(f"Upload failed: {error}")
+            raise ApiError.from_response(response, "Upload failed", 'Subscription required')
         else:
-            error = response.json().get('error', 'Unknown error')
-            raise Exception(f"Upload failed: {error}")
+            raise ApiError.from_response(response, "Upload failed")
     
     def download_memory(self) -> dict:
         """下载记忆
@@ -146,15 +181,53 @@ class OpenClawClient:
         """
         url = f"{self.cloud_url}/api/memories"
         
-        response = requests.get(url, headers=self._get_headers())
+        response = self.transport.get(url, headers=self._get_headers())
         
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 404:
             return {'content': '', 'version': 0}
         else:
-            error = response.json().get('error', 'Unknown error')
-            raise Exception(f"Download failed: {error}")
+            raise ApiError.from_response(response, "Download failed")
+    
+    def download_memory_to(self, dest_path: str, chunk_size: int = 65536) -> dict:
+        """流式下载记忆并原子写入 dest_path
+        
+        服务端没有 raw 接口时退回 JSON 下载。
+        
+        Args:
+            dest_path: 本地目标路径
+            chunk_size: 每次读取的字节数
+            
+        Returns:
+            包含 version, bytes, sha256 的字典
+        """
+        url = f"{self.cloud_url}/api/memories/raw"
+        
+        response = self.transport.get(url, headers=self._get_headers(), stream=True)
+        
+        with response:
+            if response.status_code == 200:
+                writer = AtomicWriter(dest_path)
+                with writer:
+                    for chunk in response.iter_content(chunk_size):
+                        writer.write(chunk)
+                    writer.commit()
+                self.transport.record_stream(response, writer.size)
+                return {
+                    'version': int(response.headers.get('X-Memory-Version') or 0),
+                    'bytes': writer.size,
+                    'sha256': writer.sha256
+                }
+            elif response.status_code != 404:
+                raise ApiError.from_response(response, "Download failed")
+        
+        result = self.download_memory()
+        if not result.get('version'):
+            return {'version': 0, 'bytes': 0, 'sha256': None}
+        data = result.get('content', '').encode('utf-8')
+        st, sha256 = atomic_write_bytes(dest_path, data)
+        return {'version': result.get('version', 0), 'bytes': len(data), 'sha256': sha256}
     
     def get_profile(self) -> dict:
         """获取用户信息
@@ -164,30 +237,54 @@ class OpenClawClient:
         """
         url = f"{self.cloud_url}/api/memories/profile"
         
-        response = requests.get(url, headers=self._get_headers())
+        response = self.transport.get(url, headers=self._get_headers())
         
         if response.status_code == 200:
             return response.json()
         else:
-            error = response.json().get('error', 'Unknown error')
-            raise Exception(f"Get profile failed: {error}")
+            raise ApiError.from_response(response, "Get profile failed")
     
-    def connect_websocket(self, on_message_callback):
-        """连接 WebSocket
+    def connect_websocket(self, on_message_callback, on_connected=None):
+        """连接 WebSocket，并在后台保持连接
+        
+        断线后按指数退避（带 jitter）自动重连；每 ws_ping_interval 秒发送 ping，
+        ws_ping_timeout 秒内收不到 pong 视为对端失联并重连；服务端拒绝认证时
+        先重新登录再重连。每次连上后在单独线程中调用 on_connected，
+        用于补齐断线期间错过的变化。
         
         Args:
             on_message_callback: 消息回调函数
+            on_connected: 可选，每次连接建立后的回调
         """
+        self.ws_stop.clear()
+        self.ws_disconnected_at = time.monotonic()
+        self.ws_thread = threading.Thread(
+            target=self._ws_supervise,
+            args=(on_message_callback, on_connected),
+            daemon=True
+        )
+        self.ws_thread.start()
+    
+    def _ws_supervise(self, on_message_callback, on_connected):
+        """连接、等待断开、退避后重连，直到 disconnect_websocket"""
         ws_url = self.cloud_url.replace('http', 'ws') + '/ws'
+        attempt = 0
         
         def on_ws_message(ws, message):
             try:
                 data = json.loads(message)
+            except ValueError as e:
+                print(f"WebSocket message error: {e}")
+                return
+            if self._ws_check_auth(data):
+                ws.close()
+            try:
                 on_message_callback(data)
             except Exception as e:
                 print(f"WebSocket message error: {e}")
         
         def on_ws_error(ws, error):
+            self._ws_record_error(error)
             print(f"WebSocket error: {error}")
         
         def on_ws_close(ws, close_status_code, close_msg):
@@ -197,26 +294,124 @@ class OpenClawClient:
             print("WebSocket connected")
             if self.token:
                 ws.send(json.dumps({'type': 'auth', 'token': self.token}))
+            self._ws_opened(on_connected)
         
-        self.ws = websocket.WebSocketApp(
-            ws_url,
-            on_message=on_ws_message,
-            on_error=on_ws_error,
-            on_close=on_ws_close,
-            on_open=on_ws_open
-        )
-        
-        self.ws.on_pong = lambda ws, data: None
+        while not self.ws_stop.is_set():
+            if self.ws_need_reauth:
+                try:
+                    self.reauthenticate()
+                except Exception as e:
+                    print(f"WebSocket re-authentication failed: {e}")
+            
+            started = time.monotonic()
+            self.ws_authenticated = False
+            self.ws = websocket.WebSocketApp(
+                ws_url,
+                on_message=on_ws_message,
+                on_error=on_ws_error,
+                on_close=on_ws_close,
+                on_open=on_ws_open
+            )
+            self.ws.on_pong = lambda ws, data: None
+            try:
+                self.ws.run_forever(ping_interval=self.ws_ping_interval, ping_timeout=self.ws_ping_timeout)
+            except Exception as e:
+                print(f"WebSocket error: {e}")
+            
+            attempt = self._ws_closed(started, attempt)
+            if self.ws_stop.is_set():
+                break
+            delay = backoff_delay(attempt, self.ws_backoff_base, self.ws_backoff_max)
+            attempt += 1
+            print(f"WebSocket reconnecting in {delay:.1f}s")
+            self.ws_stop.wait(delay)
+    
+    def reauthenticate(self):
+        """丢弃旧 token 后重新登录"""
+        self._discard_token()
+        self.ws_need_reauth = False
+        with self.ws_stats_lock:
+            self.ws_stats['reauths'] += 1
+        return self.authenticate()
+    
+    def _ws_check_auth(self, data: dict) -> bool:
+        """检查认证结果；认证前收到 error 视为 token 被拒绝，返回 True"""
+        if data.get('type') == 'authenticated':
+            self.ws_authenticated = True
+        elif data.get('type') == 'error' and self.token and not self.ws_authenticated:
+            self.ws_need_reauth = True
+            return True
+        return False
+    
+    def _ws_record_error(self, error):
+        """记录连接错误：ping 超时计为对端失联，握手 401/403 需要重新登录"""
+        if isinstance(error, websocket.WebSocketTimeoutException):
+            with self.ws_stats_lock:
+                self.ws_stats['dead_peers'] += 1
+        elif getattr(error, 'status_code', None) in (401, 403):
+            self.ws_need_reauth = True
+    
+    def _ws_opened(self, on_connected=None):
+        """连接建立：更新统计，并在单独线程中执行 on_connected"""
+        with self.ws_stats_lock:
+            if self.ws_stats['connects']:
+                self.ws_stats['reconnects'] += 1
+            self.ws_stats['connects'] += 1
+            self.ws_connected = True
+            if self.ws_disconnected_at is not None:
+                self.ws_stats['disconnected_seconds'] += time.monotonic() - self.ws_disconnected_at
+                self.ws_disconnected_at = None
+        if on_connected:
+            threading.Thread(target=self._run_on_connected, args=(on_connected,), daemon=True).start()
+    
+    @staticmethod
+    def _run_on_connected(on_connected):
+        try:
+            on_connected()
+        except Exception as e:
+            print(f"WebSocket catch-up error: {e}")
+    
+    def _ws_closed(self, started: float, attempt: int) -> int:
+        """连接结束：更新统计
         
-        import threading
-        self.ws_thread = threading.Thread(target=self.ws.run_forever, daemon=True)
-        self.ws_thread.start()
+        Returns:
+            下一次退避使用的失败次数（连接稳定保持过 ws_stable_seconds 时清零）
+        """
+        now = time.monotonic()
+        with self.ws_stats_lock:
+            if self.ws_connected:
+                self.ws_connected = False
+                self.ws_stats['disconnects'] += 1
+                self.ws_disconnected_at = now
+                if now - started >= self.ws_stable_seconds:
+                    return 0
+            else:
+                self.ws_stats['failed_attempts'] += 1
+        return attempt
+    
+    def get_ws_stats(self) -> dict:
+        """WebSocket 连接统计（重连次数、累计断线时长等）"""
+        with self.ws_stats_lock:
+            stats = dict(self.ws_stats)
+            stats['connected'] = self.ws_connected
+            if not self.ws_connected and self.ws_disconnected_at is not None:
+                stats['disconnected_seconds'] += time.monotonic() - self.ws_disconnected_at
+        stats['disconnected_seconds'] = round(stats['disconnected_seconds'], 3)
+        return stats
     
     def disconnect_websocket(self):
-        """断开 WebSocket 连接"""
+        """断开 WebSocket 连接并停止重连"""
+        self.ws_stop.set()
         if self.ws:
             self.ws.close()
-            self.ws = None
+        if self.ws_thread and self.ws_thread is not threading.current_thread():
+            self.ws_thread.join(5)
+        self.ws = None
+        self.ws_thread = None
+    
+    def close(self):
+        """关闭 WebSocket 连接（连接池由插件统一关闭）"""
+        self.disconnect_websocket()
     
     def send_ping(self):
         """发送 ping 保持连接"""
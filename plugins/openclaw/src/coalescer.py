@@ -0,0 +1,167 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+
+# (之前的事件, 新事件) -> 合并后的净事件；None 表示两者抵消
+MERGE_RULES = {
+    ('created', 'modified'): 'created',
+    ('created', 'deleted'): None,
+    ('modified', 'created'): 'modified',
+    ('modified', 'deleted'): 'deleted',
+    ('deleted', 'created'): 'modified',
+    ('deleted', 'modified'): 'modified',
+}
+
+
+def merge_events(previous: str, new: str):
+    """合并同一路径上的两个事件"""
+    if previous == new:
+        return new
+    return MERGE_RULES.get((previous, new), new)
+
+
+class EventCoalescer:
+    """文件事件合并器
+
+    每个路径做 trailing-edge 防抖：最后一次事件后静默 quiet 秒才发出，
+    连续写入时最多等待 max_wait 秒。同一路径的 created/modified/deleted
+    序列合并为一个净事件。待发路径数超过 max_pending 时，最久未更新的
+    路径立即发出，内存占用有上限。
+    """
+
+    def __init__(self, emit, quiet: float = 1.0, max_wait: float = 5.0, max_pending: int = 10000):
+        self.emit = emit
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        # path -> [event_type, absolute_path, first_at, last_at]，按最近更新排序
+        self.pending = OrderedDict()
+        # (max_wait 截止时间, path, first_at)，过期条目惰性丢弃
+        self.deadlines = []
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.stats = {
+            'events_in': 0,
+            'events_out': 0,
+            'merged': 0,
+            'cancelled': 0,
+            'overflow_flushes': 0
+        }
+
+    def start(self):
+        """启动后台线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止并立即发出所有待发事件"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join()
+
+    def add(self, event_type: str, relative_path: str, absolute_path: str = None):
+        """加入一个原始事件"""
+        overflow = []
+        now = time.monotonic()
+        with self.cond:
+            self.stats['events_in'] += 1
+            entry = self.pending.get(relative_path)
+            if entry is None:
+                self.pending[relative_path] = [event_type, absolute_path, now, now]
+                heapq.heappush(self.deadlines, (now + self.max_wait, relative_path, now))
+            else:
+                self.stats['merged'] += 1
+                merged = merge_events(entry[0], event_type)
+                if merged is None:
+                    # 创建后又删除：什么都不用同步
+                    del self.pending[relative_path]
+                    self.stats['cancelled'] += 1
+                else:
+                    entry[0] = merged
+                    entry[1] = absolute_path or entry[1]
+                    entry[3] = now
+                    self.pending.move_to_end(relative_path)
+
+            while len(self.pending) > self.max_pending:
+                path, entry = self.pending.popitem(last=False)
+                overflow.append((path, entry))
+                self.stats['overflow_flushes'] += 1
+            self.cond.notify_all()
+
+        for path, entry in overflow:
+            self._emit(path, entry)
+
+    def _due(self, now: float) -> list:
+        """取出已到期的事件（调用方持有锁）"""
+        due = []
+        # pending 按最近更新排序，静默期到期的一定在最前面
+        while self.pending:
+            path, entry = next(iter(self.pending.items()))
+            if entry[3] + self.quiet > now:
+                break
+            self.pending.popitem(last=False)
+            due.append((path, entry))
+
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, path, first_at = heapq.heappop(self.deadlines)
+            entry = self.pending.get(path)
+            if entry is not None and entry[2] == first_at:
+                del self.pending[path]
+                due.append((path, entry))
+        return due
+
+    def _next_wakeup(self, now: float) -> float:
+        """距下一个到期事件的秒数（调用方持有锁）"""
+        candidates = []
+        if self.pending:
+            entry = next(iter(self.pending.values()))
+            candidates.append(entry[3] + self.quiet)
+        while self.deadlines:
+            deadline, path, first_at = self.deadlines[0]
+            entry = self.pending.get(path)
+            if entry is not None and entry[2] == first_at:
+                candidates.append(deadline)
+                break
+            heapq.heappop(self.deadlines)
+        if not candidates:
+            return None
+        return max(min(candidates) - now, 0)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                now = time.monotonic()
+                if not self.running:
+                    due = list(self.pending.items())
+                    self.pending.clear()
+                    self.deadlines = []
+                else:
+                    due = self._due(now)
+                    if not due:
+                        self.cond.wait(self._next_wakeup(now))
+                        continue
+
+            for path, entry in due:
+                self._emit(path, entry)
+            if not self.running:
+                return
+
+    def _emit(self, relative_path: str, entry: list):
+        self.stats['events_out'] += 1
+        try:
+            self.emit(entry[0], relative_path, entry[1])
+        except Exception as e:
+            print(f"[Watcher] Callback error on {relative_path}: {e}")
+
+    def get_stats(self) -> dict:
+        """获取合并统计"""
+        with self.cond:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.pending)
+            return stats
@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+
+
+class SyncCursor:
+    """增量同步游标
+
+    保存 /api/profiles/sync 返回的 server_time，下次只获取此后变化的文件。
+    游标与服务器地址和账号绑定（scope），切换服务器或账号后视为丢失，
+    需要做一次全量同步。
+    """
+
+    def __init__(self, cursor_file: str, scope: str = ''):
+        self.cursor_file = cursor_file
+        self.scope = scope
+        self.cursor = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """加载游标文件"""
+        self.cursor = None
+        if not os.path.exists(self.cursor_file):
+            return
+        try:
+            with open(self.cursor_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('scope') == self.scope and data.get('cursor'):
+                self.cursor = str(data['cursor'])
+        except Exception as e:
+            print(f"Failed to load sync cursor: {e}")
+
+    def get(self) -> str:
+        """当前游标；没有游标时返回 None"""
+        return self.cursor
+
+    def set(self, cursor: str):
+        """保存新游标（先写临时文件再替换）"""
+        if not cursor:
+            return
+        with self.lock:
+            self.cursor = str(cursor)
+            try:
+                directory = os.path.dirname(self.cursor_file)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory, exist_ok=True)
+
+                tmp_file = self.cursor_file + '.tmp'
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump({'cursor': self.cursor, 'scope': self.scope}, f)
+                os.replace(tmp_file, self.cursor_file)
+            except Exception as e:
+                print(f"Failed to save sync cursor: {e}")
+
+    def clear(self):
+        """丢弃游标，下次同步为全量同步"""
+        with self.lock:
+            self.cursor = None
+            try:
+                os.remove(self.cursor_file)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Failed to remove sync cursor: {e}")
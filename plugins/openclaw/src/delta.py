@@ -0,0 +1,88 @@
+"""
+行级增量补丁
+
+补丁格式为 [[start, end, text], ...]：把基准内容的第 start..end 行
+（不含 end）替换为 text。所有操作按 start 递增排列，可直接 JSON 序列化。
+"""
+
+import hashlib
+import json
+from difflib import SequenceMatcher
+
+
+class PatchError(Exception):
+    """补丁无法应用到基准内容"""
+
+
+def _split(content: str) -> list:
+    return content.splitlines(keepends=True)
+
+
+def make_patch(base: str, new: str) -> list:
+    """生成从 base 到 new 的行级补丁
+
+    先剥离公共前缀/后缀，追加写入这类常见修改只需线性时间。
+    """
+    a = _split(base)
+    b = _split(new)
+
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]:
+        suffix += 1
+
+    a_mid = a[prefix:len(a) - suffix]
+    b_mid = b[prefix:len(b) - suffix]
+
+    if not a_mid or not b_mid:
+        if not a_mid and not b_mid:
+            return []
+        return [[prefix, prefix + len(a_mid), ''.join(b_mid)]]
+
+    ops = []
+    matcher = SequenceMatcher(None, a_mid, b_mid, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        ops.append([prefix + i1, prefix + i2, ''.join(b_mid[j1:j2])])
+    return ops
+
+
+def apply_patch(base: str, patch: list) -> str:
+    """把补丁应用到 base 上
+
+    Raises:
+        PatchError: 补丁与基准内容不匹配
+    """
+    lines = _split(base)
+    out = []
+    pos = 0
+    for op in patch:
+        try:
+            start, end, text = op
+        except (TypeError, ValueError):
+            raise PatchError(f"Malformed patch op: {op!r}")
+        if not isinstance(start, int) or not isinstance(end, int) or not isinstance(text, str):
+            raise PatchError(f"Malformed patch op: {op!r}")
+        if start < pos or end < start or end > len(lines):
+            raise PatchError(f"Patch op out of range: [{start}, {end}) with {len(lines)} lines")
+        out.extend(lines[pos:start])
+        out.append(text)
+        pos = end
+    out.extend(lines[pos:])
+    return ''.join(out)
+
+
+def patch_size(patch: list) -> int:
+    """补丁序列化后的字节数"""
+    return len(json.dumps(patch, ensure_ascii=False).encode('utf-8'))
+
+
+def content_digest(content: str) -> str:
+    """内容的 SHA-256，用于服务端校验补丁结果"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class EchoRegistry:
+    """本地回声抑制
+
+    同步层从云端写入文件后登记 (路径, 内容哈希, 写入后的 size/mtime/inode)。
+    监听器随后收到的该文件事件，如果文件的 stat 仍与登记一致，就是我们自己的
+    写入产生的回声，直接丢弃，不进入上传队列。文件在登记后又被修改时 stat
+    不再一致，登记作废，事件照常处理。登记在 ttl 秒后过期。
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        # path -> (expires_at, size, mtime_ns, ino, sha256)，按登记时间排序
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            'registered': 0,
+            'suppressed': 0,
+            'stale': 0,
+            'expired': 0
+        }
+
+    def expect(self, relative_path: str, st: os.stat_result, sha256: str):
+        """登记一次自己的写入
+
+        Args:
+            relative_path: 相对路径
+            st: 写入完成后文件的 stat
+            sha256: 写入内容的哈希
+        """
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            self.entries.pop(relative_path, None)
+            self.entries[relative_path] = (now + self.ttl, st.st_size, st.st_mtime_ns, st.st_ino, sha256)
+            self.stats['registered'] += 1
+
+    def _expire(self, now: float):
+        """删除过期的登记（调用方持有锁）"""
+        while self.entries:
+            path, entry = next(iter(self.entries.items()))
+            if entry[0] > now:
+                break
+            del self.entries[path]
+            self.stats['expired'] += 1
+
+    def is_echo(self, relative_path: str, absolute_path: str) -> bool:
+        """该路径的事件是否由自己的写入产生"""
+        with self.lock:
+            self._expire(time.monotonic())
+            entry = self.entries.get(relative_path)
+        if entry is None:
+            return False
+
+        try:
+            st = os.stat(absolute_path)
+        except OSError:
+            return False
+
+        _, size, mtime_ns, ino, _ = entry
+        with self.lock:
+            if st.st_size == size and st.st_mtime_ns == mtime_ns and (not ino or st.st_ino == ino):
+                self.stats['suppressed'] += 1
+                return True
+            # 登记后文件又被修改过
+            if self.entries.get(relative_path) is entry:
+                del self.entries[relative_path]
+            self.stats['stale'] += 1
+        return False
+
+    def get_stats(self) -> dict:
+        """获取抑制统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.entries)
+            return stats
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import tempfile
+
+
+class AtomicWriter:
+    """原子写文件
+
+    内容先写入同目录下的临时文件（以 .tmp 结尾，监听器会忽略），
+    fsync 后再 rename 到目标路径，读者不会看到写了一半的文件。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=directory,
+            prefix='.' + os.path.basename(path) + '.',
+            suffix='.tmp'
+        )
+        self.file = os.fdopen(fd, 'wb')
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.done = False
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self.hasher.hexdigest()
+
+    def commit(self) -> os.stat_result:
+        """落盘并替换目标文件
+
+        Returns:
+            替换后目标文件的 stat
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        self.done = True
+        return os.stat(self.path)
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        if self.done:
+            return
+        self.done = True
+        self.file.close()
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        elif not self.done:
+            self.commit()
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """原子写入整段内容
+
+    Returns:
+        (stat, sha256)
+    """
+    writer = AtomicWriter(path)
+    with writer:
+        writer.write(data)
+        st = writer.commit()
+    return st, writer.sha256
+
+
+def file_sha256(path: str, chunk_size: int = 65536) -> str:
+    """分块计算文件的 SHA-256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,172 @@
+import os
+import posixpath
+import re
+
+
+IGNORE_FILE = '.soulsyncignore'
+
+# 内置规则（编辑器临时文件、版本库与缓存目录），.soulsyncignore 的规则追加在其后，可用 ! 取消
+DEFAULT_IGNORE_PATTERNS = [
+    '*.tmp',
+    '*.swp',
+    '*.swx',
+    '*.bak',
+    '*~',
+    '.#*',
+    '.DS_Store',
+    '.git/',
+    '.svn/',
+    '.hg/',
+    '__pycache__/',
+    '.cache/',
+    IGNORE_FILE,
+]
+
+
+def _translate(pattern: str) -> str:
+    """把一条 gitignore 模式（不含 ! 和结尾的 /）翻译成正则"""
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    parts = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif c == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                parts.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body[0] in '!^':
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end + 1
+        elif c == '\\' and i + 1 < n:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+
+    regex = ''.join(parts)
+    if not anchored:
+        # 不含 / 的模式在任意层级匹配
+        regex = '(?:.*/)?' + regex
+    return regex
+
+
+def parse_patterns(lines) -> list:
+    """解析 gitignore 风格的规则
+
+    Returns:
+        [(negated, regex), ...]，保持原有顺序
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        if line.endswith(' ') and not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            continue
+
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+
+        # 目录规则只匹配以 / 结尾的目录路径，其他规则对文件和目录都生效
+        regex = _translate(line) + ('/' if dir_only else '/?')
+        rules.append((negated, regex))
+    return rules
+
+
+class IgnoreMatcher:
+    """编译后的忽略规则
+
+    连续的同类规则（忽略 / 取消忽略）合并成一个正则，匹配时从最后一组往前找，
+    最后命中的一组决定结果，与 gitignore 的“后面的规则优先”一致。没有 ! 规则时
+    只有一个正则。与 gitignore 相同，目录被忽略后其中的文件不能再被取消忽略；
+    目录的判断结果会被缓存。
+    """
+
+    def __init__(self, patterns: list = None, cache_size: int = 4096):
+        self.patterns = list(DEFAULT_IGNORE_PATTERNS if patterns is None else patterns)
+        self.cache_size = cache_size
+        self.dir_cache = {}
+        self.groups = []
+
+        for negated, regex in parse_patterns(self.patterns):
+            if self.groups and self.groups[-1][0] == negated:
+                self.groups[-1][1].append(regex)
+            else:
+                self.groups.append((negated, [regex]))
+        self.groups = [
+            (negated, re.compile('^(?:' + '|'.join(regexes) + ')$'))
+            for negated, regexes in self.groups
+        ]
+
+    @classmethod
+    def from_file(cls, ignore_file: str):
+        """从 .soulsyncignore 加载；文件不存在时只使用内置规则"""
+        if not os.path.exists(ignore_file):
+            return cls()
+        try:
+            with open(ignore_file, 'r', encoding='utf-8') as f:
+                return cls(DEFAULT_IGNORE_PATTERNS + f.read().splitlines() + [IGNORE_FILE])
+        except Exception as e:
+            print(f"Failed to load {ignore_file}: {e}")
+            return cls()
+
+    def _match(self, path: str) -> bool:
+        for negated, regex in reversed(self.groups):
+            if regex.match(path):
+                return not negated
+        return False
+
+    def _dir_ignored(self, directory: str) -> bool:
+        ignored = self.dir_cache.get(directory)
+        if ignored is None:
+            parent = posixpath.dirname(directory)
+            ignored = (bool(parent) and self._dir_ignored(parent)) or self._match(directory + '/')
+            if len(self.dir_cache) >= self.cache_size:
+                self.dir_cache.clear()
+            self.dir_cache[directory] = ignored
+        return ignored
+
+    def matches(self, relative_path: str, is_dir: bool = False) -> bool:
+        """路径是否被忽略
+
+        Args:
+            relative_path: 相对工作区的路径，以 / 分隔
+            is_dir: 路径是否为目录
+        """
+        relative_path = relative_path.strip('/')
+        if not relative_path:
+            return False
+        if is_dir:
+            return self._dir_ignored(relative_path)
+        parent = posixpath.dirname(relative_path)
+        if parent and self._dir_ignored(parent):
+            return True
+        return self._match(relative_path)
@@ -24,8 +24,21 @@ try:
     from client import OpenClawClient
     from watcher import OpenClawMultiWatcher
     from version_manager import VersionManager
-    from profiles import ProfilesClient
+    from profiles import ProfilesClient, ConflictError
+    from chunking import ChunkStore
+    from base_cache import BaseCache
+    from ratelimit import UploadLimiter
     from sync import ProfileSync
+    from manifest import SyncManifest
+    from cursor import SyncCursor
+    from echo import EchoRegistry
+    from transport import Transport
+    from reconcile import Reconciler
+    from ignore import IgnoreMatcher, IGNORE_FILE
+    from remote_batcher import RemoteChangeBatcher
+    from sync_queue import SyncQueue, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+    from outbox import Outbox, OutboxDrainer
+    from async_client import AsyncEngine
 except ImportError as e:
     print(f"导入错误: {e}")
     print(f"当前路径: {sys.path}")
@@ -38,11 +51,23 @@ class SoulSyncPlugin:
     
     def __init__(self):
         self.config = None
+        self.async_engine = None
+        self.chunk_store = None
+        self.base_cache = None
+        self.upload_limiter = None
+        self.transport = None
         self.client = None
         self.profiles_client = None
         self.watcher = None
         self.version_manager = None
+        self.manifest = None
+        self.sync_cursor = None
+        self.echo = None
         self.profile_sync = None
+        self.sync_queue = None
+        self.outbox = None
+        self.outbox_drainer = None
+        self.remote_batcher = None
         self.running = False
     
     def get_input(self, prompt):
@@ -252,7 +277,40 @@ class SoulSyncPlugin:
         """初始化组件"""
         print("\n=== Initializing SoulSync Plugin ===\n")
         
-        self.client = OpenClawClient(self.config)
+        # 分块去重：大文件按内容分块，本地块存储中已有的块不再上传或下载
+        if self.config.get('chunk_upload', True):
+            self.chunk_store = ChunkStore(
+                os.path.normpath(os.path.join(PLUGIN_DIR, 'chunks')),
+                max_bytes=self.config.get('chunk_store_max_bytes', 268435456)
+            )
+        
+        # 服务端已确认版本的本地缓存：增量基准、冲突合并和回滚都不需要访问网络
+        self.base_cache = BaseCache(
+            os.path.normpath(os.path.join(PLUGIN_DIR, 'bases')),
+            max_bytes=self.config.get('base_cache_max_bytes', 67108864),
+            keep_versions=self.config.get('base_cache_versions', 4),
+            save_interval=self.config.get('versions_commit_interval', 1.0)
+        )
+        
+        # 上传限流：避免频繁改写文件时触发服务端限流
+        if self.config.get('upload_limit', True):
+            self.upload_limiter = UploadLimiter.from_config(self.config)
+        
+        # 两个客户端共用同一个传输层（连接池、压缩与流量统计）
+        if self.config.get('engine', 'threads') == 'asyncio':
+            try:
+                self.async_engine = AsyncEngine()
+                self.transport, self.client, self.profiles_client = \
+                    self.async_engine.create_clients(self.config, chunk_store=self.chunk_store,
+                                                    base_cache=self.base_cache,
+                                                    limiter=self.upload_limiter)
+                print("Using asyncio client engine")
+            except ImportError as e:
+                print(f"Warning: {e}, falling back to threads engine")
+        
+        if not self.async_engine:
+            self.transport = Transport.from_config(self.config)
+            self.client = OpenClawClient(self.config, self.transport)
         
         email = self.config.get('email')
         password = self.config.get('password')
@@ -279,37 +337,138 @@ class SoulSyncPlugin:
         
         # 版本管理器
         versions_file = os.path.normpath(os.path.join(PLUGIN_DIR, 'versions.json'))
-        self.version_manager = VersionManager(versions_file)
-        
-        self.profiles_client = ProfilesClient(
-            self.config.get('cloud_url'),
-            self.client.token
+        # group commit：版本号和清单的修改合并后批量写盘
+        commit_interval = self.config.get('versions_commit_interval', 1.0)
+        self.version_manager = VersionManager(
+            versions_file,
+            group_commit_interval=commit_interval,
+            group_commit_size=self.config.get('versions_commit_size', 200)
         )
         
+        # 同步清单（与 versions.json 同目录），用于跳过内容未变的上传
+        manifest_file = os.path.normpath(os.path.join(PLUGIN_DIR, 'manifest.json'))
+        self.manifest = SyncManifest(manifest_file, save_interval=commit_interval)
+        
+        if self.profiles_client:
+            self.profiles_client.set_token(self.client.token)
+        else:
+            self.profiles_client = ProfilesClient(
+                self.config.get('cloud_url'),
+                self.client.token,
+                delta_upload=self.config.get('delta_upload', True),
+                delta_max_ratio=self.config.get('delta_max_ratio', 0.5),
+                transport=self.transport,
+                chunk_store=self.chunk_store,
+                chunk_min_size=self.config.get('chunk_min_size', 65536),
+                base_cache=self.base_cache,
+                limiter=self.upload_limiter
+            )
+        
+        # 增量同步游标，与服务器和账号绑定
+        cursor_file = os.path.normpath(os.path.join(PLUGIN_DIR, 'sync_cursor.json'))
+        self.sync_cursor = SyncCursor(cursor_file, scope=f"{self.config.get('cloud_url')}|{email}")
+        
+        # 从云端写入的文件产生的监听事件不再上传
+        self.echo = EchoRegistry(ttl=self.config.get('echo_ttl', 30))
+        
         self.profile_sync = ProfileSync(
             self.profiles_client,
             self.version_manager,
-            self.config.get('workspace')
+            self.config.get('workspace'),
+            manifest=self.manifest,
+            pull_concurrency=self.config.get('pull_concurrency', 8),
+            stream_threshold=self.config.get('stream_threshold', 262144),
+            cursor=self.sync_cursor,
+            echo=self.echo,
+            auto_merge=self.config.get('merge_on_conflict', True),
+            merge_attempts=self.config.get('merge_attempts', 3)
         )
         
-        print("Pulling all profiles from cloud...")
+        # 启动时对账：推送离线期间的本地修改，拉取云端更新（在监听启动之前完成）
+        watch_files = self.config.get('watch_files', [])
+        if self.config.get('reconcile_on_start', True):
+            print("Reconciling workspace with cloud...")
+            try:
+                reconciler = Reconciler(
+                    self.profile_sync,
+                    watch_files,
+                    IgnoreMatcher.from_file(os.path.join(self.config.get('workspace'), IGNORE_FILE)),
+                    push_batch_size=self.config.get('push_batch_size', 50)
+                )
+                reconciler.run()
+            except Exception as e:
+                print(f"Warning: Could not reconcile workspace: {e}")
+        else:
+            print("Pulling all profiles from cloud...")
+            try:
+                self.profile_sync.pull_all()
+            except Exception as e:
+                print(f"Warning: Could not pull profiles: {e}")
+        
+        # 建立（或用已有游标追上）增量同步的起点，之后的远端变化只拉取增量；
+        # 对账已经前移游标时这里只取对账之后的变化
         try:
-            self.profile_sync.pull_all()
+            self.profile_sync.sync_since_cursor()
         except Exception as e:
-            print(f"Warning: Could not pull profiles: {e}")
+            print(f"Warning: Could not sync since cursor: {e}")
+        
+        # 待上传的修改先写入持久化发件箱，云端不可达时不会丢失
+        if self.config.get('outbox', True):
+            self.outbox = Outbox(
+                os.path.normpath(os.path.join(PLUGIN_DIR, 'outbox.db')),
+                retry_base=self.config.get('outbox_retry_base', 2.0),
+                retry_max=self.config.get('outbox_retry_max', 300.0),
+                max_attempts=self.config.get('outbox_max_attempts', 20)
+            )
+            conflicted = self.outbox.conflicted()
+            if conflicted:
+                print(f"Warning: {len(conflicted)} local edits have unresolved conflicts and will be retried: "
+                      f"{', '.join(conflicted[:10])}")
+        
+        # 上传在工作线程中执行，不阻塞文件监听；短时间内的变化合并成一批
+        self.sync_queue = SyncQueue(
+            self.push_batch if self.outbox else self.profile_sync.push_files,
+            workers=self.config.get('sync_workers', 2),
+            max_size=self.config.get('sync_queue_size', 1000),
+            batch_size=self.config.get('push_batch_size', 50),
+            batch_window=self.config.get('push_batch_window', 0.5),
+            # 有发件箱时队列满不必长时间阻塞监听线程，未入队的修改由发件箱补发
+            put_timeout=self.config.get('sync_queue_put_timeout', 1.0) if self.outbox else None
+        )
+        self.sync_queue.start()
+        
+        if self.outbox:
+            self.outbox_drainer = OutboxDrainer(
+                self.outbox,
+                self.sync_queue.submit,
+                interval=self.config.get('outbox_drain_interval', 5.0),
+                batch_size=self.config.get('outbox_drain_batch', 100)
+            )
+            self.outbox_drainer.start()
         
         print("\nStarting file watcher...")
-        watch_files = self.config.get('watch_files', [])
         self.watcher = OpenClawMultiWatcher(
             self.config.get('workspace'),
             watch_files,
-            self.on_file_change
+            self.on_file_change,
+            debounce_seconds=self.config.get('watch_debounce', 1),
+            max_wait_seconds=self.config.get('watch_max_wait', 5),
+            max_pending=self.config.get('watch_max_pending', 10000),
+            suppress=self.echo.is_echo
         )
         self.watcher.start()
         
+        # 远端变化通知先合并，再在后台线程中一次增量同步，不阻塞 WebSocket 接收
+        self.remote_batcher = RemoteChangeBatcher(
+            self.profile_sync.apply_remote_changes,
+            window=self.config.get('remote_batch_window', 0.5)
+        )
+        self.remote_batcher.start()
+        
         print("\nConnecting to WebSocket...")
         try:
-            self.client.connect_websocket(self.on_websocket_message)
+            # 每次（重新）连上后按游标补齐断线期间错过的变化
+            self.client.connect_websocket(self.on_websocket_message, self.on_websocket_connected)
         except Exception as e:
             print(f"Warning: Could not connect WebSocket: {e}")
         
@@ -320,17 +479,55 @@ class SoulSyncPlugin:
         print(f"\n[File {event_type}] {relative_path}")
         
         if event_type in ['modified', 'created']:
-            time.sleep(0.5)
-            
-            try:
-                self.profile_sync.push_file(relative_path)
-                print(f"Upload completed: {relative_path}")
-            except Exception as e:
-                print(f"Upload error: {e}")
+            priority = self.sync_priority(relative_path)
+            if self.outbox:
+                self.outbox.add(relative_path, priority)
+            self.sync_queue.submit(relative_path, priority)
         
         elif event_type == 'deleted':
             print(f"File deleted (not synced to cloud): {relative_path}")
     
+    def push_batch(self, file_paths: list) -> dict:
+        """上传一批文件并更新发件箱
+
+        成功或无需上传的记录删除，失败的推迟重试，无法自动合并的冲突保留并
+        标记为 conflicted（本地修改不会丢失）。
+        """
+        started_at = time.time()
+        try:
+            results = self.profile_sync.push_files(file_paths)
+        except Exception as e:
+            self.outbox.fail(file_paths, str(e))
+            raise
+        conflicts = [file_path for file_path, result in results.items() if isinstance(result, ConflictError)]
+        failed = [
+            file_path for file_path, result in results.items()
+            if isinstance(result, Exception) and file_path not in conflicts
+        ]
+        self.outbox.fail(failed, 'upload failed')
+        self.outbox.conflict(conflicts, started_at, 'conflict not resolved automatically')
+        self.outbox.complete([file_path for file_path in file_paths
+                              if file_path not in failed and file_path not in conflicts], started_at)
+        return results
+    
+    def sync_priority(self, relative_path: str) -> int:
+        """上传优先级：身份文件优先，其次是其他顶层文件，目录下的批量文件最后"""
+        if relative_path in self.config.get('priority_files', ['SOUL.md', 'IDENTITY.md']):
+            return PRIORITY_HIGH
+        if '/' not in relative_path:
+            return PRIORITY_NORMAL
+        return PRIORITY_BULK
+    
+    def on_websocket_connected(self):
+        """WebSocket 连接（或重连）成功回调"""
+        # 重连时可能重新登录过，同步 token
+        self.profiles_client.set_token(self.client.token)
+        if self.outbox_drainer:
+            # 连接恢复，断线期间失败的上传立即重试
+            self.outbox.retry_now()
+            self.outbox_drainer.wake()
+        self.profile_sync.sync_since_cursor()
+    
     def on_websocket_message(self, data: dict):
         """WebSocket 消息回调"""
         event = data.get('event')
@@ -339,24 +536,48 @@ class SoulSyncPlugin:
             file_path = data.get('file_path')
             version = data.get('version')
             print(f"\n[WebSocket] File updated: {file_path} (v{version})")
-            try:
-                self.profile_sync.on_remote_change(file_path, version)
-            except Exception as e:
-                print(f"Sync error: {e}")
+            self.remote_batcher.add(file_path, version)
         
         elif event == 'new_memory':
             print(f"\n[WebSocket] New memory available!")
-            try:
-                self.profile_sync.pull_all()
-                print("Memory synced from remote")
-            except Exception as e:
-                print(f"Sync error: {e}")
+            self.remote_batcher.request_sync()
         
         elif data.get('type') == 'authenticated':
             print(f"[WebSocket] Authenticated, socket_id: {data.get('socket_id')}")
         elif data.get('type') == 'error':
             print(f"[WebSocket] Error: {data.get('message')}")
     
+    def get_stats(self) -> dict:
+        """汇总各组件的运行统计"""
+        stats = {}
+        if self.transport:
+            stats['http'] = self.transport.get_stats()
+        if self.client:
+            stats['websocket'] = self.client.get_ws_stats()
+        if self.profiles_client:
+            stats['delta'] = dict(self.profiles_client.delta_stats)
+            if self.chunk_store:
+                stats['chunks'] = dict(self.profiles_client.chunk_stats, store=dict(self.chunk_store.stats))
+        if self.sync_queue:
+            stats['queue'] = self.sync_queue.get_stats()
+        if self.outbox:
+            stats['outbox'] = self.outbox.get_stats()
+        if self.upload_limiter:
+            stats['limiter'] = self.upload_limiter.get_stats()
+        if self.remote_batcher:
+            stats['remote'] = self.remote_batcher.get_stats()
+        if self.version_manager:
+            stats['versions'] = self.version_manager.get_stats()
+        if self.watcher:
+            stats['watcher'] = self.watcher.coalescer.get_stats()
+        if self.echo:
+            stats['echo'] = self.echo.get_stats()
+        if self.base_cache:
+            stats['bases'] = self.base_cache.get_stats()
+        if self.profile_sync:
+            stats['merge'] = dict(self.profile_sync.merge_stats)
+        return stats
+    
     def run(self):
         """运行插件"""
         print("\n" + "=" * 50)
@@ -395,6 +616,22 @@ class SoulSyncPlugin:
             except Exception as e:
                 print(f"Error stopping watcher: {e}")
         
+        if self.outbox_drainer:
+            self.outbox_drainer.stop()
+        if self.sync_queue:
+            self.sync_queue.stop()
+            print("Pending uploads flushed")
+        if self.remote_batcher:
+            self.remote_batcher.stop()
+            print("Pending remote changes applied")
+        
+        if self.version_manager:
+            self.version_manager.close()
+        if self.manifest:
+            self.manifest.flush()
+        if self.base_cache:
+            self.base_cache.flush()
+        
         if self.client:
             try:
                 self.client.close()
@@ -402,6 +639,16 @@ class SoulSyncPlugin:
             except Exception as e:
                 print(f"Error closing client: {e}")
         
+        if self.transport:
+            print(f"Stats: {json.dumps(self.get_stats())}")
+            self.transport.close()
+        
+        if self.outbox:
+            self.outbox.close()
+        
+        if self.async_engine:
+            self.async_engine.stop()
+        
         print("Plugin shutdown complete")
 
 
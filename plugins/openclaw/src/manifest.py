@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class SyncManifest:
+    """本地同步清单
+
+    记录每个文件最近一次成功同步时的 size、mtime、inode 和内容 SHA-256，
+    用于在上传前（以及启动时的离线对账中）判断文件是否真的发生了变化。
+
+    save_interval > 0 时，记录的修改在间隔到期后才合并写盘，需要落盘时调用 flush()。
+    """
+
+    def __init__(self, manifest_file: str, save_interval: float = 0):
+        self.manifest_file = manifest_file
+        self.save_interval = save_interval
+        self.entries = {}
+        self.dirty = False
+        self.save_timer = None
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """加载清单文件"""
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print(f"Failed to load manifest file: {e}")
+                self.entries = {}
+        else:
+            self.entries = {}
+
+    def save(self):
+        """保存清单文件（先写临时文件再替换）"""
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        self.dirty = False
+        try:
+            directory = os.path.dirname(self.manifest_file)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_file = self.manifest_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_file, self.manifest_file)
+        except Exception as e:
+            print(f"Failed to save manifest file: {e}")
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        """计算内容的 SHA-256"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, file_path: str) -> dict:
+        """获取文件的清单记录"""
+        return self.entries.get(file_path)
+
+    def stat_matches(self, file_path: str, st: os.stat_result) -> bool:
+        """size、mtime 和 inode 是否与上次同步时一致（只需一次 stat）
+
+        inode 为 0（部分平台不提供）或旧记录中没有 inode 时不比较 inode。
+        """
+        entry = self.entries.get(file_path)
+        if not entry:
+            return False
+        if entry.get('size') != st.st_size or entry.get('mtime_ns') != st.st_mtime_ns:
+            return False
+        ino = entry.get('ino')
+        return not ino or not st.st_ino or ino == st.st_ino
+
+    def hash_matches(self, file_path: str, sha256: str) -> bool:
+        """内容哈希是否与上次同步时一致"""
+        entry = self.entries.get(file_path)
+        return bool(entry) and entry.get('sha256') == sha256
+
+    def record(self, file_path: str, st: os.stat_result, sha256: str):
+        """记录一次成功同步
+
+        Args:
+            file_path: 相对路径
+            st: 同步时文件的 stat 结果
+            sha256: 同步内容的哈希
+        """
+        with self.lock:
+            self.entries[file_path] = {
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'ino': st.st_ino,
+                'sha256': sha256
+            }
+            self._schedule_save()
+
+    def paths(self) -> list:
+        """所有有记录的相对路径"""
+        with self.lock:
+            return list(self.entries)
+
+    def remove(self, file_path: str):
+        """删除文件的清单记录"""
+        with self.lock:
+            if self.entries.pop(file_path, None) is not None:
+                self._schedule_save()
+
+    def _schedule_save(self):
+        if not self.save_interval:
+            self._save()
+            return
+        self.dirty = True
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_interval, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        """立即写入尚未保存的修改"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            if self.dirty:
+                self._save()
@@ -0,0 +1,335 @@
+"""
+三方合并
+
+以服务端最近确认的版本为共同祖先（base），合并本地内容（ours）和冲突响应中
+的云端内容（theirs）。文本按行合并；skills.json 这类 JSON 文件按结构合并。
+只有两边修改了同一处且结果不同时才算冲突。
+"""
+
+import json
+from bisect import bisect_left
+from difflib import SequenceMatcher
+
+
+# 两边都没有唯一行作为锚点时，不超过该规模（行数乘积）的区域用 difflib 细分
+SMALL_REGION = 4096
+
+
+class MergeResult:
+    """合并结果
+
+    Attributes:
+        content: 合并后的内容；有冲突时为 None
+        conflicts: 冲突列表，每项为 (base 起始行, base 结束行)；JSON 合并时为键路径
+    """
+
+    def __init__(self, content: str = None, conflicts: list = None):
+        self.content = content
+        self.conflicts = conflicts or []
+
+    @property
+    def clean(self) -> bool:
+        return not self.conflicts
+
+
+def _unique_anchors(a: list, a1: int, a2: int, b: list, b1: int, b2: int) -> list:
+    """两边各只出现一次的行，按最长递增子序列取出互不交叉的匹配（patience diff）"""
+    a_pos = {}
+    for i in range(a1, a2):
+        line = a[i]
+        a_pos[line] = -1 if line in a_pos else i
+    b_pos = {}
+    for j in range(b1, b2):
+        line = b[j]
+        b_pos[line] = -1 if line in b_pos else j
+
+    pairs = []
+    for line, i in a_pos.items():
+        if i >= 0:
+            j = b_pos.get(line, -1)
+            if j >= 0:
+                pairs.append((i, j))
+    if not pairs:
+        return []
+    pairs.sort()
+    # 只有局部修改时锚点本身已按 b 递增，不需要再求子序列
+    if all(pairs[k][1] < pairs[k + 1][1] for k in range(len(pairs) - 1)):
+        return pairs
+
+    # 按 b 中位置求最长递增子序列
+    tails = []
+    tail_index = []
+    parents = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        parents[k] = tail_index[pos - 1] if pos else -1
+
+    anchors = []
+    k = tail_index[-1]
+    while k != -1:
+        anchors.append(pairs[k])
+        k = parents[k]
+    anchors.reverse()
+    return anchors
+
+
+def diff_lines(a: list, b: list) -> list:
+    """行级 diff
+
+    剥离公共前缀/后缀后以两边都唯一的行为锚点递归切分（patience diff），
+    整体接近线性；没有锚点的小区域用 difflib 细分，大区域整体视为替换。
+
+    Returns:
+        [(i1, i2, j1, j2), ...]：a[i1:i2] 被替换为 b[j1:j2]，按 i1 递增
+    """
+    hunks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a1, a2, b1, b2 = stack.pop()
+        while a1 < a2 and b1 < b2 and a[a1] == b[b1]:
+            a1 += 1
+            b1 += 1
+        while a1 < a2 and b1 < b2 and a[a2 - 1] == b[b2 - 1]:
+            a2 -= 1
+            b2 -= 1
+        if a1 == a2 and b1 == b2:
+            continue
+        if a1 == a2 or b1 == b2:
+            hunks.append((a1, a2, b1, b2))
+            continue
+
+        anchors = _unique_anchors(a, a1, a2, b, b1, b2)
+        if anchors:
+            # 锚点之间的非空区域分别处理（出栈顺序无关，最后统一排序）
+            prev_i, prev_j = a1, b1
+            for i, j in anchors:
+                if i > prev_i or j > prev_j:
+                    stack.append((prev_i, i, prev_j, j))
+                prev_i, prev_j = i + 1, j + 1
+            stack.append((prev_i, a2, prev_j, b2))
+        elif (a2 - a1) * (b2 - b1) <= SMALL_REGION:
+            matcher = SequenceMatcher(None, a[a1:a2], b[b1:b2], autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag != 'equal':
+                    hunks.append((a1 + i1, a1 + i2, b1 + j1, b1 + j2))
+        else:
+            hunks.append((a1, a2, b1, b2))
+
+    hunks.sort()
+    return hunks
+
+
+def _side_text(base: list, side: list, hunks: list, start: int, end: int) -> list:
+    """某一边对 base[start:end] 的改写结果"""
+    out = []
+    pos = start
+    for i1, i2, j1, j2 in hunks:
+        out.extend(base[pos:i1])
+        out.extend(side[j1:j2])
+        pos = i2
+    out.extend(base[pos:end])
+    return out
+
+
+def merge_lines(base: str, ours: str, theirs: str, union_inserts: bool = False) -> MergeResult:
+    """按行三方合并
+
+    两边的修改区域互不重叠时各自保留；重叠且结果相同时只保留一份。
+    union_inserts 为 True 时，两边在同一位置的纯插入（如都在文件末尾追加）
+    按先本地后云端的顺序都保留，不算冲突。
+
+    Returns:
+        MergeResult
+    """
+    # 三份内容都补齐末尾换行再比较：没有换行的最后一行被一边修改、另一边在其后
+    # 追加时，两行不会粘连
+    base_lines = _with_final_newline(base).splitlines(keepends=True)
+    ours_lines = _with_final_newline(ours).splitlines(keepends=True)
+    theirs_lines = _with_final_newline(theirs).splitlines(keepends=True)
+
+    changes = [(i1, i2, 0, (j1, j2)) for i1, i2, j1, j2 in diff_lines(base_lines, ours_lines)]
+    changes += [(i1, i2, 1, (j1, j2)) for i1, i2, j1, j2 in diff_lines(base_lines, theirs_lines)]
+    changes.sort()
+
+    out = []
+    conflicts = []
+    pos = 0
+    k = 0
+    while k < len(changes):
+        # 把互相重叠的修改归为一组
+        start, end = changes[k][0], changes[k][1]
+        group = [changes[k]]
+        k += 1
+        while k < len(changes):
+            i1, i2 = changes[k][0], changes[k][1]
+            if i1 < end or (i1 == end == start and i1 == i2):
+                group.append(changes[k])
+                end = max(end, i2)
+                k += 1
+            else:
+                break
+
+        out.extend(base_lines[pos:start])
+        pos = end
+        sides = {side for _, _, side, _ in group}
+        if len(sides) == 1:
+            side_lines = ours_lines if 0 in sides else theirs_lines
+            out.extend(_side_text(base_lines, side_lines,
+                                  [(i1, i2, j1, j2) for i1, i2, _, (j1, j2) in group], start, end))
+            continue
+
+        ours_text = _side_text(base_lines, ours_lines,
+                               [(i1, i2, j1, j2) for i1, i2, side, (j1, j2) in group if side == 0], start, end)
+        theirs_text = _side_text(base_lines, theirs_lines,
+                                 [(i1, i2, j1, j2) for i1, i2, side, (j1, j2) in group if side == 1], start, end)
+        if ours_text == theirs_text:
+            out.extend(ours_text)
+        elif union_inserts and start == end:
+            out.extend(ours_text)
+            out.extend(theirs_text)
+        else:
+            conflicts.append((start, end))
+
+    out.extend(base_lines[pos:])
+    if conflicts:
+        return MergeResult(None, conflicts)
+    content = ''.join(out)
+    # 两边原本都没有末尾换行时去掉补上的换行
+    sides = [text for text in (ours, theirs) if text]
+    if content.endswith('\n') and sides and not any(text.endswith('\n') for text in sides):
+        content = content[:-1]
+    return MergeResult(content)
+
+
+def _with_final_newline(text: str) -> str:
+    if text and not text.endswith('\n'):
+        return text + '\n'
+    return text
+
+
+_MISSING = object()
+
+
+def _key_field(*lists):
+    """对象列表中可用作标识的字段（每个列表中每项都有且互不重复）"""
+    for field in ('id', 'name', 'key'):
+        usable = True
+        for items in lists:
+            values = [json.dumps(item.get(field)) for item in items]
+            if 'null' in values or len(set(values)) != len(values):
+                usable = False
+                break
+        if usable:
+            return field
+    return None
+
+
+def _merge_keyed_list(base: list, ours: list, theirs: list, field: str, path: str, conflicts: list) -> list:
+    """按标识字段合并对象列表，顺序以本地为准，云端新增的项追加在后面"""
+    base_map = {json.dumps(item[field]): item for item in base}
+    ours_map = {json.dumps(item[field]): item for item in ours}
+    theirs_map = {json.dumps(item[field]): item for item in theirs}
+
+    order = list(ours_map) + [key for key in theirs_map if key not in ours_map]
+    out = []
+    for key in order:
+        value = _merge_value(base_map.get(key, _MISSING), ours_map.get(key, _MISSING),
+                             theirs_map.get(key, _MISSING), f"{path}[{field}={key}]", conflicts)
+        if value is not _MISSING:
+            out.append(value)
+    return out
+
+
+def _merge_scalar_list(base: list, ours: list, theirs: list) -> list:
+    """按元素合并标量列表：保留本地顺序，去掉云端删除的项，追加云端新增的项"""
+    base_set = set(map(json.dumps, base))
+    ours_set = set(map(json.dumps, ours))
+    theirs_set = set(map(json.dumps, theirs))
+    out = [item for item in ours if json.dumps(item) in theirs_set or json.dumps(item) not in base_set]
+    out += [item for item in theirs if json.dumps(item) not in ours_set and json.dumps(item) not in base_set]
+    return out
+
+
+def _merge_value(base, ours, theirs, path: str, conflicts: list):
+    """递归合并 JSON 值，_MISSING 表示该键不存在"""
+    if ours == theirs:
+        return ours
+    if ours == base:
+        return theirs
+    if theirs == base:
+        return ours
+
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        out = {}
+        for key in list(ours) + [key for key in theirs if key not in ours]:
+            value = _merge_value(base.get(key, _MISSING), ours.get(key, _MISSING),
+                                 theirs.get(key, _MISSING), f"{path}.{key}", conflicts)
+            if value is not _MISSING:
+                out[key] = value
+        return out
+
+    if isinstance(ours, list) and isinstance(theirs, list):
+        base = base if isinstance(base, list) else []
+        if all(isinstance(item, dict) for item in base + ours + theirs):
+            field = _key_field(base, ours, theirs)
+            if field:
+                return _merge_keyed_list(base, ours, theirs, field, path, conflicts)
+        elif not any(isinstance(item, (dict, list)) for item in base + ours + theirs):
+            return _merge_scalar_list(base, ours, theirs)
+
+    conflicts.append(path or '$')
+    return ours
+
+
+def _json_indent(content: str):
+    """沿用原文件的缩进"""
+    for line in content.splitlines()[1:]:
+        stripped = line.lstrip(' \t')
+        if stripped and len(stripped) < len(line):
+            return line[:len(line) - len(stripped)]
+    return None if '\n' not in content.strip() else 2
+
+
+def merge_json(base: str, ours: str, theirs: str) -> MergeResult:
+    """按 JSON 结构三方合并（对象按键，带 id/name 的对象列表按标识，标量列表按元素）
+
+    任意一边不是合法 JSON 时退回按行合并。
+    """
+    try:
+        base_value = json.loads(base) if base.strip() else {}
+        ours_value = json.loads(ours)
+        theirs_value = json.loads(theirs)
+    except ValueError:
+        return merge_lines(base, ours, theirs)
+
+    conflicts = []
+    merged = _merge_value(base_value, ours_value, theirs_value, '', conflicts)
+    if conflicts:
+        return MergeResult(None, conflicts)
+    content = json.dumps(merged, ensure_ascii=False, indent=_json_indent(ours))
+    if ours.endswith('\n'):
+        content += '\n'
+    return MergeResult(content)
+
+
+def merge_content(file_path: str, base: str, ours: str, theirs: str) -> MergeResult:
+    """按文件类型选择合并方式
+
+    .json 按结构合并；追加式的记忆文件（MEMORY.md 和 memory/ 下的 Markdown）
+    两边在同一位置追加的内容都保留；其他文本（包括 SOUL.md 等）按行严格合并。
+    """
+    if file_path.endswith('.json'):
+        return merge_json(base, ours, theirs)
+    return merge_lines(base, ours, theirs, union_inserts=is_append_only(file_path))
+
+
+def is_append_only(file_path: str) -> bool:
+    """是否为只在末尾追加记录的记忆文件"""
+    return file_path == 'MEMORY.md' or (file_path.startswith('memory/') and file_path.endswith('.md'))
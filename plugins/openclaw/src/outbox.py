@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import threading
+import time
+
+from backoff import backoff_delay
+
+
+class Outbox:
+    """持久化的上传发件箱（SQLite）
+
+    每次本地修改先记入发件箱再进入上传队列，上传成功后才删除，进程退出或云端
+    不可达都不会丢失待上传的修改。同一路径只保留一条记录（多次修改合并为最新
+    的一次）。上传失败的记录按指数退避加 jitter 推迟重试，恢复连接后不会所有
+    记录同时重发。无法自动合并的冲突记录标记为 conflicted 保留，每 retry_max
+    秒、文件再次修改或插件重启时重新尝试。
+    """
+
+    def __init__(self, db_file: str, retry_base: float = 2.0, retry_max: float = 300.0,
+                 max_attempts: int = 20, lease_seconds: float = 60.0):
+        self.db_file = db_file
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        # 取出待发送的记录后在该时间内不会再次取出（上传结束后删除或重新安排）
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.stats = {
+            'added': 0,
+            'collapsed': 0,
+            'completed': 0,
+            'failed': 0,
+            'conflicts': 0,
+            'dropped': 0,
+            'drained': 0
+        }
+
+        directory = os.path.dirname(db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            ' path TEXT PRIMARY KEY,'
+            ' priority INTEGER NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' next_attempt REAL NOT NULL DEFAULT 0,'
+            ' last_error TEXT,'
+            ' conflicted INTEGER NOT NULL DEFAULT 0)'
+        )
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(outbox)')]
+        if 'conflicted' not in columns:
+            self.db.execute('ALTER TABLE outbox ADD COLUMN conflicted INTEGER NOT NULL DEFAULT 0')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt, priority, updated_at)')
+        # 上次运行遗留的记录（包括已租出未完成的）立即到期
+        self.db.execute('UPDATE outbox SET next_attempt = 0')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def add(self, file_path: str, priority: int = 1):
+        """记录一次待上传的修改（同一路径已有记录时合并，优先级取较高者）
+
+        调用方随后直接把修改提交给上传队列，因此新记录先租用 lease_seconds，
+        只有没能及时上传的记录才由 OutboxDrainer 重新提交。冲突记录再次修改后
+        取消冲突标记，按新修改处理。
+        """
+        now = time.time()
+        with self.lock:
+            existing = self.db.execute('SELECT priority FROM outbox WHERE path = ?', (file_path,)).fetchone()
+            if existing:
+                self.db.execute('UPDATE outbox SET priority = ?, updated_at = ?, conflicted = 0, '
+                                'next_attempt = MIN(next_attempt, ?) WHERE path = ?',
+                                (min(priority, existing[0]), now, now + self.lease_seconds, file_path))
+                self.stats['collapsed'] += 1
+            else:
+                self.db.execute('INSERT INTO outbox (path, priority, updated_at, next_attempt) VALUES (?, ?, ?, ?)',
+                                (file_path, priority, now, now + self.lease_seconds))
+                self.stats['added'] += 1
+
+    def claim(self, limit: int) -> list:
+        """取出到期的记录（按优先级和修改时间排序）并租用 lease_seconds
+
+        Returns:
+            [(path, priority), ...]
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self.db.execute(
+                    'SELECT path, priority FROM outbox WHERE next_attempt <= ? '
+                    'ORDER BY priority, updated_at LIMIT ?', (now, limit)
+                ).fetchall()
+                self.db.executemany('UPDATE outbox SET next_attempt = ? WHERE path = ?',
+                                    [(now + self.lease_seconds, row[0]) for row in rows])
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+            self.stats['drained'] += len(rows)
+        return rows
+
+    def complete(self, file_paths: list, started_at: float):
+        """上传成功（或无需上传）后删除记录
+
+        started_at 之后又被修改的路径保留，等待下一次上传。
+        """
+        if not file_paths:
+            return
+        with self.lock:
+            cursor = self.db.executemany('DELETE FROM outbox WHERE path = ? AND updated_at <= ?',
+                                         [(file_path, started_at) for file_path in file_paths])
+            self.stats['completed'] += max(cursor.rowcount, 0)
+
+    def fail(self, file_paths: list, error: str):
+        """上传失败：推迟重试；超过 max_attempts 次的记录放弃"""
+        if not file_paths:
+            return
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                for file_path in file_paths:
+                    row = self.db.execute('SELECT attempts FROM outbox WHERE path = ?', (file_path,)).fetchone()
+                    if row is None:
+                        continue
+                    attempts = row[0] + 1
+                    if self.max_attempts and attempts >= self.max_attempts:
+                        self.db.execute('DELETE FROM outbox WHERE path = ?', (file_path,))
+                        self.stats['dropped'] += 1
+                        print(f"[Outbox] Giving up on {file_path} after {attempts} attempts: {error}")
+                        continue
+                    delay = backoff_delay(attempts - 1, self.retry_base, self.retry_max)
+                    self.db.execute('UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE path = ?',
+                                    (attempts, now + delay, error, file_path))
+                    self.stats['failed'] += 1
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+
+    def conflict(self, file_paths: list, started_at: float, error: str):
+        """无法自动合并的冲突：保留记录并标记为 conflicted，retry_max 秒后再尝试
+
+        冲突不计入失败次数，不会因为 max_attempts 被放弃；started_at 之后又被
+        修改的路径不标记，按新修改处理。
+        """
+        if not file_paths:
+            return
+        retry_at = time.time() + self.retry_max
+        with self.lock:
+            cursor = self.db.executemany(
+                'UPDATE outbox SET conflicted = 1, next_attempt = ?, last_error = ? '
+                'WHERE path = ? AND updated_at <= ?',
+                [(retry_at, error, file_path, started_at) for file_path in file_paths]
+            )
+            self.stats['conflicts'] += max(cursor.rowcount, 0)
+        for file_path in file_paths:
+            print(f"[Outbox] Unresolved conflict kept for retry: {file_path}")
+
+    def conflicted(self) -> list:
+        """标记为冲突、等待处理的路径"""
+        with self.lock:
+            return [row[0] for row in self.db.execute('SELECT path FROM outbox WHERE conflicted = 1 ORDER BY path')]
+
+    def retry_now(self):
+        """连接恢复：所有等待重试的记录立即到期"""
+        with self.lock:
+            self.db.execute('UPDATE outbox SET next_attempt = 0 WHERE attempts > 0')
+
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def get_stats(self) -> dict:
+        """获取发件箱统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            pending, retrying, conflicted = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(attempts > 0), 0), COALESCE(SUM(conflicted), 0) '
+                'FROM outbox').fetchone()
+        stats['pending'] = pending
+        stats['retrying'] = retrying
+        stats['conflicted'] = conflicted
+        return stats
+
+
+class OutboxDrainer:
+    """把发件箱中到期的记录分批交给上传队列
+
+    每 interval 秒（或被 wake 唤醒时）取出至多 batch_size 条记录提交；
+    上传的并发和批量由上传队列控制，队列满时提交阻塞，形成背压。
+    """
+
+    def __init__(self, outbox: Outbox, submit, interval: float = 5.0, batch_size: int = 100):
+        self.outbox = outbox
+        self.submit = submit
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.wake_event = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """启动后台线程（立即处理一次上次运行遗留的记录）"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def wake(self):
+        """立即处理到期的记录"""
+        self.wake_event.set()
+
+    def _run(self):
+        while self.running:
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"[Outbox] Drain error: {e}")
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+
+    def drain(self) -> int:
+        """提交所有到期的记录
+
+        Returns:
+            提交的记录数
+        """
+        total = 0
+        while self.running:
+            rows = self.outbox.claim(self.batch_size)
+            for file_path, priority in rows:
+                self.submit(file_path, priority)
+            total += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        if total:
+            print(f"[Outbox] Resubmitted {total} pending uploads")
+        return total
@@ -1,12 +1,56 @@
-import requests
+import base64
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+from base_cache import BaseCache
+from chunking import ChunkStore, MIN_CHUNK_SIZE, split_chunks, chunk_id
+from delta import make_patch, patch_size, content_digest
+from fsutil import AtomicWriter, atomic_write_bytes
+from ratelimit import UploadLimiter, LIMITED_RETRY_STATUSES
+from resilience import ApiError, CircuitOpenError
+from transport import Transport
 
 
 class ProfilesClient:
     """Profiles API 客户端"""
     
-    def __init__(self, cloud_url: str, token: str = None):
+    def __init__(self, cloud_url: str, token: str = None, delta_upload: bool = True,
+                 delta_max_ratio: float = 0.5, transport: Transport = None,
+                 chunk_store: ChunkStore = None, chunk_min_size: int = 65536,
+                 chunk_batch_bytes: int = 1048576, base_cache: BaseCache = None,
+                 limiter: UploadLimiter = None):
         self.cloud_url = cloud_url.rstrip('/')
         self.token = token
+        self.transport = transport or Transport()
+        # 增量上传：以服务端最近确认的版本为基准（不传 base_cache 时只缓存在内存中）
+        self.delta_upload = delta_upload
+        self.delta_max_ratio = delta_max_ratio
+        self.bases = base_cache or BaseCache()
+        # 上传限流（全局/每路径令牌桶和自适应并发），None 表示不限流
+        self.limiter = limiter
+        self.delta_stats = {
+            'uploads': 0,
+            'delta_uploads': 0,
+            'delta_fallbacks': 0,
+            'bytes_sent': 0,
+            'bytes_saved': 0
+        }
+        # 分块去重：不小于 chunk_min_size 的文件按内容分块，只传输对方没有的块
+        self.chunk_store = chunk_store
+        self.chunk_min_size = chunk_min_size
+        self.chunk_batch_bytes = chunk_batch_bytes
+        self.chunk_supported = True
+        self.chunk_lock = threading.Lock()
+        self.chunk_stats = {
+            'chunked_uploads': 0,
+            'chunked_downloads': 0,
+            'chunks_total': 0,
+            'chunks_transferred': 0,
+            'bytes_total': 0,
+            'bytes_transferred': 0
+        }
     
     def _get_headers(self) -> dict:
         """获取请求头"""
@@ -19,32 +63,39 @@ class ProfilesClient:
         """设置 token"""
         self.token = token
     
-    def get_profiles(self, path: str = None) -> dict:
+    def get_profiles(self, path: str = None, inline_max: int = None) -> dict:
         """获取 profiles
         
         Args:
             path: 可选的文件路径
+            inline_max: 可选，超过该字节数的文件不在列表中内联 content，
+                        需要用 download_profile_to 单独流式下载
             
         Returns:
             包含 files 列表的字典
         """
-        url = f"{self.cloud_url}/api/profiles"
-        if path:
-            url += f"?path={path}"
-        
-        response = requests.get(url, headers=self._get_headers())
-        
+        response = self.transport.get(self._url('/api/profiles', path=path, inline_max=inline_max),
+                                      headers=self._get_headers())
+        return self._profiles_result(response)
+    
+    def _profiles_result(self, response) -> dict:
+        """处理 get_profiles 的响应"""
         if response.status_code == 200:
-            return response.json()
+            result = response.json()
+            self._remember_bases(result.get('files', []))
+            return result
         elif response.status_code == 404:
             return {'files': []}
         else:
-            error = response.json().get('error', 'Unknown error')
-            raise Exception(f"Get profiles failed: {error}")
+            raise ApiError.from_response(response, "Get profiles failed")
     
     def upload_profile(self, file_path: str, content: str, version: int) -> dict:
         """上传 profile
         
+        若本地保存了该版本的基准内容，且补丁不超过全文的 delta_max_ratio，
+        则只发送行级补丁；大文件没有补丁或补丁比服务端缺少的块还大时分块上传，
+        只发送服务端没有的块。服务端拒绝时自动回退为全文上传。
+        
         Args:
             file_path: 文件路径
             content: 文件内容
@@ -54,29 +105,652 @@ class ProfilesClient:
             成功时返回 {file_path, version, updated_at}
             冲突时抛出异常
         """
-        url = f"{self.cloud_url}/api/profiles"
-        data = {
+        url = self._url('/api/profiles')
+        self.delta_stats['uploads'] += 1
+        
+        deltas = self._build_deltas([(file_path, content, version)])
+        prepared = self._prepare_chunked([(file_path, content, version)], deltas)
+        for body in self._upload_bodies(file_path, content, version, deltas, prepared):
+            response = self._post_upload(url, body, [file_path])
+            result = self._upload_outcome(response, body, file_path, content, version, prepared)
+            if result is not None:
+                return result
+    
+    @staticmethod
+    def _upload_bodies(file_path: str, content: str, version: int, deltas: dict, prepared: dict) -> list:
+        """单文件上传依次尝试的请求体：块列表、补丁、全文"""
+        bodies = []
+        if file_path in prepared:
+            bodies.append(prepared[file_path][0])
+        if file_path in deltas:
+            bodies.append(deltas[file_path])
+        bodies.append({
             'file_path': file_path,
             'content': content,
             'version': version
+        })
+        return bodies
+    
+    def _upload_outcome(self, response, body: dict, file_path: str, content: str, version: int,
+                        prepared: dict) -> dict:
+        """处理单文件上传一次尝试的响应
+        
+        Returns:
+            上传结果；块列表或补丁被服务端拒绝（需要改发下一个请求体）时返回 None
+            
+        Raises:
+            ConflictError: 版本冲突
+        """
+        if 'chunks' in body:
+            if response.status_code in (400, 422):
+                print(f"[Chunk] Chunks rejected for {file_path}, falling back to full upload")
+                return None
+            info = prepared[file_path][1]
+            if response.status_code == 200:
+                self._count_chunked(file_path, info, upload=True)
+            result = self._handle_upload_response(response, file_path, content)
+            result['chunks'] = info
+            return result
+        
+        if 'patch' in body:
+            if response.status_code in (400, 422):
+                # 服务端不认可基准版本，回退全文上传
+                print(f"[Delta] Base rejected for {file_path}, falling back to full upload")
+                self.bases.discard(file_path, version)
+                self.delta_stats['delta_fallbacks'] += 1
+                return None
+            sent = patch_size(body['patch'])
+        else:
+            sent = None
+        if response.status_code == 200:
+            self._count_sent(file_path, len(content.encode('utf-8')), sent)
+        return self._handle_upload_response(response, file_path, content)
+    
+    def upload_profiles_batch(self, entries: list, chunked: bool = True) -> dict:
+        """批量上传 profiles（一次请求）
+        
+        每个文件单独做版本检查，能用增量的条目发送补丁，没有补丁或补丁比缺失
+        的块还大的大文件发送块列表（缺失的块先统一上传）。服务端不支持批量接口
+        时退回逐个上传。
+        
+        Args:
+            entries: [(file_path, content, version), ...]
+            chunked: 是否允许分块上传（服务端拒绝块列表后的重试不再分块）
+            
+        Returns:
+            {file_path: 成功时为 {file_path, version, updated_at}，
+                        冲突时为 ConflictError，其他失败为 Exception}
+        """
+        if not entries:
+            return {}
+        
+        deltas = self._build_deltas(entries)
+        prepared = self._prepare_chunked(entries, deltas) if chunked else {}
+        items = self._batch_items(entries, prepared, deltas)
+        
+        response = self._post_upload(self._url('/api/profiles/batch'), {'files': items},
+                                     [item['file_path'] for item in items])
+        
+        if self._batch_unsupported(response, entries):
+            return self._upload_individually(entries)
+        
+        results, retry = self._batch_results(entries, items, prepared, response)
+        if retry:
+            results.update(self.upload_profiles_batch(retry, chunked=False))
+        return results
+    
+    def _batch_items(self, entries: list, prepared: dict, deltas: dict) -> list:
+        """批量上传的请求条目：选定分块的发送块列表，能增量的发送补丁，其余发送全文"""
+        items = []
+        for file_path, content, version in entries:
+            self.delta_stats['uploads'] += 1
+            if file_path in prepared:
+                item = prepared[file_path][0]
+            else:
+                item = deltas.get(file_path)
+            if item is None:
+                item = {'file_path': file_path, 'content': content, 'version': version}
+            items.append(item)
+        return items
+    
+    def _batch_unsupported(self, response, entries: list) -> bool:
+        """服务端没有批量接口时撤销计数，调用方改为逐个上传"""
+        if response.status_code != 404:
+            return False
+        print("[Batch] Batch endpoint not available, uploading one by one")
+        self.delta_stats['uploads'] -= len(entries)
+        return True
+    
+    def _batch_results(self, entries: list, items: list, prepared: dict, response):
+        """处理批量上传的响应
+        
+        Returns:
+            (results, retry)：retry 为块列表或补丁被拒绝、需要以全文重新上传的条目
+        """
+        if response.status_code == 403:
+            raise ApiError.from_response(response, "Batch upload failed", 'Subscription required')
+        elif response.status_code != 200:
+            raise ApiError.from_response(response, "Batch upload failed")
+        
+        results = {}
+        retry = []
+        for entry, item, outcome in zip(entries, items, response.json().get('results', [])):
+            file_path, content, version = entry
+            status = outcome.get('status')
+            if status == 200:
+                if 'chunks' in item:
+                    self._count_chunked(file_path, prepared[file_path][1], upload=True)
+                    outcome['chunks'] = prepared[file_path][1]
+                else:
+                    sent = patch_size(item['patch']) if 'patch' in item else None
+                    self._count_sent(file_path, len(content.encode('utf-8')), sent)
+                self.bases.put(file_path, outcome.get('version'), content)
+                results[file_path] = outcome
+            elif status == 409 and outcome.get('latest_content') == content:
+                results[file_path] = self._already_uploaded(file_path, content, outcome)
+            elif status == 409:
+                self.bases.put(file_path, outcome.get('latest_version'), outcome.get('latest_content', ''))
+                results[file_path] = ConflictError(
+                    outcome.get('latest_content', ''),
+                    outcome.get('latest_version', 0)
+                )
+            elif status in (400, 422) and 'patch' in item:
+                print(f"[Delta] Base rejected for {file_path}, falling back to full upload")
+                self.bases.discard(file_path, version)
+                self.delta_stats['delta_fallbacks'] += 1
+                self.delta_stats['uploads'] -= 1
+                retry.append(entry)
+            elif status in (400, 422) and 'chunks' in item:
+                print(f"[Chunk] Chunks rejected for {file_path}, falling back to full upload")
+                self.delta_stats['uploads'] -= 1
+                retry.append(entry)
+            else:
+                error = outcome.get('error', 'Unknown error')
+                results[file_path] = ApiError(f"Upload failed: {error}", status=status, error=error)
+        
+        return results, retry
+    
+    def _upload_individually(self, entries: list) -> dict:
+        """逐个上传，结果格式与 upload_profiles_batch 相同"""
+        results = {}
+        for file_path, content, version in entries:
+            try:
+                results[file_path] = self.upload_profile(file_path, content, version)
+            except Exception as e:
+                results[file_path] = e
+        return results
+    
+    def _use_chunks(self, size: int) -> bool:
+        return self.chunk_store is not None and self.chunk_supported and size >= self.chunk_min_size
+    
+    def _plan_chunked(self, entries: list, deltas: dict) -> dict:
+        """对可分块的文件分块，并把块存入本地块存储
+        
+        补丁不超过一个最小块的文件直接增量上传：分块上传至少要发送一个新块，
+        还要多两次请求。
+        
+        Returns:
+            {file_path: (content, version, data, [(chunk_id, chunk_bytes), ...])}
+        """
+        plan = {}
+        for file_path, content, version in entries:
+            data = content.encode('utf-8')
+            if not self._use_chunks(len(data)):
+                continue
+            if file_path in deltas and patch_size(deltas[file_path]['patch']) <= MIN_CHUNK_SIZE:
+                continue
+            pieces = split_chunks(data)
+            for cid, chunk in pieces:
+                self.chunk_store.put(cid, chunk)
+            plan[file_path] = (content, version, data, pieces)
+        return plan
+    
+    @staticmethod
+    def _chunked_items(plan: dict, missing: set) -> dict:
+        """根据服务端缺失的块构造上传请求体，并统计每个文件实际传输的块
+        
+        多个文件共有的块只计入第一个文件。
+        
+        Returns:
+            {file_path: (item, info)}
+        """
+        prepared = {}
+        counted = set()
+        for file_path, (content, version, data, pieces) in plan.items():
+            sent_chunks = 0
+            sent_bytes = 0
+            for cid, chunk in pieces:
+                if cid in missing and cid not in counted:
+                    counted.add(cid)
+                    sent_chunks += 1
+                    sent_bytes += len(chunk)
+            item = {
+                'file_path': file_path,
+                'version': version,
+                'chunks': [cid for cid, _ in pieces],
+                'sha256': content_digest(content)
+            }
+            info = {
+                'chunks': len(pieces),
+                'chunks_transferred': sent_chunks,
+                'bytes': len(data),
+                'bytes_transferred': sent_bytes
+            }
+            prepared[file_path] = (item, info)
+        return prepared
+    
+    def _prepare_chunked(self, entries: list, deltas: dict) -> dict:
+        """分块上传的准备：查询服务端缺少哪些块，补丁更小的文件改用增量，
+        其余文件缺少的块先上传
+        
+        Args:
+            entries: [(file_path, content, version), ...]
+            deltas: _build_deltas 的结果
+        
+        Returns:
+            {file_path: (item, info)}；没有要分块的文件或服务端不支持时为空
+        """
+        plan = self._plan_chunked(entries, deltas)
+        if not plan:
+            return {}
+        chunks = {cid: chunk for _, _, _, pieces in plan.values() for cid, chunk in pieces}
+        missing = self._find_missing_chunks(list(chunks))
+        if missing is None:
+            return {}
+        plan, needed = self._select_chunked(plan, deltas, set(missing))
+        self._send_chunks(needed)
+        return self._chunked_items(plan, set(missing))
+    
+    def _build_deltas(self, entries: list) -> dict:
+        """能增量上传的条目
+        
+        Returns:
+            {file_path: 增量上传请求体}
+        """
+        deltas = {}
+        for file_path, content, version in entries:
+            data = self._build_delta(file_path, content, version, len(content.encode('utf-8')))
+            if data is not None:
+                deltas[file_path] = data
+        return deltas
+    
+    def _select_chunked(self, plan: dict, deltas: dict, missing: set):
+        """去掉补丁不大于其缺失块的文件（这些文件改用增量上传）
+        
+        Returns:
+            (plan, needed)：needed 为剩余文件需要上传的块 {chunk_id: bytes}
+        """
+        sizes = self._chunked_items(plan, missing)
+        plan = {
+            file_path: entry for file_path, entry in plan.items()
+            if file_path not in deltas
+            or patch_size(deltas[file_path]['patch']) > sizes[file_path][1]['bytes_transferred']
         }
+        needed = {cid: chunk for _, _, _, pieces in plan.values() for cid, chunk in pieces if cid in missing}
+        return plan, needed
+    
+    def _find_missing_chunks(self, chunk_ids: list) -> list:
+        """查询服务端缺少的块；服务端不支持分块时返回 None"""
+        response = self.transport.post(self._url('/api/chunks/missing'), json={'chunks': chunk_ids},
+                                       headers=self._get_headers(), idempotent=True)
+        return self._missing_chunks_result(response)
+    
+    def _missing_chunks_result(self, response) -> list:
+        """处理缺失块查询的响应"""
+        if response.status_code == 404:
+            print("[Chunk] Chunk endpoints not available, disabling chunked transfer")
+            self.chunk_supported = False
+            return None
+        if response.status_code != 200:
+            raise ApiError.from_response(response, "Chunk query failed")
+        return response.json().get('missing', [])
+    
+    def _chunk_batches(self, chunks: dict) -> list:
+        """把块按 chunk_batch_bytes 分组"""
+        batches = []
+        batch = {}
+        size = 0
+        for cid, chunk in chunks.items():
+            if batch and size + len(chunk) > self.chunk_batch_bytes:
+                batches.append(batch)
+                batch = {}
+                size = 0
+            batch[cid] = chunk
+            size += len(chunk)
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _send_chunks(self, chunks: dict):
+        """上传块 {chunk_id: bytes}，按 chunk_batch_bytes 分批"""
+        url = self._url('/api/chunks')
+        for batch in self._chunk_batches(chunks):
+            self._check_chunks_sent(self._post_upload(url, self._chunks_body(batch), []))
+    
+    @staticmethod
+    def _chunks_body(batch: dict) -> dict:
+        """块上传请求体"""
+        return {'chunks': {cid: base64.b64encode(chunk).decode('ascii') for cid, chunk in batch.items()}}
+    
+    @staticmethod
+    def _check_chunks_sent(response):
+        if response.status_code != 200:
+            raise ApiError.from_response(response, "Chunk upload failed")
+    
+    @staticmethod
+    def _decode_chunks(payload: dict) -> dict:
+        """解码并校验服务端返回的块，ID 与内容不符的块丢弃"""
+        chunks = {}
+        for cid, encoded in payload.get('chunks', {}).items():
+            chunk = base64.b64decode(encoded)
+            if chunk_id(chunk) == cid:
+                chunks[cid] = chunk
+        return chunks
+    
+    def _fetch_chunks(self, chunk_ids: list) -> dict:
+        """下载块，按 chunk_batch_bytes（以平均块大小估算）分批
         
-        response = requests.post(url, json=data, headers=self._get_headers())
+        Returns:
+            {chunk_id: bytes}
+        """
+        url = self._url('/api/chunks/get')
+        chunks = {}
+        for ids in self._fetch_batches(chunk_ids):
+            response = self.transport.post(url, json={'chunks': ids}, headers=self._get_headers(), idempotent=True)
+            chunks.update(self._fetched_chunks(response))
+        return chunks
+    
+    def _fetch_batches(self, chunk_ids: list) -> list:
+        """把要下载的块 ID 分组，每组约 chunk_batch_bytes（按 16 KiB 平均块大小估算）"""
+        per_request = max(1, self.chunk_batch_bytes // 16384)
+        return [chunk_ids[start:start + per_request] for start in range(0, len(chunk_ids), per_request)]
+    
+    def _fetched_chunks(self, response) -> dict:
+        """处理块下载的响应"""
+        if response.status_code != 200:
+            raise ApiError.from_response(response, "Chunk download failed")
+        return self._decode_chunks(response.json())
+    
+    def _get_chunk_manifest(self, file_path: str) -> dict:
+        """获取文件的块列表；不存在或服务端不支持时返回 None"""
+        response = self.transport.get(self._url('/api/profiles/chunks', path=file_path), headers=self._get_headers())
+        return self._manifest_result(response)
+    
+    @staticmethod
+    def _manifest_result(response) -> dict:
+        """处理块列表的响应"""
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise ApiError.from_response(response, "Chunk manifest failed")
+        return response.json()
+    
+    def _missing_local_chunks(self, chunk_ids: list, dest_path: str) -> list:
+        """本地块存储中缺少的块
+        
+        有缺失时先把本地现有文件分块存入块存储：文件更新时，
+        旧版本中未变化的块不需要再下载。
+        """
+        unique = list(dict.fromkeys(chunk_ids))
+        missing = [cid for cid in unique if not self.chunk_store.has(cid)]
+        if missing and os.path.isfile(dest_path):
+            with open(dest_path, 'rb') as f:
+                for cid, chunk in split_chunks(f.read()):
+                    self.chunk_store.put(cid, chunk)
+            missing = [cid for cid in missing if not self.chunk_store.has(cid)]
+        return missing
+    
+    def _assemble_chunks(self, file_path: str, dest_path: str, manifest: dict, fetched: dict) -> dict:
+        """按块列表原子写入 dest_path
         
+        Returns:
+            与 download_profile_to 相同的结果（附带 chunks 统计）；
+            缺块或校验失败时返回 None
+        """
+        chunk_ids = manifest.get('chunks', [])
+        for cid, chunk in fetched.items():
+            self.chunk_store.put(cid, chunk)
+        writer = AtomicWriter(dest_path)
+        with writer:
+            for cid in chunk_ids:
+                chunk = fetched.get(cid)
+                if chunk is None:
+                    chunk = self.chunk_store.get(cid)
+                if chunk is None:
+                    writer.abort()
+                    return None
+                writer.write(chunk)
+            if manifest.get('sha256') and writer.sha256 != manifest['sha256']:
+                writer.abort()
+                print(f"[Chunk] Digest mismatch for {file_path}")
+                return None
+            st = writer.commit()
+        
+        info = {
+            'chunks': len(chunk_ids),
+            'chunks_transferred': len(fetched),
+            'bytes': writer.size,
+            'bytes_transferred': sum(len(chunk) for chunk in fetched.values())
+        }
+        self._count_chunked(file_path, info, upload=False)
+        return self._remember_download({
+            'file_path': file_path,
+            'version': manifest.get('version', 0),
+            'bytes': writer.size,
+            'sha256': writer.sha256,
+            'stat': st,
+            'chunks': info
+        }, dest_path)
+    
+    def _download_chunked(self, file_path: str, dest_path: str) -> dict:
+        """按块下载，本地已有的块不再下载
+        
+        Returns:
+            下载结果；服务端没有块列表或组装失败时返回 None（调用方改用整文件下载）
+        """
+        manifest = self._get_chunk_manifest(file_path)
+        if manifest is None:
+            return None
+        missing = self._missing_local_chunks(manifest.get('chunks', []), dest_path)
+        fetched = self._fetch_chunks(missing) if missing else {}
+        return self._assemble_chunks(file_path, dest_path, manifest, fetched)
+    
+    def _count_chunked(self, file_path: str, info: dict, upload: bool):
+        """记录一次分块传输"""
+        with self.chunk_lock:
+            self.chunk_stats['chunked_uploads' if upload else 'chunked_downloads'] += 1
+            self.chunk_stats['chunks_total'] += info['chunks']
+            self.chunk_stats['chunks_transferred'] += info['chunks_transferred']
+            self.chunk_stats['bytes_total'] += info['bytes']
+            self.chunk_stats['bytes_transferred'] += info['bytes_transferred']
+        if upload:
+            self.delta_stats['bytes_sent'] += info['bytes_transferred']
+            self.delta_stats['bytes_saved'] += info['bytes'] - info['bytes_transferred']
+        print(f"[Chunk] {file_path}: {'sent' if upload else 'fetched'} {info['chunks_transferred']}/{info['chunks']} "
+              f"chunks ({info['bytes_transferred']} of {info['bytes']} bytes)")
+    
+    def _count_sent(self, file_path: str, full_size: int, sent: int):
+        """记录一次成功上传的字节数，sent 为 None 表示全文上传"""
+        if sent is None:
+            self.delta_stats['bytes_sent'] += full_size
+            return
+        self.delta_stats['delta_uploads'] += 1
+        self.delta_stats['bytes_sent'] += sent
+        self.delta_stats['bytes_saved'] += full_size - sent
+        print(f"[Delta] {file_path}: sent {sent} bytes, saved {full_size - sent} bytes")
+    
+    def _post_upload(self, url: str, body: dict, file_paths: list):
+        """发送上传请求，启用限流时先等待令牌和并发名额
+        
+        上传都带版本号（块按内容寻址），响应丢失后重发最多得到一次 409，
+        因此按幂等请求重试。启用限流时 429 不在传输层重试，交给限流器退让。
+        """
+        if self.limiter is None:
+            return self.transport.post(url, json=body, headers=self._get_headers(), idempotent=True)
+        wait = self.limiter.delay(file_paths)
+        if wait > 0:
+            time.sleep(wait)
+        self.limiter.concurrency.acquire()
+        self.limiter.started()
+        started = time.monotonic()
+        response = None
+        rejected = False
+        try:
+            response = self.transport.post(url, json=body, headers=self._get_headers(), idempotent=True,
+                                           retry_statuses=LIMITED_RETRY_STATUSES)
+            return response
+        except CircuitOpenError as e:
+            # 熔断时请求根本没有发出，不能当作服务端过载的反馈
+            rejected = not e.sent
+            raise
+        finally:
+            if rejected:
+                self.limiter.cancelled()
+            else:
+                self.limiter.finished(response, time.monotonic() - started)
+    
+    def _build_delta(self, file_path: str, content: str, version: int, full_size: int) -> dict:
+        """构造增量上传请求体，不适合增量时返回 None"""
+        if not self.delta_upload:
+            return None
+        base = self.bases.get(file_path, version)
+        if not base:
+            return None
+        
+        patch = make_patch(base[1], content)
+        if patch_size(patch) > full_size * self.delta_max_ratio:
+            return None
+        
+        return {
+            'file_path': file_path,
+            'version': version,
+            'base_version': version,
+            'patch': patch,
+            'sha256': content_digest(content)
+        }
+    
+    def _handle_upload_response(self, response, file_path: str, content: str) -> dict:
+        """处理上传响应"""
         if response.status_code == 200:
-            return response.json()
+            result = response.json()
+            if 'version' in result:
+                self.bases.put(file_path, result['version'], content)
+            return result
         elif response.status_code == 409:
             result = response.json()
+            if result.get('latest_content') == content:
+                return self._already_uploaded(file_path, content, result)
+            # 服务端当前版本同样是确认过的版本，留作之后的基准
+            self.bases.put(file_path, result.get('latest_version'), result.get('latest_content', ''))
             raise ConflictError(
                 result.get('latest_content', ''),
                 result.get('latest_version', 0)
             )
         elif response.status_code == 403:
-            error = response.json().get('error', 'Subscription required')
-            raise Exception(f"Upload failed: {error}")
+            raise ApiError.from_response(response, "Upload failed", 'Subscription required')
         else:
-            error = response.json().get('error', 'Unknown error')
-            raise Exception(f"Upload failed: {error}")
+            raise ApiError.from_response(response, "Upload failed")
+    
+    def _already_uploaded(self, file_path: str, content: str, conflict: dict) -> dict:
+        """冲突响应中的云端内容与本次上传相同（通常是重试时上一次请求其实已经成功），按成功处理"""
+        version = conflict.get('latest_version')
+        self.bases.put(file_path, version, content)
+        return {'file_path': file_path, 'version': version, 'updated_at': conflict.get('updated_at')}
+    
+    def download_profile_to(self, file_path: str, dest_path: str, chunk_size: int = 65536,
+                            size: int = None) -> dict:
+        """流式下载单个 profile，边接收边写入临时文件，完成后原子替换 dest_path
+        
+        内存占用与文件大小无关。启用分块时先按块下载，只下载本地没有的块。
+        服务端没有 raw 接口时退回 JSON 下载。
+        
+        Args:
+            file_path: 文件路径
+            dest_path: 本地目标路径
+            chunk_size: 每次读取的字节数
+            size: 可选，文件列表中的大小，小于 chunk_min_size 时直接整文件下载
+            
+        Returns:
+            {file_path, version, bytes, sha256, stat}；远端不存在时返回 None
+        """
+        chunked = self._download_by_chunks(size)
+        if chunked:
+            result = self._download_chunked(file_path, dest_path)
+            if result is not None:
+                return result
+        
+        response = self.transport.get(self._url('/api/profiles/raw', path=file_path), headers=self._get_headers(),
+                                      stream=True)
+        
+        with response:
+            if response.status_code == 200:
+                writer = AtomicWriter(dest_path)
+                with writer:
+                    for chunk in response.iter_content(chunk_size):
+                        writer.write(chunk)
+                    st = writer.commit()
+                self.transport.record_stream(response, writer.size)
+                return self._streamed(file_path, dest_path, writer, st, response.headers, chunked)
+            elif response.status_code != 404:
+                raise ApiError.from_response(response, "Download failed")
+        
+        return self._write_downloaded(file_path, dest_path, self.get_profiles(file_path).get('files', []))
+    
+    def _download_by_chunks(self, size: int = None) -> bool:
+        """下载前是否先尝试按块下载（size 未知时也尝试）"""
+        return self.chunk_store is not None and self.chunk_supported and (size is None or self._use_chunks(size))
+    
+    def _streamed(self, file_path: str, dest_path: str, writer: AtomicWriter, st: os.stat_result,
+                  headers, chunked: bool) -> dict:
+        """整文件流式下载完成后的结果"""
+        if chunked and self._use_chunks(writer.size):
+            # 文件存在却无法按块下载（没有块列表或块校验失败），停用分块
+            print("[Chunk] Chunk manifests not available, disabling chunked transfer")
+            self.chunk_supported = False
+        return self._remember_download({
+            'file_path': file_path,
+            'version': int(headers.get('X-Profile-Version') or 0),
+            'bytes': writer.size,
+            'sha256': writer.sha256,
+            'stat': st
+        }, dest_path)
+    
+    def _remember_download(self, result: dict, dest_path: str) -> dict:
+        """把流式下载得到的版本记入基准缓存（过大的文件不缓存）"""
+        if result.get('version'):
+            self.bases.put_file(result['file_path'], result['version'], dest_path)
+        return result
+    
+    def _write_downloaded(self, file_path: str, dest_path: str, files: list) -> dict:
+        """把 JSON 下载得到的内容原子写入 dest_path"""
+        if not files:
+            return None
+        entry = files[0]
+        data = entry.get('content', '').encode('utf-8')
+        st, sha256 = atomic_write_bytes(dest_path, data)
+        return {
+            'file_path': file_path,
+            'version': entry.get('version', 0),
+            'bytes': len(data),
+            'sha256': sha256,
+            'stat': st
+        }
+    
+    def _url(self, endpoint: str, **params) -> str:
+        """接口地址，附带值不为 None 的查询参数"""
+        return self.cloud_url + endpoint + self._query(**params)
+    
+    @staticmethod
+    def _query(**params) -> str:
+        """构造查询字符串，忽略值为 None 的参数"""
+        params = {key: value for key, value in params.items() if value is not None}
+        return '?' + urlencode(params) if params else ''
+    
+    def _remember_bases(self, files: list):
+        """记录下载得到的内容作为增量基准"""
+        for item in files:
+            if 'content' in item and 'version' in item and item.get('file_path'):
+                self.bases.put(item['file_path'], item['version'], item['content'])
     
     def sync_profiles(self, since: str = '0') -> dict:
         """增量同步 profiles
@@ -86,25 +760,35 @@ class ProfilesClient:
             
         Returns:
             包含 files 列表和 server_time 的字典
+            
+        Raises:
+            CursorExpiredError: 服务端不再接受该游标，需要全量同步
         """
-        url = f"{self.cloud_url}/api/profiles/sync?since={since}"
-        
-        response = requests.get(url, headers=self._get_headers())
-        
+        response = self.transport.get(self._url('/api/profiles/sync', since=since), headers=self._get_headers())
+        return self._sync_result(response)
+    
+    def _sync_result(self, response) -> dict:
+        """处理 sync_profiles 的响应"""
         if response.status_code == 200:
-            return response.json()
+            result = response.json()
+            self._remember_bases(result.get('files', []))
+            return result
+        elif response.status_code in (400, 410):
+            raise CursorExpiredError.from_response(response, "Sync failed", 'Invalid cursor')
         elif response.status_code == 403:
-            error = response.json().get('error', 'Subscription required')
-            raise Exception(f"Sync failed: {error}")
+            raise ApiError.from_response(response, "Sync failed", 'Subscription required')
         else:
-            error = response.json().get('error', 'Unknown error')
-            raise Exception(f"Sync failed: {error}")
+            raise ApiError.from_response(response, "Sync failed")
+
+
+class CursorExpiredError(ApiError):
+    """增量同步游标无效或已过期"""
 
 
-class ConflictError(Exception):
+class ConflictError(ApiError):
     """版本冲突异常"""
     
     def __init__(self, latest_content: str, latest_version: int):
         self.latest_content = latest_content
         self.latest_version = latest_version
-        super().__init__(f"Version conflict: latest version is {latest_version}")
+        super().__init__(f"Version conflict: latest version is {latest_version}", status=409)
@@ -0,0 +1,252 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from resilience import RETRY_STATUSES
+
+# 受限流器管理的上传在传输层重试的状态：429 交给 UploadLimiter.finished
+# 处理（暂停令牌桶、收缩并发窗口），传输层自己重试会让限流器看不到它
+LIMITED_RETRY_STATUSES = RETRY_STATUSES - {429}
+
+
+class TokenBucket:
+    """令牌桶
+
+    以 rate 个/秒的速度补充令牌，最多积累 burst 个。reserve 允许透支：
+    令牌不足时照样扣除并返回需要等待的秒数，调用方等待后发送，
+    先到的请求先轮到。rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """预留令牌
+
+        Returns:
+            需要等待的秒数（0 表示可以立即发送）
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """在接下来的 seconds 秒内不发放令牌（服务端返回 Retry-After 时）"""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class PathBuckets:
+    """每个路径一个令牌桶，只保留最近使用的 max_paths 个"""
+
+    def __init__(self, rate: float, burst: float = None, max_paths: int = 4096):
+        self.rate = rate
+        self.burst = burst
+        self.max_paths = max_paths
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def reserve(self, file_paths: list) -> float:
+        """为每个路径预留一个令牌，返回其中最长的等待时间"""
+        if self.rate <= 0:
+            return 0.0
+        wait = 0.0
+        for file_path in file_paths:
+            with self.lock:
+                bucket = self.buckets.get(file_path)
+                if bucket is None:
+                    bucket = self.buckets[file_path] = TokenBucket(self.rate, self.burst)
+                    if len(self.buckets) > self.max_paths:
+                        self.buckets.popitem(last=False)
+                else:
+                    self.buckets.move_to_end(file_path)
+            wait = max(wait, bucket.reserve())
+        return wait
+
+
+class AdaptiveConcurrency:
+    """AIMD 自适应并发上限
+
+    正常响应时上限加性增长（每完成约 limit 个请求加 1）；遇到 429、5xx、
+    网络错误，或延迟超过基线的 latency_tolerance 倍时乘性减小。
+    同一轮拥塞只减小一次。
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 backoff: float = 0.5, latency_tolerance: float = 3.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.cond = threading.Condition()
+        self.stats = {'increases': 0, 'decreases': 0, 'waits': 0}
+
+    def try_acquire(self) -> bool:
+        """不等待地占用一个并发名额"""
+        with self.cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: float = None) -> bool:
+        """占用一个并发名额，已满时等待"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            if self.in_flight >= int(self.limit):
+                self.stats['waits'] += 1
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def cancel(self):
+        """释放没有发出的请求占用的名额，不调整上限"""
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def release(self, status: int, latency: float):
+        """释放名额并根据结果调整上限
+
+        Args:
+            status: HTTP 状态码；网络错误时为 None
+            latency: 请求耗时（秒）
+        """
+        now = time.monotonic()
+        with self.cond:
+            self.in_flight -= 1
+            overloaded = status is None or status == 429 or status >= 500
+            slow = (self.baseline is not None
+                    and latency > max(self.baseline * self.latency_tolerance, self.baseline + 0.25))
+            if overloaded or slow:
+                # 减小后，在途请求（发出于拥塞期间）的结果不再重复减小
+                if now - self.last_decrease > max(latency, 1.0):
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self.last_decrease = now
+                    self.stats['decreases'] += 1
+            else:
+                if self.limit < self.max_limit:
+                    before = int(self.limit)
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+                    if int(self.limit) > before:
+                        self.stats['increases'] += 1
+                if status is not None and status < 400:
+                    self.baseline = latency if self.baseline is None else self.baseline * 0.9 + latency * 0.1
+            self.cond.notify_all()
+
+
+class UploadLimiter:
+    """上传限流：全局令牌桶（按请求）+ 每路径令牌桶（按文件）+ 自适应并发"""
+
+    def __init__(self, rate: float = 5.0, burst: float = 10, path_rate: float = 1.0, path_burst: float = 3,
+                 concurrency: int = 4, min_concurrency: int = 1, max_concurrency: int = 16):
+        self.bucket = TokenBucket(rate, burst)
+        self.paths = PathBuckets(path_rate, path_burst)
+        self.concurrency = AdaptiveConcurrency(concurrency, min_concurrency, max_concurrency)
+        self.lock = threading.Lock()
+        self.sent = deque()
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'throttled_seconds': 0.0,
+            'rate_limited': 0
+        }
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'UploadLimiter':
+        return cls(
+            rate=config.get('upload_rate', 5.0),
+            burst=config.get('upload_burst', 10),
+            path_rate=config.get('path_upload_rate', 1.0),
+            path_burst=config.get('path_upload_burst', 3),
+            concurrency=config.get('upload_concurrency', 4),
+            min_concurrency=config.get('upload_concurrency_min', 1),
+            max_concurrency=config.get('upload_concurrency_max', 16)
+        )
+
+    def delay(self, file_paths: list) -> float:
+        """为一次上传请求预留令牌
+
+        Returns:
+            发送前需要等待的秒数
+        """
+        wait = max(self.bucket.reserve(), self.paths.reserve(file_paths))
+        if wait > 0:
+            with self.lock:
+                self.stats['throttled'] += 1
+                self.stats['throttled_seconds'] += wait
+        return wait
+
+    def started(self):
+        """记录一次发出的请求（用于统计实际速率）"""
+        now = time.monotonic()
+        with self.lock:
+            self.stats['requests'] += 1
+            self.sent.append(now)
+            while self.sent and self.sent[0] < now - 10:
+                self.sent.popleft()
+
+    def cancelled(self):
+        """请求在本地被拒绝（如熔断），没有访问服务端：只释放并发名额"""
+        with self.lock:
+            self.stats['requests'] -= 1
+            if self.sent:
+                self.sent.pop()
+        self.concurrency.cancel()
+
+    def finished(self, response, latency: float):
+        """请求结束：调整并发上限；429 时按 Retry-After 暂停发放令牌
+
+        Args:
+            response: 响应；网络错误时为 None
+            latency: 请求耗时（秒）
+        """
+        status = response.status_code if response is not None else None
+        if status == 429:
+            with self.lock:
+                self.stats['rate_limited'] += 1
+            try:
+                retry_after = float(response.headers.get('Retry-After') or 1)
+            except ValueError:
+                retry_after = 1.0
+            self.bucket.pause(min(retry_after, 300.0))
+        self.concurrency.release(status, latency)
+
+    def get_stats(self) -> dict:
+        """当前速率、并发上限和限流次数"""
+        now = time.monotonic()
+        with self.lock:
+            stats = dict(self.stats)
+            recent = sum(1 for sent_at in self.sent if sent_at >= now - 10)
+        stats['rate'] = round(recent / 10, 2)
+        stats['rate_limit'] = self.bucket.rate
+        stats['path_rate_limit'] = self.paths.rate
+        with self.concurrency.cond:
+            stats['concurrency_limit'] = int(self.concurrency.limit)
+            stats['in_flight'] = self.concurrency.in_flight
+            stats['latency_baseline'] = round(self.concurrency.baseline, 4) if self.concurrency.baseline else None
+            stats.update(self.concurrency.stats)
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 3)
+        return stats
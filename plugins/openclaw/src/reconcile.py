@@ -0,0 +1,228 @@
+import hashlib
+import os
+import time
+
+from fsutil import file_sha256
+from ignore import IgnoreMatcher
+
+
+class Reconciler:
+    """启动时的离线对账
+
+    插件停止期间本地和云端都可能发生变化。启动时先用 os.scandir 遍历监听路径，
+    用清单中记录的 (size, mtime, inode) 找出可能变化的文件，只对这些文件计算哈希；
+    再与云端版本号对比，得到 push / pull / conflict 计划并执行。
+    没有任何变化时（清单是热的）不读取任何文件内容，也不下载云端内容。
+    """
+
+    def __init__(self, profile_sync, watch_paths: list, ignore: IgnoreMatcher = None,
+                 push_batch_size: int = 50):
+        self.profile_sync = profile_sync
+        self.manifest = profile_sync.manifest
+        self.version_manager = profile_sync.version_manager
+        self.workspace = profile_sync.workspace
+        self.watch_paths = watch_paths
+        self.ignore = ignore or IgnoreMatcher()
+        self.push_batch_size = max(1, push_batch_size)
+
+    def scan(self) -> dict:
+        """遍历监听路径（跳过被忽略的目录和文件）
+
+        Returns:
+            {相对路径: stat}
+        """
+        local = {}
+        stack = []
+        for watch_path in self.watch_paths:
+            full_path = os.path.join(self.workspace, watch_path)
+            if watch_path.endswith('/'):
+                if os.path.isdir(full_path):
+                    stack.append((full_path, watch_path.rstrip('/')))
+            elif os.path.isfile(full_path) and not self.ignore.matches(watch_path):
+                local[watch_path] = os.stat(full_path)
+
+        while stack:
+            directory, relative_dir = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative_path = relative_dir + '/' + entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.ignore.matches(relative_path, True):
+                                stack.append((entry.path, relative_path))
+                        elif entry.is_file(follow_symlinks=False):
+                            if not self.ignore.matches(relative_path):
+                                local[relative_path] = entry.stat(follow_symlinks=False)
+            except OSError as e:
+                print(f"[Reconcile] Cannot scan {directory}: {e}")
+        return local
+
+    def _in_scope(self, file_path: str) -> bool:
+        """路径是否属于监听范围"""
+        for watch_path in self.watch_paths:
+            if watch_path.endswith('/'):
+                if file_path.startswith(watch_path):
+                    return not self.ignore.matches(file_path)
+            elif file_path == watch_path:
+                return True
+        return False
+
+    def find_local_changes(self, local: dict) -> tuple:
+        """找出自上次同步后内容真正变化的本地文件
+
+        Returns:
+            ({相对路径: sha256}, 计算过哈希的文件数)
+        """
+        changed = {}
+        hashed = 0
+        for file_path, st in local.items():
+            if self.manifest.stat_matches(file_path, st):
+                continue
+            hashed += 1
+            try:
+                sha256 = file_sha256(os.path.join(self.workspace, file_path))
+            except OSError:
+                continue
+            if self.manifest.hash_matches(file_path, sha256):
+                # 只是 mtime/inode 变了（touch、复制回来等），刷新 stat 即可
+                self.manifest.record(file_path, st, sha256)
+            else:
+                changed[file_path] = sha256
+        return changed, hashed
+
+    def list_remote(self, local: dict) -> tuple:
+        """云端文件列表
+
+        有游标时只取版本号，需要拉取或可能冲突的文件（云端版本比本地新或本地没有）
+        用一次增量请求补上内容；没有游标（首次运行）时一次取回全部内容。
+
+        Returns:
+            (files, server_time)：server_time 为对账完成后可以保存的游标，
+            没有取增量时为 None
+        """
+        if not self.profile_sync.cursor:
+            return self.profile_sync.list_remote_files(), None
+        if self.profile_sync.cursor.get() is None:
+            return self.profile_sync.remote_snapshot()
+        remote_files = self.profile_sync.list_remote_versions()
+        wanted = {
+            entry['file_path'] for entry in remote_files
+            if entry.get('file_path') and 'content' not in entry
+            and (entry['file_path'] not in local
+                 or entry.get('version', 0) > self.version_manager.get_version(entry['file_path']))
+        }
+        return self.profile_sync.fill_remote_contents(remote_files, wanted)
+
+    def build_plan(self, local: dict, changed: dict, remote_files: list) -> dict:
+        """对比本地变化和云端版本，生成同步计划
+
+        Returns:
+            {push: [路径], pull: [云端条目], conflicts: [云端条目],
+             identical: [(云端条目, stat, sha256)], missing: [路径]}
+        """
+        plan = {'push': [], 'pull': [], 'conflicts': [], 'identical': [], 'missing': []}
+        remote_paths = set()
+
+        for entry in remote_files:
+            file_path = entry.get('file_path')
+            if not file_path:
+                continue
+            remote_paths.add(file_path)
+            remote_changed = entry.get('version', 0) > self.version_manager.get_version(file_path)
+
+            if file_path in changed:
+                if not remote_changed:
+                    plan['push'].append(file_path)
+                    continue
+                content = entry.get('content')
+                if content is not None and hashlib.sha256(content.encode('utf-8')).hexdigest() == changed[file_path]:
+                    # 两边改成了相同的内容，只需记录版本号
+                    plan['identical'].append((entry, local[file_path], changed[file_path]))
+                else:
+                    plan['conflicts'].append(entry)
+            elif remote_changed or file_path not in local:
+                if file_path not in local and self.manifest.get(file_path) and self._in_scope(file_path):
+                    # 删除不会同步到云端，离线期间删除的文件从云端恢复
+                    plan['missing'].append(file_path)
+                plan['pull'].append(entry)
+
+        # 云端没有的本地新文件
+        for file_path in changed:
+            if file_path not in remote_paths:
+                plan['push'].append(file_path)
+        return plan
+
+    def apply(self, plan: dict) -> dict:
+        """执行同步计划
+
+        Returns:
+            {pulled, pull_errors, pushed, push_errors, merged, conflicts}
+        """
+        summary = {'pulled': 0, 'pull_errors': 0, 'pushed': 0, 'push_errors': 0, 'merged': 0, 'conflicts': 0}
+
+        for entry, st, sha256 in plan['identical']:
+            self.profile_sync.mark_synced(entry['file_path'], entry.get('version', 0), st, sha256)
+
+        if plan['pull']:
+            pulled = self.profile_sync.pull_files(plan['pull'])
+            summary['pulled'] = pulled['files']
+            summary['pull_errors'] = pulled['errors']
+
+        push = plan['push']
+        for start in range(0, len(push), self.push_batch_size):
+            results = self.profile_sync.push_files(push[start:start + self.push_batch_size])
+            for result in results.values():
+                if isinstance(result, Exception):
+                    summary['push_errors'] += 1
+                else:
+                    summary['pushed'] += 1
+
+        for entry in plan['conflicts']:
+            file_path = entry['file_path']
+            if self.profile_sync.resolve_conflict(file_path, entry.get('content'), entry.get('version', 0)):
+                summary['merged'] += 1
+            else:
+                summary['conflicts'] += 1
+                print(f"[Reconcile] Conflict, changed both locally and in cloud, left untouched: {file_path}")
+
+        self.profile_sync.flush()
+        return summary
+
+    def run(self) -> dict:
+        """扫描、对账并执行
+
+        Returns:
+            计划和执行结果的统计
+        """
+        print("[Reconcile] Scanning workspace for offline changes...")
+        started = time.monotonic()
+        local = self.scan()
+        changed, hashed = self.find_local_changes(local)
+        scanned_at = time.monotonic()
+
+        remote_files, server_time = self.list_remote(local)
+        plan = self.build_plan(local, changed, remote_files)
+        planned_at = time.monotonic()
+
+        summary = {
+            'scanned': len(local),
+            'hashed': hashed,
+            'local_changes': len(changed),
+            'push': len(plan['push']),
+            'pull': len(plan['pull']),
+            'missing': len(plan['missing']),
+            'identical': len(plan['identical']),
+            'scan_seconds': round(scanned_at - started, 3),
+            'plan_seconds': round(planned_at - scanned_at, 3)
+        }
+        print(f"[Reconcile] Scanned {summary['scanned']} files in {summary['scan_seconds']}s "
+              f"(hashed {hashed}): push {summary['push']}, pull {summary['pull']}, "
+              f"conflicts {len(plan['conflicts'])}")
+
+        summary.update(self.apply(plan))
+        # 游标之后的云端变化已经处理，之后的增量同步不必重新下载；
+        # 有文件写入失败时不前移，由增量同步重试
+        if server_time and not summary['pull_errors']:
+            self.profile_sync.cursor.set(server_time)
+        summary['seconds'] = round(time.monotonic() - started, 3)
+        return summary
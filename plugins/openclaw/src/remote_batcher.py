@@ -0,0 +1,108 @@
+import threading
+import time
+
+
+class RemoteChangeBatcher:
+    """远端变化通知合并器
+
+    WebSocket 线程只把通知放进缓冲区就返回；后台线程在第一条通知到达
+    window 秒后，把这段时间内的通知（每个路径只保留最高版本）一次交给
+    dispatch 处理。dispatch 接收 {file_path: version}，只有 new_memory 之类
+    不带路径的通知时为空字典。
+    """
+
+    def __init__(self, dispatch, window: float = 0.5):
+        self.dispatch = dispatch
+        self.window = window
+        self.pending = {}
+        self.sync_requested = False
+        self.first_at = None
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.stats = {
+            'notifications': 0,
+            'superseded': 0,
+            'batches': 0,
+            'errors': 0
+        }
+
+    def start(self):
+        """启动后台线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止；已收到但还在窗口内的通知立即处理完再返回"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join()
+
+    def add(self, file_path: str, version: int = None):
+        """加入一条 file_updated 通知"""
+        with self.cond:
+            self.stats['notifications'] += 1
+            if file_path in self.pending:
+                self.stats['superseded'] += 1
+                current = self.pending[file_path]
+                if current is not None and (version is None or version > current):
+                    self.pending[file_path] = version
+            else:
+                self.pending[file_path] = version
+            self._mark()
+
+    def request_sync(self):
+        """加入一条不带路径的通知（如 new_memory）"""
+        with self.cond:
+            self.stats['notifications'] += 1
+            self.sync_requested = True
+            self._mark()
+
+    def _mark(self):
+        if self.first_at is None:
+            self.first_at = time.monotonic()
+        self.cond.notify_all()
+
+    def _next_batch(self):
+        """等待窗口结束，返回 {file_path: version}
+
+        停止时不再等待窗口，立即返回缓冲区中的通知；没有通知时返回 None。
+        """
+        with self.cond:
+            while self.running and self.first_at is None:
+                self.cond.wait()
+            while self.running:
+                remaining = self.first_at + self.window - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            if self.first_at is None:
+                return None
+
+            batch = self.pending
+            self.pending = {}
+            self.sync_requested = False
+            self.first_at = None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self.stats['batches'] += 1
+            try:
+                self.dispatch(batch)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"[Remote] Sync error: {e}")
+
+    def get_stats(self) -> dict:
+        """获取合并统计"""
+        with self.cond:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.pending)
+            return stats
@@ -0,0 +1,324 @@
+"""
+请求重试与熔断
+
+Transport / AsyncTransport 的每个请求都经过这里：幂等请求在网络错误、
+超时、429 和 502/503/504 时按指数退避加 jitter 重试；同一主机连续失败
+达到阈值后熔断，熔断期间请求立即失败，不再占用线程等待超时。
+"""
+
+import json
+import threading
+import time
+
+from backoff import backoff_delay
+
+
+# 没有额外标记时视为幂等、可以安全重发的方法
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+# 值得重试的响应状态（服务端过载或网关暂时不可用）
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class ApiError(Exception):
+    """API 请求失败
+
+    Attributes:
+        status: HTTP 状态码；网络错误、超时或熔断时为 None
+        error: 服务端返回的错误信息
+        retryable: 稍后重试是否可能成功
+    """
+
+    def __init__(self, message: str, status: int = None, error: str = None):
+        super().__init__(message)
+        self.status = status
+        self.error = error
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status == 429 or self.status >= 500
+
+    @classmethod
+    def from_response(cls, response, action: str, default: str = 'Unknown error') -> 'ApiError':
+        """根据非 2xx 响应构造异常，消息格式为 "{action}: {error}"
+
+        Args:
+            response: requests.Response 或 AsyncResponse
+            action: 失败的操作，如 "Upload failed"
+            default: 响应中没有错误信息时使用
+        """
+        error = error_message(response, default)
+        return cls(f"{action}: {error}", status=response.status_code, error=error)
+
+
+class CircuitOpenError(ApiError):
+    """熔断期间请求被直接拒绝
+
+    Attributes:
+        sent: 被拒绝前同一请求是否已经发出过（重试期间熔断）；为 False 时
+              服务端完全没有被访问
+    """
+
+    sent = False
+
+
+def error_message(response, default: str = 'Unknown error') -> str:
+    """从错误响应中取出错误信息
+
+    JSON 响应取 error / message 字段；HTML 错误页（反向代理、网关）或其他
+    非 JSON 内容不解析，返回状态码和截断后的正文。
+    """
+    try:
+        content = response.content or b''
+    except Exception:
+        content = b''
+    content_type = (response.headers.get('Content-Type') or '').lower()
+    if content and 'html' not in content_type:
+        try:
+            payload = json.loads(content.decode('utf-8'))
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            error = payload.get('error') or payload.get('message')
+            if error:
+                return str(error)
+            return default
+    if not content or 'html' in content_type or content.lstrip()[:1] == b'<':
+        return f"{default} (HTTP {response.status_code})"
+    text = content[:200].decode('utf-8', errors='replace').strip()
+    return f"{default} (HTTP {response.status_code}: {text})"
+
+
+def retry_after_seconds(response) -> float:
+    """响应头 Retry-After 的秒数（只支持秒数形式），没有时返回 None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class RetryPolicy:
+    """重试策略
+
+    幂等请求（GET 等，或调用方标记为幂等的 POST）在网络错误、超时和
+    RETRY_STATUSES 时重试；非幂等请求只在连接没有建立（请求肯定没有发出）
+    时重试。等待时间为 backoff_delay（full jitter），服务端给出 Retry-After
+    时取两者中较大者；Retry-After 超过 cap 时不再重试，交给调用方处理。
+    """
+
+    def __init__(self, max_attempts: int = 3, base: float = 0.5, cap: float = 10.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base = base
+        self.cap = cap
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'RetryPolicy':
+        return cls(
+            max_attempts=config.get('http_retries', 2) + 1,
+            base=config.get('http_retry_base', 0.5),
+            cap=config.get('http_retry_max', 10.0)
+        )
+
+    @staticmethod
+    def is_idempotent(method: str, idempotent: bool = None) -> bool:
+        if idempotent is not None:
+            return idempotent
+        return method.upper() in IDEMPOTENT_METHODS
+
+    def response_delay(self, attempt: int, response, idempotent: bool,
+                       statuses: frozenset = RETRY_STATUSES) -> float:
+        """收到响应后是否重试
+
+        Args:
+            attempt: 已完成的尝试次数（从 1 开始）
+            statuses: 值得重试的响应状态
+
+        Returns:
+            重试前等待的秒数；不重试时返回 None
+        """
+        if not idempotent or attempt >= self.max_attempts or response.status_code not in statuses:
+            return None
+        delay = backoff_delay(attempt - 1, self.base, self.cap)
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            if retry_after > self.cap:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    def error_delay(self, attempt: int, idempotent: bool, sent: bool) -> float:
+        """请求异常（网络错误、超时）后是否重试
+
+        Args:
+            attempt: 已完成的尝试次数（从 1 开始）
+            idempotent: 请求是否幂等
+            sent: 请求是否可能已经发出（连接建立之后才失败）
+
+        Returns:
+            重试前等待的秒数；不重试时返回 None
+        """
+        if attempt >= self.max_attempts or (sent and not idempotent):
+            return None
+        return backoff_delay(attempt - 1, self.base, self.cap)
+
+
+class CircuitBreaker:
+    """单个主机的熔断器
+
+    closed：正常放行，连续失败（网络错误、超时、5xx）达到 failure_threshold
+    次后进入 open；open：reset_timeout 秒内所有请求立即失败；之后进入
+    half-open：只放行一个探测请求，成功则恢复 closed，失败则重新 open。
+    探测结果超过 reset_timeout 仍未回报时（请求被取消等）放行新的探测，
+    避免熔断器一直停在 half-open。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'opened': 0, 'rejected': 0}
+
+    def allow(self) -> float:
+        """请求前检查
+
+        Returns:
+            0 表示放行；否则为距离下一次探测的秒数（请求应立即失败）
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            now = time.monotonic()
+            remaining = self.opened_at + self.reset_timeout - now
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    remaining = self.probe_started + self.reset_timeout - now
+                if not self.probing or remaining <= 0:
+                    self.probing = True
+                    self.probe_started = now
+                    return 0.0
+            self.stats['rejected'] += 1
+            return max(remaining, 0.1)
+
+    def release(self):
+        """放行的请求没有结果（被取消或本地出错），允许下一个请求探测"""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                print("[Circuit] Server reachable again, closing circuit")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                and self.failures >= self.failure_threshold):
+                if self.state == self.CLOSED:
+                    print(f"[Circuit] {self.failures} consecutive failures, "
+                          f"failing fast for {self.reset_timeout}s")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+                self.stats['opened'] += 1
+
+
+class Resilience:
+    """传输层共用的超时、重试策略和按主机划分的熔断器"""
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 retry: RetryPolicy = None, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry = retry or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.stats = {'retries': 0, 'timeouts': 0, 'network_errors': 0}
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'Resilience':
+        """根据 config.json 创建；circuit_failure_threshold 为 0 时不熔断"""
+        return cls(
+            connect_timeout=config.get('http_connect_timeout', 5.0),
+            read_timeout=config.get('http_read_timeout', 30.0),
+            retry=RetryPolicy.from_config(config),
+            failure_threshold=config.get('circuit_failure_threshold', 5),
+            reset_timeout=config.get('circuit_reset_seconds', 30.0)
+        )
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        """该主机的熔断器；不熔断时返回 None"""
+        if not self.failure_threshold:
+            return None
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def check(self, host: str, method: str, path: str):
+        """熔断期间直接抛出 CircuitOpenError"""
+        breaker = self.breaker(host)
+        wait = breaker.allow() if breaker else 0.0
+        if wait:
+            raise CircuitOpenError(f"{method} {path} failed: server unavailable, "
+                                   f"circuit open for another {wait:.1f}s")
+
+    def record_response(self, host: str, status: int):
+        """5xx 计为失败；其他响应（包括 429）说明服务端在线"""
+        breaker = self.breaker(host)
+        if breaker is None:
+            return
+        if status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def release(self, host: str):
+        """check 放行的请求没有可回报的结果时调用"""
+        breaker = self.breaker(host)
+        if breaker is not None:
+            breaker.release()
+
+    def record_error(self, host: str, timeout: bool):
+        with self.lock:
+            self.stats['timeouts' if timeout else 'network_errors'] += 1
+        breaker = self.breaker(host)
+        if breaker is not None:
+            breaker.record_failure()
+
+    def count_retry(self):
+        with self.lock:
+            self.stats['retries'] += 1
+
+    def get_stats(self) -> dict:
+        """重试、超时次数和各主机的熔断状态"""
+        with self.lock:
+            stats = dict(self.stats)
+            breakers = dict(self.breakers)
+        stats['circuits'] = {}
+        for host, breaker in breakers.items():
+            with breaker.lock:
+                stats['circuits'][host] = {'state': breaker.state, **breaker.stats}
+        return stats
@@ -0,0 +1,626 @@
+#!/usr/bin/env python3
+"""
+SoulSync 云端 API 本地替身
+
+在进程内实现 /api/auth/device、/api/memories、/api/profiles、/api/chunks 系列接口和
+/ws 推送，用于离线调试、测试和性能测试同步逻辑。也可以单独运行：
+
+    python stub_server.py --port 3000
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from chunking import split_chunks, chunk_id
+from delta import apply_patch, content_digest, PatchError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESS_MIN_BYTES = 1024
+
+# RFC 6455 握手使用的固定 GUID
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+WS_TEXT = 0x1
+WS_CLOSE = 0x8
+WS_PING = 0x9
+WS_PONG = 0xA
+
+
+def _ws_frame(opcode: int, payload: bytes) -> bytes:
+    """服务端发出的 WebSocket 帧（不分片、不加掩码）"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class StubSocket:
+    """一个已建立的 WebSocket 连接，可以从其他线程推送消息"""
+
+    def __init__(self, connection, wfile):
+        self.connection = connection
+        self.wfile = wfile
+        self.socket_id = uuid.uuid4().hex[:12]
+        self.authenticated = False
+        self.lock = threading.Lock()
+
+    def send_frame(self, opcode: int, payload: bytes) -> bool:
+        with self.lock:
+            try:
+                self.wfile.write(_ws_frame(opcode, payload))
+                self.wfile.flush()
+                return True
+            except (OSError, ValueError):
+                return False
+
+    def send(self, message: dict) -> bool:
+        return self.send_frame(WS_TEXT, json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+    def close(self):
+        """发送关闭帧并断开连接（服务器停止时）"""
+        self.send_frame(WS_CLOSE, struct.pack('!H', 1001))
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class StubState:
+    """替身服务器的内存状态"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = {}
+        # 内容寻址的块存储和每个文件当前版本的块列表
+        self.chunks = {}
+        self.profile_chunks = {}
+        self.memory = {'content': '', 'version': 0}
+        self.tokens = {}
+        # 已认证的 WebSocket 连接，文件更新时推送 file_updated
+        self.sockets = []
+        self.last_time = 0
+        self.stats = {
+            'requests': 0,
+            'uploads': 0,
+            'batches': 0,
+            'delta_uploads': 0,
+            'chunked_uploads': 0,
+            'chunks_received': 0,
+            'bytes_received': 0,
+            'bytes_sent': 0,
+            'ws_connections': 0,
+            'ws_notifications': 0
+        }
+
+    def next_time(self) -> int:
+        """单调递增的毫秒时间戳"""
+        now = int(time.time() * 1000)
+        self.last_time = max(now, self.last_time + 1)
+        return self.last_time
+
+    def put_profile(self, file_path: str, content: str, chunk_ids: list = None) -> dict:
+        """写入文件并返回新记录（调用方持有锁）
+
+        没有给出块列表时对内容分块，之后的分块上传可以复用这些块。
+        """
+        if chunk_ids is None:
+            chunk_ids = []
+            for cid, chunk in split_chunks(content.encode('utf-8')):
+                self.chunks.setdefault(cid, chunk)
+                chunk_ids.append(cid)
+        self.profile_chunks[file_path] = chunk_ids
+        current = self.profiles.get(file_path)
+        record = {
+            'file_path': file_path,
+            'content': content,
+            'version': (current['version'] if current else 0) + 1,
+            'updated_at': self.next_time()
+        }
+        self.profiles[file_path] = record
+        return record
+
+    def notify(self, message: dict):
+        """向所有已认证的 WebSocket 连接推送消息（不要在持有锁时调用）"""
+        with self.lock:
+            sockets = list(self.sockets)
+        sent = sum(1 for sock in sockets if sock.send(message))
+        with self.lock:
+            self.stats['ws_notifications'] += sent
+
+    def notify_file(self, record: dict):
+        """推送一次文件更新"""
+        self.notify({
+            'event': 'file_updated',
+            'file_path': record['file_path'],
+            'version': record['version'],
+            'updated_at': record['updated_at']
+        })
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """请求处理"""
+
+    protocol_version = 'HTTP/1.1'
+    # 响应头和正文分两次写出，开启 Nagle 时会与客户端的延迟 ACK 叠加出约 40ms 的等待
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with self.state.lock:
+            self.state.stats['bytes_received'] += length
+
+        encoding = self.headers.get('Content-Encoding', '').lower()
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'zstd' and zstandard is not None:
+            body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return body
+
+    def _read_json(self) -> dict:
+        body = self._read_body()
+        return json.loads(body.decode('utf-8')) if body else {}
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self._send_body(status, body, 'application/json')
+
+    def _send_body(self, status: int, body: bytes, content_type: str, extra_headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Accept-Encoding', 'zstd, gzip' if zstandard is not None else 'gzip')
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+
+        accepted = self.headers.get('Accept-Encoding', '')
+        if len(body) >= COMPRESS_MIN_BYTES and 'gzip' in accepted:
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.stats['bytes_sent'] += len(body)
+
+    def _authorized(self) -> bool:
+        auth = self.headers.get('Authorization', '')
+        token = auth[len('Bearer '):] if auth.startswith('Bearer ') else None
+        if token and token in self.state.tokens:
+            return True
+        self._send_json(401, {'error': 'Unauthorized'})
+        return False
+
+    def _route(self, method: str):
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        with self.state.lock:
+            self.state.stats['requests'] += 1
+
+        handler = self.ROUTES.get((method, parsed.path))
+        if not handler:
+            self._read_body()
+            self._send_json(404, {'error': f'Not found: {parsed.path}'})
+            return
+        if parsed.path not in ('/api/auth/device', '/ws') and not self._authorized():
+            return
+        handler(self, query)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    # ---- /api/auth ----
+
+    def handle_auth(self, query):
+        data = self._read_json()
+        if not data.get('email') or not data.get('password'):
+            self._send_json(400, {'error': 'Email and password required'})
+            return
+        token = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.tokens[token] = data['email']
+        self._send_json(200, {'token': token, 'user_id': data['email']})
+
+    def handle_user_profile(self, query):
+        email = self.state.tokens.get(self.headers['Authorization'][len('Bearer '):])
+        self._send_json(200, {
+            'email': email,
+            'subscription': {'status': 'active', 'daysRemaining': 30}
+        })
+
+    # ---- /api/memories ----
+
+    def handle_get_memory(self, query):
+        with self.state.lock:
+            memory = dict(self.state.memory)
+        if not memory['version']:
+            self._send_json(404, {'error': 'No memory'})
+            return
+        self._send_json(200, memory)
+
+    def handle_get_memory_raw(self, query):
+        with self.state.lock:
+            memory = dict(self.state.memory)
+        if not memory['version']:
+            self._send_json(404, {'error': 'No memory'})
+            return
+        self._send_body(200, memory['content'].encode('utf-8'), 'text/plain; charset=utf-8',
+                        {'X-Memory-Version': str(memory['version'])})
+
+    def handle_post_memory(self, query):
+        data = self._read_json()
+        with self.state.lock:
+            self.state.memory = {
+                'content': data.get('content', ''),
+                'version': self.state.memory['version'] + 1
+            }
+            memory = dict(self.state.memory)
+        self.state.notify({'event': 'new_memory', 'version': memory['version']})
+        self._send_json(200, {'version': memory['version']})
+
+    # ---- /api/profiles ----
+
+    def handle_get_profiles(self, query):
+        path = query.get('path')
+        inline_max = int(query['inline_max']) if 'inline_max' in query else None
+        with self.state.lock:
+            if path:
+                files = [dict(self.state.profiles[path])] if path in self.state.profiles else []
+            else:
+                files = [dict(record) for record in self.state.profiles.values()]
+        if path and not files:
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        for record in files:
+            size = len(record['content'].encode('utf-8'))
+            record['size'] = size
+            if inline_max is not None and size > inline_max:
+                del record['content']
+        self._send_json(200, {'files': files})
+
+    def handle_get_profile_raw(self, query):
+        with self.state.lock:
+            record = self.state.profiles.get(query.get('path'))
+            record = dict(record) if record else None
+        if not record:
+            self._send_json(404, {'error': 'Not found'})
+            return
+        self._send_body(200, record['content'].encode('utf-8'), 'text/plain; charset=utf-8',
+                        {'X-Profile-Version': str(record['version'])})
+
+    def handle_post_profile(self, query):
+        data = self._read_json()
+        status, payload = self._apply_upload(data)
+        self._send_json(status, payload)
+
+    def handle_post_batch(self, query):
+        data = self._read_json()
+        results = []
+        for item in data.get('files', []):
+            status, payload = self._apply_upload(item)
+            payload['status'] = status
+            payload.setdefault('file_path', item.get('file_path'))
+            results.append(payload)
+        with self.state.lock:
+            self.state.stats['batches'] += 1
+        self._send_json(200, {'results': results})
+
+    def _apply_upload(self, data: dict):
+        """应用一次上传（全文或补丁），返回 (status, payload)"""
+        file_path = data.get('file_path')
+        if not file_path:
+            return 400, {'error': 'file_path required'}
+
+        with self.state.lock:
+            current = self.state.profiles.get(file_path)
+            current_version = current['version'] if current else 0
+            if data.get('version', 0) != current_version:
+                return 409, {
+                    'error': 'Version conflict',
+                    'latest_content': current['content'] if current else '',
+                    'latest_version': current_version
+                }
+
+            if 'patch' in data:
+                if data.get('base_version') != current_version:
+                    return 422, {'error': 'base_mismatch'}
+                try:
+                    content = apply_patch(current['content'] if current else '', data['patch'])
+                except PatchError as e:
+                    return 422, {'error': f'base_mismatch: {e}'}
+                if data.get('sha256') and content_digest(content) != data['sha256']:
+                    return 422, {'error': 'base_mismatch: digest'}
+                self.state.stats['delta_uploads'] += 1
+            elif 'chunks' in data:
+                missing = [cid for cid in data['chunks'] if cid not in self.state.chunks]
+                if missing:
+                    return 422, {'error': 'missing_chunks', 'missing': missing}
+                raw = b''.join(self.state.chunks[cid] for cid in data['chunks'])
+                try:
+                    content = raw.decode('utf-8')
+                except UnicodeDecodeError:
+                    return 400, {'error': 'content is not valid UTF-8'}
+                if data.get('sha256') and content_digest(content) != data['sha256']:
+                    return 422, {'error': 'digest mismatch'}
+                self.state.stats['chunked_uploads'] += 1
+            elif 'content' in data:
+                content = data['content']
+            else:
+                return 400, {'error': 'content, patch or chunks required'}
+
+            self.state.stats['uploads'] += 1
+            record = self.state.put_profile(file_path, content, data.get('chunks'))
+
+        self.state.notify_file(record)
+        return 200, {
+            'file_path': file_path,
+            'version': record['version'],
+            'updated_at': record['updated_at']
+        }
+
+    def handle_sync_profiles(self, query):
+        try:
+            since = int(query.get('since') or 0)
+        except ValueError:
+            self._send_json(400, {'error': 'Invalid cursor'})
+            return
+        with self.state.lock:
+            files = [
+                dict(record) for record in self.state.profiles.values()
+                if record['updated_at'] > since
+            ]
+            server_time = self.state.next_time()
+        self._send_json(200, {'files': files, 'server_time': str(server_time)})
+
+    def handle_get_profile_chunks(self, query):
+        path = query.get('path')
+        with self.state.lock:
+            record = self.state.profiles.get(path)
+            chunk_ids = list(self.state.profile_chunks.get(path, []))
+        if not record:
+            self._send_json(404, {'error': 'Not found'})
+            return
+        self._send_json(200, {
+            'file_path': path,
+            'version': record['version'],
+            'size': sum(len(self.state.chunks[cid]) for cid in chunk_ids),
+            'sha256': content_digest(record['content']),
+            'chunks': chunk_ids
+        })
+
+    # ---- /api/chunks ----
+
+    def handle_chunks_missing(self, query):
+        data = self._read_json()
+        with self.state.lock:
+            missing = [cid for cid in dict.fromkeys(data.get('chunks', [])) if cid not in self.state.chunks]
+        self._send_json(200, {'missing': missing})
+
+    def handle_post_chunks(self, query):
+        data = self._read_json()
+        chunks = {}
+        for cid, encoded in data.get('chunks', {}).items():
+            chunk = base64.b64decode(encoded)
+            if chunk_id(chunk) != cid:
+                self._send_json(400, {'error': f'Chunk digest mismatch: {cid}'})
+                return
+            chunks[cid] = chunk
+        with self.state.lock:
+            self.state.chunks.update(chunks)
+            self.state.stats['chunks_received'] += len(chunks)
+        self._send_json(200, {'stored': len(chunks)})
+
+    def handle_get_chunks(self, query):
+        data = self._read_json()
+        with self.state.lock:
+            found = {cid: self.state.chunks[cid] for cid in data.get('chunks', []) if cid in self.state.chunks}
+        self._send_json(200, {
+            'chunks': {cid: base64.b64encode(chunk).decode('ascii') for cid, chunk in found.items()},
+            'missing': [cid for cid in data.get('chunks', []) if cid not in found]
+        })
+
+    # ---- /ws ----
+
+    def _ws_read_frame(self):
+        """读取客户端的一帧（客户端帧都带掩码）
+
+        Returns:
+            (opcode, payload)；连接断开时返回 (None, None)
+        """
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return None, None
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self.rfile.read(8))[0]
+        mask = self.rfile.read(4) if header[1] & 0x80 else None
+        payload = self.rfile.read(length)
+        if mask:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        return opcode, payload
+
+    def handle_websocket(self, query):
+        key = self.headers.get('Sec-WebSocket-Key')
+        if 'websocket' not in self.headers.get('Upgrade', '').lower() or not key:
+            self._send_json(400, {'error': 'WebSocket upgrade required'})
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        sock = StubSocket(self.connection, self.wfile)
+        with self.state.lock:
+            self.state.stats['ws_connections'] += 1
+        try:
+            while True:
+                opcode, payload = self._ws_read_frame()
+                if opcode is None or opcode == WS_CLOSE:
+                    break
+                if opcode == WS_PING:
+                    sock.send_frame(WS_PONG, payload)
+                elif opcode == WS_TEXT:
+                    self._ws_message(sock, payload)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.state.lock:
+                if sock in self.state.sockets:
+                    self.state.sockets.remove(sock)
+
+    def _ws_message(self, sock: StubSocket, payload: bytes):
+        try:
+            message = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            sock.send({'type': 'error', 'message': 'Invalid JSON'})
+            return
+        if message.get('type') == 'auth':
+            if message.get('token') not in self.state.tokens:
+                sock.send({'type': 'error', 'message': 'Invalid token'})
+                return
+            sock.authenticated = True
+            with self.state.lock:
+                if sock not in self.state.sockets:
+                    self.state.sockets.append(sock)
+            sock.send({'type': 'authenticated', 'socket_id': sock.socket_id})
+        elif message.get('type') == 'ping':
+            sock.send({'type': 'pong'})
+
+    ROUTES = {
+        ('POST', '/api/auth/device'): handle_auth,
+        ('GET', '/api/memories/profile'): handle_user_profile,
+        ('GET', '/api/memories'): handle_get_memory,
+        ('GET', '/api/memories/raw'): handle_get_memory_raw,
+        ('POST', '/api/memories'): handle_post_memory,
+        ('GET', '/api/profiles'): handle_get_profiles,
+        ('GET', '/api/profiles/raw'): handle_get_profile_raw,
+        ('POST', '/api/profiles'): handle_post_profile,
+        ('POST', '/api/profiles/batch'): handle_post_batch,
+        ('GET', '/api/profiles/sync'): handle_sync_profiles,
+        ('GET', '/api/profiles/chunks'): handle_get_profile_chunks,
+        ('POST', '/api/chunks/missing'): handle_chunks_missing,
+        ('POST', '/api/chunks'): handle_post_chunks,
+        ('POST', '/api/chunks/get'): handle_get_chunks,
+        ('GET', '/ws'): handle_websocket,
+    }
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """客户端断开连接时不打印堆栈"""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubCloudServer:
+    """在后台线程中运行的替身服务器"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, verbose: bool = False):
+        self.state = StubState()
+        self.httpd = StubHTTPServer((host, port), StubRequestHandler)
+        self.httpd.state = self.state
+        self.httpd.verbose = verbose
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """启动服务器"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def remote_write(self, file_path: str, content: str) -> dict:
+        """模拟其他设备写入文件：更新内容并推送 file_updated
+
+        Returns:
+            新记录 {file_path, content, version, updated_at}
+        """
+        with self.state.lock:
+            record = dict(self.state.put_profile(file_path, content))
+        self.state.notify_file(record)
+        return record
+
+    def stop(self):
+        """停止服务器（先断开 WebSocket 连接）"""
+        with self.state.lock:
+            sockets = list(self.state.sockets)
+        for sock in sockets:
+            sock.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='SoulSync cloud API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    args = parser.parse_args()
+
+    server = StubCloudServer(args.host, args.port, verbose=True)
+    print(f"Stub server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,549 @@
 import os
+import threading
 import time
-from profiles import ProfilesClient, ConflictError
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from delta import make_patch
+from fsutil import atomic_write_bytes, file_sha256
+from merge import merge_content
+from profiles import ProfilesClient, ConflictError, CursorExpiredError
+
+
+def dedup_summary(infos: list) -> dict:
+    """汇总分块传输信息
+
+    Args:
+        infos: [{chunks, chunks_transferred, bytes, bytes_transferred}, ...]
+
+    Returns:
+        合计值加 ratio（未传输字节占比）；没有分块传输时返回 None
+    """
+    if not infos:
+        return None
+    total = {key: sum(info[key] for info in infos)
+             for key in ('chunks', 'chunks_transferred', 'bytes', 'bytes_transferred')}
+    total['ratio'] = round(1 - total['bytes_transferred'] / total['bytes'], 4) if total['bytes'] else 0.0
+    return total
+
+
+def _print_dedup(direction: str, dedup: dict):
+    print(f"[Chunk] {direction} dedup: {dedup['chunks_transferred']}/{dedup['chunks']} chunks, "
+          f"{dedup['bytes_transferred']} of {dedup['bytes']} bytes transferred ({dedup['ratio']:.1%} saved)")
+
+
 class ProfileSync:
     """多文件同步逻辑"""
-  
-    def __init__(self, client: ProfilesClient, version_manager, workspace: str):
+
+    def __init__(self, client: ProfilesClient, version_manager, workspace: str, manifest=None,
+                 pull_concurrency: int = 8, stream_threshold: int = 262144, cursor=None, echo=None,
+                 auto_merge: bool = True, merge_attempts: int = 3):
         self.client = client
         self.version_manager = version_manager
         self.workspace = workspace
-  
+        self.manifest = manifest
+        self.pull_concurrency = max(1, pull_concurrency)
+        # 超过该大小的文件不在列表中内联，改为流式下载
+        self.stream_threshold = stream_threshold
+        # 版本号和清单的写入需要串行；同一路径的下载/写入也串行
+        self.state_lock = threading.RLock()
+        self.path_locks = {}
+        self.path_locks_guard = threading.Lock()
+        # 增量同步游标；同一时间只有一个增量同步在跑，期间到达的通知合并为再跑一轮
+        self.cursor = cursor
+        self.cursor_guard = threading.Lock()
+        self.cursor_syncing = False
+        self.cursor_rerun = False
+        # 登记从云端写入的文件，监听器据此丢弃这些写入产生的事件
+        self.echo = echo
+        # 版本冲突时以缓存的确认版本为共同祖先自动三方合并
+        self.auto_merge = auto_merge
+        self.merge_attempts = max(1, merge_attempts)
+        self.merge_stats = {'merged': 0, 'conflicts': 0, 'no_base': 0, 'retries': 0, 'seconds': 0.0}
+
     def pull_all(self):
-        """Pull all profiles from cloud"""
+        """Pull all profiles from cloud
+
+        小文件的内容直接内联在列表中，大文件按路径单独流式下载；
+        下载和写入在有界线程池中并发执行，所有写入都是原子替换。
+
+        Returns:
+            {files, skipped, errors, bytes, seconds}
+        """
         print("[Sync] Pulling all profiles...")
-        # Implementation here
-        pass
-  
+        started = time.monotonic()
+        summary = self.pull_files(self.list_remote_files())
+        summary['seconds'] = round(time.monotonic() - started, 3)
+        print(f"[Sync] Pulled {summary['files']} files ({summary['bytes']} bytes) in {summary['seconds']}s, "
+              f"skipped {summary['skipped']}, errors {summary['errors']}")
+        return summary
+
+    def list_remote_files(self) -> list:
+        """获取云端文件列表（小文件内联 content）"""
+        return self.client.get_profiles(inline_max=self.stream_threshold).get('files', [])
+
+    def list_remote_versions(self) -> list:
+        """获取云端文件列表，只有路径、版本号和大小，不内联内容（空文件除外）"""
+        return self.client.get_profiles(inline_max=0).get('files', [])
+
+    def remote_snapshot(self) -> tuple:
+        """全部云端文件（带内容）和服务端时间（之后增量同步的游标）
+
+        Returns:
+            (files, server_time)
+        """
+        result = self.client.sync_profiles('0')
+        return result.get('files', []), result.get('server_time')
+
+    def fill_remote_contents(self, files: list, wanted: set) -> tuple:
+        """用一次增量同步请求补上 wanted 中文件的云端内容
+
+        游标之后云端变化的文件都在增量结果中；列表之后才变化或新建的文件以增量
+        结果为准，因此返回的服务端时间可以直接作为新的游标。没有游标或游标失效时
+        原样返回，仍缺内容的文件在拉取时单独流式下载。
+
+        Args:
+            files: list_remote_versions 的结果
+            wanted: 需要内容的路径
+
+        Returns:
+            (补上内容后的文件列表, server_time)；没有请求增量时 server_time 为 None
+        """
+        since = self.cursor.get() if self.cursor else None
+        if not wanted or since is None:
+            return files, None
+        try:
+            result = self.client.sync_profiles(since)
+        except CursorExpiredError:
+            return files, None
+        fetched = {entry['file_path']: entry for entry in result.get('files', []) if entry.get('file_path')}
+        merged = []
+        for entry in files:
+            newer = fetched.pop(entry.get('file_path'), None)
+            if newer is not None and 'content' in newer and newer.get('version', 0) >= entry.get('version', 0):
+                entry = newer
+            merged.append(entry)
+        merged.extend(fetched.values())
+        return merged, result.get('server_time')
+
+    def pull_files(self, files: list) -> dict:
+        """下载并写入给定的云端文件
+
+        Returns:
+            {files, skipped, errors, bytes}，有按块下载的文件时附带 dedup
+        """
+        summary = self._apply_remote_files(files)
+        self.flush()
+        return summary
+
+    def flush(self):
+        """把缓存的版本号、清单和基准索引的修改落盘（确认远端变化之前调用）"""
+        self.version_manager.flush()
+        if self.manifest:
+            self.manifest.flush()
+        self.client.bases.flush()
+
+    def base_content(self, file_path: str, version: int = None) -> str:
+        """服务端确认过的内容（只读本地缓存，不访问网络）
+
+        Args:
+            file_path: 相对路径
+            version: 版本号，默认为本地记录的当前版本
+
+        Returns:
+            内容；缓存中没有时返回 None
+        """
+        if version is None:
+            version = self.version_manager.get_version(file_path)
+        base = self.client.bases.get(file_path, version)
+        return base[1] if base else None
+
+    def local_diff(self, file_path: str) -> list:
+        """本地文件相对当前确认版本的行级补丁
+
+        Returns:
+            补丁（格式见 delta.make_patch）；没有基准或文件不存在时返回 None
+        """
+        base = self.base_content(file_path)
+        absolute_path = os.path.join(self.workspace, file_path)
+        if base is None or not os.path.isfile(absolute_path):
+            return None
+        with open(absolute_path, 'r', encoding='utf-8') as f:
+            return make_patch(base, f.read())
+
+    def rollback(self, file_path: str, version: int = None) -> bool:
+        """把本地文件恢复为缓存中的某个确认版本
+
+        恢复到当前版本即放弃本地修改，不产生上传；恢复到更早的版本时
+        写入的内容作为一次本地修改，由监听器照常上传为新版本。
+
+        Returns:
+            缓存中没有该版本时返回 False
+        """
+        current = self.version_manager.get_version(file_path)
+        target = current if version is None else version
+        content = self.base_content(file_path, target)
+        if content is None:
+            print(f"[Sync] No cached v{target} for {file_path}, cannot roll back")
+            return False
+
+        absolute_path = os.path.join(self.workspace, file_path)
+        data = content.encode('utf-8')
+        with self._path_lock(file_path):
+            if target == current:
+                self._write_local(file_path, absolute_path, data, current)
+            else:
+                atomic_write_bytes(absolute_path, data)
+        print(f"[Sync] Rolled back {file_path} to v{target}")
+        return True
+
+    def _apply_remote_files(self, files: list) -> dict:
+        """并发下载并写入远端文件"""
+        summary = {'files': 0, 'skipped': 0, 'errors': 0, 'bytes': 0}
+        if not files:
+            return summary
+
+        chunk_infos = []
+        with ThreadPoolExecutor(max_workers=self.pull_concurrency) as executor:
+            for written in executor.map(partial(self._pull_one_logged, chunk_infos=chunk_infos), files):
+                if written is None:
+                    summary['errors'] += 1
+                elif written is False:
+                    summary['skipped'] += 1
+                else:
+                    summary['files'] += 1
+                    summary['bytes'] += written
+
+        dedup = dedup_summary(chunk_infos)
+        if dedup:
+            summary['dedup'] = dedup
+            _print_dedup('Pull', dedup)
+        return summary
+
+    def _pull_one_logged(self, entry: dict, chunk_infos: list = None):
+        try:
+            return self._pull_one(entry, chunk_infos)
+        except Exception as e:
+            print(f"[Sync] Pull error on {entry.get('file_path')}: {e}")
+            return None
+
+    def _path_lock(self, file_path: str) -> threading.Lock:
+        with self.path_locks_guard:
+            lock = self.path_locks.get(file_path)
+            if lock is None:
+                lock = self.path_locks[file_path] = threading.Lock()
+            return lock
+
+    def _pull_one(self, entry: dict, chunk_infos: list = None):
+        """下载并写入单个文件
+
+        Args:
+            entry: 远端文件列表中的一项
+            chunk_infos: 可选，按块下载时把传输信息追加到该列表
+
+        Returns:
+            写入的字节数；本地已是最新或有未同步的本地修改时返回 False
+        """
+        file_path = entry.get('file_path')
+        remote_version = entry.get('version', 0)
+        if not file_path:
+            return False
+
+        with self._path_lock(file_path):
+            absolute_path = os.path.join(self.workspace, file_path)
+            if remote_version <= self.version_manager.get_version(file_path) and os.path.exists(absolute_path):
+                return False
+
+            if self._has_local_changes(file_path, absolute_path):
+                print(f"[Sync] Local changes not yet synced, keeping local copy: {file_path}")
+                return False
+
+            if 'content' not in entry:
+                # 大文件：流式写入临时文件后原子替换，内存占用与文件大小无关
+                result = self.client.download_profile_to(file_path, absolute_path, size=entry.get('size'))
+                if result is None:
+                    return False
+                if chunk_infos is not None and result.get('chunks'):
+                    chunk_infos.append(result['chunks'])
+                self._expect_echo(file_path, result['stat'], result['sha256'])
+                self._record_local(file_path, result['version'] or remote_version, result['stat'], result['sha256'])
+                return result['bytes']
+
+            data = entry.get('content', '').encode('utf-8')
+            self._write_local(file_path, absolute_path, data, remote_version)
+            return len(data)
+
+    def _has_local_changes(self, file_path: str, absolute_path: str) -> bool:
+        """本地文件自上次同步后是否被修改过（无清单记录时视为没有）"""
+        if not self.manifest or not self.manifest.get(file_path) or not os.path.exists(absolute_path):
+            return False
+        st = os.stat(absolute_path)
+        if self.manifest.stat_matches(file_path, st):
+            return False
+        return not self.manifest.hash_matches(file_path, file_sha256(absolute_path))
+
+    def _write_local(self, file_path: str, absolute_path: str, data: bytes, version: int):
+        """原子写入本地文件并记录版本号和清单"""
+        st, sha256 = atomic_write_bytes(absolute_path, data)
+        self._expect_echo(file_path, st, sha256)
+        self._record_local(file_path, version, st, sha256)
+
+    def _expect_echo(self, file_path: str, st: os.stat_result, sha256: str):
+        if self.echo:
+            self.echo.expect(file_path, st, sha256)
+
+    def mark_synced(self, file_path: str, version: int, st: os.stat_result, sha256: str):
+        """本地内容已与云端该版本一致，只记录版本号和清单"""
+        with self._path_lock(file_path):
+            self._record_local(file_path, version, st, sha256)
+
+    def _record_local(self, file_path: str, version: int, st: os.stat_result, sha256: str):
+        """记录从远端写入的文件"""
+        with self.state_lock:
+            self.version_manager.set_version(file_path, version)
+            if self.manifest:
+                self.manifest.record(file_path, st, sha256)
+
     def push_file(self, file_path):
-        """Push a file to cloud"""
+        """Push a file to cloud
+
+        先对照本地清单检查：size/mtime 未变只需一次 stat，
+        否则计算一次哈希，内容未变则跳过上传。
+
+        Returns:
+            上传结果；文件未变化或不存在时返回 None
+        """
+        prepared = self._prepare_push(file_path)
+        if prepared is None:
+            return None
+        st, sha256, content = prepared
+
         print(f"[Sync] Pushing {file_path}...")
-        # Implementation here
-        pass
-  
+        version = self.version_manager.get_version(file_path)
+        try:
+            result = self.client.upload_profile(file_path, content, version)
+        except ConflictError as e:
+            print(f"[Sync] Conflict on {file_path}: remote v{e.latest_version}, local v{version}")
+            result = self.resolve_conflict(file_path, e.latest_content, e.latest_version)
+            if result is None:
+                raise
+            return result
+
+        self._commit_push(file_path, result, version, st, sha256)
+        return result
+
+    def push_files(self, file_paths: list) -> dict:
+        """批量推送多个文件（一次请求）
+
+        Returns:
+            {file_path: 上传结果或异常}，未变化的文件不出现在结果中
+        """
+        prepared = {}
+        for file_path in file_paths:
+            item = self._prepare_push(file_path)
+            if item is not None:
+                prepared[file_path] = item
+        if not prepared:
+            return {}
+
+        print(f"[Sync] Pushing {len(prepared)} files in one batch...")
+        versions = {file_path: self.version_manager.get_version(file_path) for file_path in prepared}
+        results = self.client.upload_profiles_batch([
+            (file_path, content, versions[file_path])
+            for file_path, (st, sha256, content) in prepared.items()
+        ])
+
+        for file_path, result in results.items():
+            if isinstance(result, ConflictError):
+                print(f"[Sync] Conflict on {file_path}: remote v{result.latest_version}, local v{versions[file_path]}")
+                merged = self.resolve_conflict(file_path, result.latest_content, result.latest_version)
+                if merged is not None:
+                    results[file_path] = merged
+            elif isinstance(result, Exception):
+                print(f"[Sync] Upload error on {file_path}: {result}")
+            else:
+                st, sha256, content = prepared[file_path]
+                self._commit_push(file_path, result, versions[file_path], st, sha256)
+
+        dedup = dedup_summary([result['chunks'] for result in results.values()
+                               if isinstance(result, dict) and result.get('chunks')])
+        if dedup:
+            _print_dedup('Push', dedup)
+        return results
+
+    def resolve_conflict(self, file_path: str, latest_content: str = None, latest_version: int = None):
+        """三方合并本地修改和云端最新版本，并上传合并结果
+
+        共同祖先是本地记录的版本在基准缓存中的内容；上传时云端又有新版本则
+        以同一祖先重新合并，最多 merge_attempts 次。合并成功后本地文件也
+        替换为合并结果（期间本地又被修改时保留本地文件，下次上传再合并）。
+
+        Args:
+            file_path: 相对路径
+            latest_content: 云端最新内容，None 时从云端获取
+            latest_version: 云端最新版本号
+
+        Returns:
+            上传结果；无法自动合并（没有共同祖先或两边改了同一处）时返回 None
+        """
+        if not self.auto_merge:
+            return None
+        base_version = self.version_manager.get_version(file_path)
+        base = self.base_content(file_path, base_version) if base_version else None
+        if base is None:
+            # 没有确认过的版本（首次同步两边各有一份）时没有共同祖先，不自动合并
+            self.merge_stats['no_base'] += 1
+            print(f"[Merge] No cached base v{base_version} for {file_path}, keeping local copy")
+            return None
+        if latest_content is None:
+            files = self.client.get_profiles(file_path).get('files', [])
+            if not files:
+                return None
+            latest_content, latest_version = files[0].get('content', ''), files[0].get('version', 0)
+
+        absolute_path = os.path.join(self.workspace, file_path)
+        for attempt in range(self.merge_attempts):
+            with open(absolute_path, 'rb') as f:
+                ours_data = f.read()
+            started = time.perf_counter()
+            merged = merge_content(file_path, base, ours_data.decode('utf-8'), latest_content)
+            self.merge_stats['seconds'] += time.perf_counter() - started
+            if not merged.clean:
+                self.merge_stats['conflicts'] += 1
+                print(f"[Merge] Overlapping edits in {file_path} at {merged.conflicts[:5]}, keeping local copy")
+                return None
+
+            try:
+                result = self.client.upload_profile(file_path, merged.content, latest_version)
+            except ConflictError as e:
+                # 合并期间云端又有新版本
+                self.merge_stats['retries'] += 1
+                latest_content, latest_version = e.latest_content, e.latest_version
+                continue
+
+            data = merged.content.encode('utf-8')
+            with self._path_lock(file_path):
+                with open(absolute_path, 'rb') as f:
+                    unchanged = f.read() == ours_data
+                if unchanged:
+                    self._write_local(file_path, absolute_path, data, result.get('version', latest_version + 1))
+            self.merge_stats['merged'] += 1
+            print(f"[Merge] Merged {file_path}: base v{base_version} + remote v{latest_version} "
+                  f"-> v{result.get('version')}")
+            return result
+
+        print(f"[Merge] {file_path} kept changing remotely, giving up after {self.merge_attempts} attempts")
+        return None
+
+    def _prepare_push(self, file_path):
+        """读取待上传的文件，未变化或不存在时返回 None
+
+        Returns:
+            (stat, sha256, content)
+        """
+        absolute_path = os.path.join(self.workspace, file_path)
+        if not os.path.isfile(absolute_path):
+            print(f"[Sync] File not found, skip: {file_path}")
+            return None
+
+        with open(absolute_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if self.manifest and self.manifest.stat_matches(file_path, st):
+                print(f"[Sync] Unchanged (stat), skip: {file_path}")
+                return None
+            data = f.read()
+
+        sha256 = self.manifest.hash_bytes(data) if self.manifest else None
+        if self.manifest and self.manifest.hash_matches(file_path, sha256):
+            # 内容未变，只刷新 stat，下次可直接命中
+            self.manifest.record(file_path, st, sha256)
+            print(f"[Sync] Unchanged (hash), skip: {file_path}")
+            return None
+
+        return st, sha256, data.decode('utf-8')
+
+    def _commit_push(self, file_path, result, version, st, sha256):
+        """上传成功后更新版本号和清单"""
+        with self.state_lock:
+            self.version_manager.set_version(file_path, result.get('version', version + 1))
+            if self.manifest:
+                self.manifest.record(file_path, st, sha256)
+
+    def sync_since_cursor(self):
+        """增量同步：只获取游标之后变化的文件
+
+        没有游标（首次运行、游标文件丢失或服务端拒绝游标）时做一次全量同步。
+        已有同步在进行时不重复请求，只让它结束后再跑一轮。
+
+        Returns:
+            {files, skipped, errors, bytes, full}；合并到进行中的同步时返回 None
+        """
+        with self.cursor_guard:
+            if self.cursor_syncing:
+                self.cursor_rerun = True
+                return None
+            self.cursor_syncing = True
+
+        try:
+            while True:
+                summary = self._sync_once()
+                with self.cursor_guard:
+                    if not self.cursor_rerun:
+                        self.cursor_syncing = False
+                        return summary
+                    self.cursor_rerun = False
+        except BaseException:
+            with self.cursor_guard:
+                self.cursor_syncing = False
+                self.cursor_rerun = False
+            raise
+
+    def _sync_once(self) -> dict:
+        since = self.cursor.get() if self.cursor else None
+        full = since is None
+        if full:
+            print("[Sync] No sync cursor, doing a full resync")
+        try:
+            result = self.client.sync_profiles(since or '0')
+        except CursorExpiredError as e:
+            print(f"[Sync] Sync cursor rejected ({e}), doing a full resync")
+            if self.cursor:
+                self.cursor.clear()
+            full = True
+            result = self.client.sync_profiles('0')
+
+        files = result.get('files', [])
+        summary = self.pull_files(files)
+        summary['full'] = full
+        # 有文件写入失败时不前移游标，下次重试
+        if self.cursor and not summary['errors']:
+            self.cursor.set(result.get('server_time'))
+        print(f"[Sync] {'Full' if full else 'Incremental'} sync: {len(files)} changed, "
+              f"wrote {summary['files']}, skipped {summary['skipped']}, errors {summary['errors']}")
+        return summary
+
+    def apply_remote_changes(self, changes: dict):
+        """处理一批远端变化通知
+
+        Args:
+            changes: {file_path: version}，version 为 None 表示未知；
+                     空字典表示只要求同步（如 new_memory）
+
+        Returns:
+            增量同步的结果；所有通知的版本本地都已有时返回 None
+        """
+        stale = [
+            file_path for file_path, version in changes.items()
+            if version is not None and version <= self.version_manager.get_version(file_path)
+        ]
+        if changes and len(stale) == len(changes):
+            return None
+        # 一次增量请求取回游标之后的全部变化，覆盖这一批通知
+        return self.sync_since_cursor()
+
     def on_remote_change(self, file_path, version):
-        """Handle remote file change"""
+        """Handle remote file change
+
+        本地已是该版本或更新时忽略，否则做一次增量同步。
+        """
         print(f"[Sync] Remote change: {file_path} (v{version})")
-        # Implementation here
-        pass
+        return self.apply_remote_changes({file_path: version})
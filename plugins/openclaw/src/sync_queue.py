@@ -0,0 +1,185 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+
+class SyncQueue:
+    """带优先级的同步任务队列
+
+    文件变化以路径为单位入队，同一路径排队期间只保留一个任务（优先级取较高者）。
+    工作线程按优先级取任务：高优先级任务立即发送，其余任务等待 batch_window
+    以便合并成一批；同一路径不会被两个工作线程同时处理。队列满时 submit
+    会阻塞（背压），直到有空位或超时。
+    """
+
+    def __init__(self, handler, workers: int = 2, max_size: int = 1000, batch_size: int = 50,
+                 batch_window: float = 0.5, put_timeout: float = None):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.put_timeout = put_timeout
+        # path -> (priority, seq, enqueued_at)；heap 中的过期条目惰性丢弃
+        self.jobs = {}
+        self.heap = []
+        self.in_flight = set()
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.running = False
+        self.threads = []
+        self.stats = {
+            'submitted': 0,
+            'deduplicated': 0,
+            'rejected': 0,
+            'processed': 0,
+            'batches': 0,
+            'errors': 0,
+            'max_depth': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0
+        }
+
+    def start(self):
+        """启动工作线程"""
+        self.running = True
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'soulsync-sync-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """处理完队列中剩余的任务后停止"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def submit(self, file_path: str, priority: int = PRIORITY_NORMAL) -> bool:
+        """提交一个文件同步任务
+
+        Returns:
+            是否入队（已在队列中也算成功）；队列满且等待超时、或已停止时返回 False
+        """
+        with self.cond:
+            self.stats['submitted'] += 1
+            job = self.jobs.get(file_path)
+            if job is not None:
+                self.stats['deduplicated'] += 1
+                if priority < job[0]:
+                    self._push(file_path, priority, job[2])
+                    self.cond.notify_all()
+                return True
+
+            deadline = None if self.put_timeout is None else time.monotonic() + self.put_timeout
+            while self.running and len(self.jobs) >= self.max_size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            if not self.running or len(self.jobs) >= self.max_size:
+                self.stats['rejected'] += 1
+                return False
+
+            self._push(file_path, priority, time.monotonic())
+            self.stats['max_depth'] = max(self.stats['max_depth'], len(self.jobs))
+            self.cond.notify_all()
+            return True
+
+    def _push(self, file_path: str, priority: int, enqueued_at: float):
+        seq = next(self.counter)
+        self.jobs[file_path] = (priority, seq, enqueued_at)
+        heapq.heappush(self.heap, (priority, seq, file_path))
+
+    def _ready(self) -> list:
+        """按优先级列出可处理的任务（不在处理中），调用方持有锁
+
+        Returns:
+            [(priority, seq, file_path), ...]
+        """
+        ready = []
+        skipped = []
+        while self.heap and len(ready) < self.batch_size:
+            item = heapq.heappop(self.heap)
+            priority, seq, file_path = item
+            job = self.jobs.get(file_path)
+            if job is None or job[1] != seq:
+                continue
+            if file_path in self.in_flight:
+                skipped.append(item)
+                continue
+            ready.append(item)
+        for item in ready + skipped:
+            heapq.heappush(self.heap, item)
+        return ready
+
+    def _next_batch(self) -> list:
+        """等待并取出下一批任务；停止且队列为空时返回 None"""
+        with self.cond:
+            while True:
+                ready = self._ready()
+                if not ready:
+                    if not self.running and not self.jobs:
+                        return None
+                    self.cond.wait(None if self.running else 0.05)
+                    continue
+
+                priority = ready[0][0]
+                oldest = min(self.jobs[item[2]][2] for item in ready)
+                remaining = oldest + self.batch_window - time.monotonic()
+                if (priority > PRIORITY_HIGH and self.running and remaining > 0
+                        and len(ready) < self.batch_size):
+                    # 批量任务：等待窗口结束或凑满一批
+                    self.cond.wait(remaining)
+                    continue
+
+                now = time.monotonic()
+                batch = []
+                for item_priority, seq, file_path in ready:
+                    if item_priority != priority:
+                        break
+                    enqueued_at = self.jobs.pop(file_path)[2]
+                    wait = now - enqueued_at
+                    self.stats['wait_seconds_total'] += wait
+                    self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], wait)
+                    self.in_flight.add(file_path)
+                    batch.append(file_path)
+                self.cond.notify_all()
+                return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.handler(batch)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"[Queue] Sync error: {e}")
+            finally:
+                with self.cond:
+                    self.in_flight.difference_update(batch)
+                    self.stats['processed'] += len(batch)
+                    self.stats['batches'] += 1
+                    self.cond.notify_all()
+
+    def get_stats(self) -> dict:
+        """获取队列深度和等待时间统计"""
+        with self.cond:
+            stats = dict(self.stats)
+            stats['depth'] = len(self.jobs)
+            stats['in_flight'] = len(self.in_flight)
+        dequeued = stats['processed'] + stats['in_flight']
+        if dequeued:
+            stats['wait_seconds_avg'] = stats['wait_seconds_total'] / dequeued
+        return stats
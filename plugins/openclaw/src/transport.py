@@ -0,0 +1,350 @@
+import gzip
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+from resilience import ApiError, CircuitOpenError, Resilience, RETRY_STATUSES
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _timed_pool_classes(on_connect) -> dict:
+    """生成会回报建连耗时的连接池类（HTTPS 的耗时包含 TLS 握手）"""
+
+    def timed(connection_cls):
+        class TimedConnection(connection_cls):
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()
+                on_connect(time.perf_counter() - start)
+        return TimedConnection
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = timed(HTTPSConnection)
+
+    return {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+# 说明连接或响应出了问题的异常（响应被截断、解压失败也算），计入熔断
+NETWORK_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                  requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+
+def _request_sent(error: Exception) -> bool:
+    """请求是否可能已经发出（连接建立之后才失败）"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return not isinstance(reason, NewConnectionError)
+
+
+class PooledAdapter(HTTPAdapter):
+    """带建连统计的 keep-alive 连接池适配器"""
+
+    def __init__(self, on_connect, **kwargs):
+        self.on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _timed_pool_classes(self.on_connect)
+
+
+class Transport:
+    """HTTP 传输层
+
+    两个客户端（包括 token 刷新）的所有请求都经过这里：共用一个
+    keep-alive 连接池，按大小阈值压缩请求体，声明可接受的响应编码，
+    并统计线上字节数、原始字节数和连接复用情况。每个请求都有连接/读取
+    超时，并按 resilience 的策略重试和熔断。
+    """
+
+    def __init__(self, compression: bool = True, compress_min_bytes: int = 1024,
+                 pool_hosts: int = 4, pool_size: int = 10, pool_block: bool = True,
+                 idle_timeout: float = 60, resilience: Resilience = None):
+        self.compression = compression
+        self.resilience = resilience or Resilience()
+        self.compress_min_bytes = compress_min_bytes
+        # 服务端支持的请求体编码 {host: [encoding, ...]}，未知时默认尝试 gzip
+        self.server_encodings = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'compressed_requests': 0,
+            'request_logical_bytes': 0,
+            'request_wire_bytes': 0,
+            'response_logical_bytes': 0,
+            'response_wire_bytes': 0,
+            'pool_misses': 0,
+            'idle_resets': 0,
+            'connect_seconds_total': 0.0,
+            'connect_seconds_max': 0.0
+        }
+
+        # pool_hosts: 缓存的主机连接池个数；pool_size: 每个主机的最大连接数，
+        # pool_block 为 True 时超过上限的请求会等待空闲连接而不是新建
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self._create_session()
+
+    def _create_session(self):
+        """创建共享的 keep-alive 会话"""
+        self.adapter = PooledAdapter(
+            self._on_connect,
+            pool_connections=self.pool_hosts,
+            pool_maxsize=self.pool_size,
+            pool_block=self.pool_block
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'Transport':
+        """根据 config.json 创建"""
+        return cls(
+            compression=config.get('compression', True),
+            compress_min_bytes=config.get('compress_min_bytes', 1024),
+            pool_hosts=config.get('http_pool_hosts', 4),
+            pool_size=config.get('http_pool_size', 10),
+            pool_block=config.get('http_pool_block', True),
+            idle_timeout=config.get('http_idle_timeout', 60),
+            resilience=Resilience.from_config(config)
+        )
+
+    def _on_connect(self, seconds: float):
+        """新建连接（连接池未命中）"""
+        with self.lock:
+            self.stats['pool_misses'] += 1
+            self.stats['connect_seconds_total'] += seconds
+            self.stats['connect_seconds_max'] = max(self.stats['connect_seconds_max'], seconds)
+
+    def _begin(self):
+        """请求开始：空闲过久时丢弃池中的旧连接"""
+        with self.lock:
+            now = time.monotonic()
+            idle = now - self.last_used
+            reset = self.idle_timeout and self.in_flight == 0 and idle > self.idle_timeout
+            self.in_flight += 1
+            self.last_used = now
+            if reset:
+                self.stats['idle_resets'] += 1
+        if reset:
+            self.adapter.poolmanager.clear()
+
+    def _end(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.last_used = time.monotonic()
+
+    def _send(self, method: str, url: str, **kwargs):
+        self._begin()
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            self._end()
+
+    @staticmethod
+    def accept_encoding() -> str:
+        """可接受的响应编码"""
+        if zstandard is not None:
+            return 'zstd, gzip, deflate'
+        return 'gzip, deflate'
+
+    def _choose_encoding(self, host: str) -> str:
+        """选择请求体编码，服务端不支持压缩时返回 None"""
+        encodings = self.server_encodings.get(host, ['gzip'])
+        if zstandard is not None and 'zstd' in encodings:
+            return 'zstd'
+        if 'gzip' in encodings:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _compress(body: bytes, encoding: str) -> bytes:
+        if encoding == 'zstd':
+            return zstandard.ZstdCompressor(level=3).compress(body)
+        return gzip.compress(body, compresslevel=6)
+
+    def _learn_encodings(self, host: str, response):
+        """记录服务端通过 Accept-Encoding 响应头声明的请求体编码（RFC 7694）"""
+        advertised = response.headers.get('Accept-Encoding')
+        if advertised:
+            encodings = [item.split(';')[0].strip().lower() for item in advertised.split(',')]
+            self.server_encodings[host] = [item for item in encodings if item]
+
+    def _prepare(self, host: str, json_body, headers: dict):
+        """构造请求头和（按需压缩的）请求体
+
+        Returns:
+            (headers, body, wire_body, encoding)
+        """
+        headers = dict(headers or {})
+        headers['Accept-Encoding'] = self.accept_encoding()
+        headers.pop('Content-Encoding', None)
+
+        body = None
+        encoding = None
+        if json_body is not None:
+            body = json.dumps(json_body, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            if self.compression and len(body) >= self.compress_min_bytes:
+                encoding = self._choose_encoding(host)
+
+        wire_body = body
+        if encoding:
+            wire_body = self._compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+        return headers, body, wire_body, encoding
+
+    def request(self, method: str, url: str, json_body=None, headers: dict = None,
+                idempotent: bool = None, retry_statuses: frozenset = RETRY_STATUSES, **kwargs):
+        """发送请求
+
+        幂等请求在网络错误、超时和 429/502/503/504 时按退避重试，非幂等请求
+        只在连接没有建立时重试；重试用尽后返回最后一次的响应。
+
+        Args:
+            method: HTTP 方法
+            url: 完整 URL
+            json_body: 可选的 JSON 请求体
+            headers: 请求头
+            idempotent: 请求能否安全重发，默认按方法判断（GET 等为幂等，POST 不是）
+            retry_statuses: 值得重试的响应状态（调用方自己处理 429 时去掉 429）
+
+        Returns:
+            requests.Response
+
+        Raises:
+            ApiError: 网络错误或超时且不再重试；CircuitOpenError: 熔断期间
+        """
+        parsed = urlparse(url)
+        host = parsed.netloc
+        policy = self.resilience.retry
+        idempotent = policy.is_idempotent(method, idempotent)
+        kwargs.setdefault('timeout', (self.resilience.connect_timeout, self.resilience.read_timeout))
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.resilience.check(host, method, parsed.path)
+            except CircuitOpenError as e:
+                e.sent = attempt > 1
+                raise
+            try:
+                response, body, wire_body, encoding = self._attempt(method, url, host, json_body, headers, **kwargs)
+            except NETWORK_ERRORS as e:
+                self.resilience.record_error(host, isinstance(e, requests.exceptions.Timeout))
+                delay = policy.error_delay(attempt, idempotent, _request_sent(e))
+                if delay is None:
+                    raise ApiError(f"{method} {parsed.path} failed: {e}") from e
+            except BaseException:
+                self.resilience.release(host)
+                raise
+            else:
+                self.resilience.record_response(host, response.status_code)
+                delay = policy.response_delay(attempt, response, idempotent, retry_statuses)
+                if delay is None:
+                    break
+                response.close()
+            self.resilience.count_retry()
+            time.sleep(delay)
+
+        self._learn_encodings(host, response)
+        self._record(body, wire_body, encoding, response, kwargs.get('stream', False))
+        return response
+
+    def _attempt(self, method: str, url: str, host: str, json_body, headers: dict, **kwargs):
+        """发送一次请求；服务端不接受压缩请求体（415）时记住并以原文重发
+
+        Returns:
+            (response, body, wire_body, encoding)
+        """
+        headers, body, wire_body, encoding = self._prepare(host, json_body, headers)
+        response = self._send(method, url, data=wire_body, headers=headers, **kwargs)
+
+        if encoding and response.status_code == 415:
+            self.server_encodings[host] = []
+            response.close()
+            headers, body, wire_body, encoding = self._prepare(host, json_body, headers)
+            response = self._send(method, url, data=wire_body, headers=headers, **kwargs)
+        return response, body, wire_body, encoding
+
+    def get(self, url: str, headers: dict = None, **kwargs):
+        return self.request('GET', url, headers=headers, **kwargs)
+
+    def post(self, url: str, json=None, headers: dict = None, **kwargs):
+        return self.request('POST', url, json_body=json, headers=headers, **kwargs)
+
+    def _record(self, body: bytes, wire_body: bytes, encoding: str, response, streamed: bool):
+        """累计流量统计（流式响应的内容由调用方读取，这里不计入）"""
+        response_logical = 0
+        response_wire = 0
+        if not streamed:
+            response_logical = len(response.content)
+            try:
+                # urllib3 记录的是解压前从连接上读到的字节数
+                response_wire = response.raw.tell()
+            except Exception:
+                response_wire = 0
+            if not response_wire:
+                response_wire = int(response.headers.get('Content-Length') or response_logical)
+
+        self._count(body, wire_body, encoding, response_logical, response_wire)
+
+    def _count(self, body: bytes, wire_body: bytes, encoding: str, response_logical: int, response_wire: int):
+        with self.lock:
+            self.stats['requests'] += 1
+            if encoding:
+                self.stats['compressed_requests'] += 1
+            self.stats['request_logical_bytes'] += len(body or b'')
+            self.stats['request_wire_bytes'] += len(wire_body or b'')
+            self.stats['response_logical_bytes'] += response_logical
+            self.stats['response_wire_bytes'] += response_wire
+
+    def record_stream(self, response, logical_bytes: int):
+        """流式响应读取完毕后补记响应字节数"""
+        try:
+            wire_bytes = response.raw.tell()
+        except Exception:
+            wire_bytes = 0
+        self.add_response_bytes(logical_bytes, wire_bytes or logical_bytes)
+
+    def add_response_bytes(self, logical_bytes: int, wire_bytes: int):
+        with self.lock:
+            self.stats['response_logical_bytes'] += logical_bytes
+            self.stats['response_wire_bytes'] += wire_bytes
+
+    def get_stats(self) -> dict:
+        """获取流量与连接池统计"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats['pool_hits'] = max(stats['requests'] - stats['pool_misses'], 0)
+        if stats['pool_misses']:
+            stats['connect_seconds_avg'] = stats['connect_seconds_total'] / stats['pool_misses']
+        stats['resilience'] = self.resilience.get_stats()
+        return stats
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
@@ -1,61 +1,222 @@
 import json
 import os
+import threading
 
 
 class VersionManager:
-    """本地版本管理"""
-    
-    def __init__(self, versions_file: str):
+    """本地版本管理
+
+    versions.json 是快照，每次更新只向 versions.json.journal 追加一行，
+    日志行数超过阈值时再把快照整体重写（压缩）。加载时先读快照再重放日志；
+    崩溃时写了一半的最后一行会被忽略。
+
+    开启 group commit（group_commit_interval > 0）后，更新先缓存在内存中，
+    满 group_commit_size 条或间隔到期时一次写入；需要落盘时调用 flush()。
+    """
+
+    def __init__(self, versions_file: str, compact_min_entries: int = 1000, fsync: bool = False,
+                 group_commit_interval: float = 0, group_commit_size: int = 100):
         self.versions_file = versions_file
+        self.journal_file = versions_file + '.journal'
+        self.compact_min_entries = compact_min_entries
+        self.fsync = fsync
+        self.group_commit_interval = group_commit_interval
+        self.group_commit_size = group_commit_size
         self.versions = {}
+        self.pending = {}
+        self.flush_timer = None
+        self.journal = None
+        self.journal_entries = 0
+        self.lock = threading.RLock()
+        self.stats = {
+            'updates': 0,
+            'flushes': 0,
+            'compactions': 0,
+            'bytes_written': 0
+        }
         self.load()
-    
+
     def load(self):
-        """加载版本文件"""
-        if os.path.exists(self.versions_file):
-            try:
-                with open(self.versions_file, 'r', encoding='utf-8') as f:
-                    self.versions = json.load(f)
-            except Exception as e:
-                print(f"Failed to load versions file: {e}")
-                self.versions = {}
-        else:
+        """加载快照并重放日志"""
+        with self.lock:
+            self._cancel_timer()
+            self._close_journal()
             self.versions = {}
-    
-    def save(self):
-        """保存版本文件"""
-        try:
+            self.pending = {}
+            self.journal_entries = 0
+
+            if os.path.exists(self.versions_file):
+                try:
+                    with open(self.versions_file, 'r', encoding='utf-8') as f:
+                        self.versions = json.load(f)
+                except Exception as e:
+                    print(f"Failed to load versions file: {e}")
+                    self.versions = {}
+
+            if os.path.exists(self.journal_file):
+                self._replay_journal()
+
+    def _replay_journal(self):
+        """重放日志，遇到不完整或损坏的行即停止"""
+        valid_bytes = 0
+        with open(self.journal_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                    self.versions[entry['p']] = entry['v']
+                except (ValueError, KeyError, TypeError):
+                    break
+                valid_bytes += len(line)
+                self.journal_entries += 1
+
+        if valid_bytes != os.path.getsize(self.journal_file):
+            print(f"Discarding incomplete versions journal tail at byte {valid_bytes}")
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(valid_bytes)
+
+    def _open_journal(self):
+        if self.journal is None:
             directory = os.path.dirname(self.versions_file)
             if directory and not os.path.exists(directory):
                 os.makedirs(directory, exist_ok=True)
-            
-            with open(self.versions_file, 'w', encoding='utf-8') as f:
-                json.dump(self.versions, f, indent=2, ensure_ascii=False)
+            self.journal = open(self.journal_file, 'ab')
+        return self.journal
+
+    def _close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def _append(self, updates: dict):
+        """记录更新：直接追加日志，或在 group commit 模式下缓存"""
+        self.stats['updates'] += len(updates)
+        if not self.group_commit_interval:
+            self._write_journal(updates)
+            return
+
+        self.pending.update(updates)
+        if len(self.pending) >= self.group_commit_size:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = threading.Timer(self.group_commit_interval, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush(self):
+        """把缓存的更新一次写入日志"""
+        with self.lock:
+            self._cancel_timer()
+            if not self.pending:
+                return
+            updates = self.pending
+            self.pending = {}
+            self._write_journal(updates)
+
+    def _cancel_timer(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
+    def _write_journal(self, updates: dict):
+        """追加日志，O(1) 于已跟踪的文件数"""
+        lines = b''.join(
+            json.dumps({'p': file_path, 'v': version}, ensure_ascii=False).encode('utf-8') + b'\n'
+            for file_path, version in updates.items()
+        )
+        try:
+            journal = self._open_journal()
+            journal.write(lines)
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+            self.journal_entries += len(updates)
+            self.stats['flushes'] += 1
+            self.stats['bytes_written'] += len(lines)
         except Exception as e:
-            print(f"Failed to save versions file: {e}")
-    
+            print(f"Failed to append versions journal: {e}")
+            return
+
+        if self.journal_entries >= max(self.compact_min_entries, len(self.versions)):
+            self.compact()
+
+    def save(self):
+        """保存版本文件（重写快照并清空日志）"""
+        self.compact()
+
+    def compact(self):
+        """把当前版本写成新快照，然后清空日志
+
+        快照先写临时文件再替换；替换后、清空日志前崩溃也没关系，
+        重放日志得到的结果与快照相同。
+        """
+        with self.lock:
+            self._cancel_timer()
+            self.pending = {}
+            try:
+                directory = os.path.dirname(self.versions_file)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory, exist_ok=True)
+
+                tmp_file = self.versions_file + '.tmp'
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.versions, f, indent=2, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    written = f.tell()
+                os.replace(tmp_file, self.versions_file)
+                self.stats['compactions'] += 1
+                self.stats['bytes_written'] += written
+
+                self._close_journal()
+                with open(self.journal_file, 'wb'):
+                    pass
+                self.journal_entries = 0
+            except Exception as e:
+                print(f"Failed to save versions file: {e}")
+
     def get_version(self, file_path: str) -> int:
         """获取文件版本"""
         return self.versions.get(file_path, 0)
-    
+
     def set_version(self, file_path: str, version: int):
         """设置文件版本"""
-        self.versions[file_path] = version
-        self.save()
-    
+        with self.lock:
+            self.versions[file_path] = version
+            self._append({file_path: version})
+
     def increment_version(self, file_path: str) -> int:
         """递增版本"""
-        current = self.get_version(file_path)
-        new_version = current + 1
-        self.set_version(file_path, new_version)
-        return new_version
-    
+        with self.lock:
+            current = self.get_version(file_path)
+            new_version = current + 1
+            self.set_version(file_path, new_version)
+            return new_version
+
     def update_versions(self, updates: dict):
         """批量更新版本"""
-        for file_path, version in updates.items():
-            self.versions[file_path] = version
-        self.save()
-    
+        with self.lock:
+            for file_path, version in updates.items():
+                self.versions[file_path] = version
+            self._append(updates)
+
     def get_all_versions(self) -> dict:
         """获取所有版本"""
-        return self.versions.copy()
+        with self.lock:
+            return self.versions.copy()
+
+    def get_stats(self) -> dict:
+        """获取写入统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.pending)
+            return stats
+
+    def close(self):
+        """写入缓存的更新、压缩日志并关闭"""
+        with self.lock:
+            self.flush()
+            if self.journal_entries:
+                self.compact()
+            self._close_journal()
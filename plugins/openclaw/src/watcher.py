@@ -1,20 +1,39 @@
 import os
-import time
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileSystemEvent
 
+from coalescer import EventCoalescer
+from ignore import IgnoreMatcher, IGNORE_FILE
+
 
 class OpenClawMultiWatcher(FileSystemEventHandler):
     """OpenClaw 多文件/目录监听器"""
     
-    def __init__(self, workspace: str, watch_paths: list, callback):
+    def __init__(self, workspace: str, watch_paths: list, callback, debounce_seconds: float = 1,
+                 max_wait_seconds: float = 5, max_pending: int = 10000, suppress=None):
         self.workspace = os.path.abspath(workspace)
         self.watch_paths = watch_paths
         self.callback = callback
+        # 可选 suppress(relative_path, absolute_path)，返回 True 的事件（如同步自己写入的回声）被丢弃
+        self.suppress = suppress
         self.observer = None
-        self.last_events = {}
-        self.debounce_seconds = 1
-        self.ignore_patterns = ['.tmp', '.swp', '.bak', '~']
+        self.debounce_seconds = debounce_seconds
+        # 工作区根目录下的 .soulsyncignore（gitignore 语法），文件变化时重新加载
+        self.ignore_file = os.path.join(self.workspace, IGNORE_FILE)
+        self.ignore = IgnoreMatcher.from_file(self.ignore_file)
+        # 监听目录只对未被忽略的子目录逐个（非递归）注册，内核不再投递被忽略目录的事件
+        self.dir_roots = []
+        self.dir_watches = {}
+        self.file_watch_dirs = set()
+        self.watch_lock = threading.RLock()
+        # 每个路径的事件先合并，静默 debounce_seconds 后（最多等 max_wait_seconds）再回调
+        self.coalescer = EventCoalescer(
+            self._emit,
+            quiet=debounce_seconds,
+            max_wait=max_wait_seconds,
+            max_pending=max_pending
+        )
     
     def start(self):
         """开始监听"""
@@ -32,7 +51,7 @@ class OpenClawMultiWatcher(FileSystemEventHandler):
                     os.makedirs(full_path, exist_ok=True)
                     print(f"Created directory: {full_path}")
                 
-                self.observer.schedule(self, full_path, recursive=True)
+                self.dir_roots.append(os.path.abspath(full_path))
                 print(f"Watching directory: {watch_path}")
             else:
                 directory = os.path.dirname(full_path)
@@ -44,9 +63,14 @@ class OpenClawMultiWatcher(FileSystemEventHandler):
                         pass
                     print(f"Created file: {watch_path}")
                 
-                self.observer.schedule(self, os.path.dirname(full_path), recursive=False)
+                file_dir = os.path.abspath(os.path.dirname(full_path))
+                if file_dir not in self.file_watch_dirs:
+                    self.file_watch_dirs.add(file_dir)
+                    self.observer.schedule(self, file_dir, recursive=False)
                 print(f"Watching file: {watch_path}")
         
+        self._sync_watches()
+        self.coalescer.start()
         self.observer.start()
         print(f"Started watching {len(self.watch_paths)} paths in {self.workspace}")
     
@@ -55,77 +79,149 @@ class OpenClawMultiWatcher(FileSystemEventHandler):
         if self.observer:
             self.observer.stop()
             self.observer.join()
+            self.coalescer.stop()
             print("Stopped watching")
     
-    def _should_ignore(self, path: str) -> bool:
+    def _should_ignore(self, path: str, is_dir: bool = False) -> bool:
         """检查是否应该忽略"""
-        basename = os.path.basename(path)
-        for pattern in self.ignore_patterns:
-            if pattern in basename:
-                return True
-        return False
+        return self.ignore.matches(self._get_relative_path(path), is_dir)
     
     def _get_relative_path(self, absolute_path: str) -> str:
-        """获取相对路径"""
+        """获取相对路径（统一用 / 分隔）"""
         if absolute_path.startswith(self.workspace):
-            relative = absolute_path[len(self.workspace):].lstrip('/')
+            relative = absolute_path[len(self.workspace):].replace(os.sep, '/').lstrip('/')
             return relative
         return absolute_path
     
-    def _debounce_check(self, file_path: str) -> bool:
-        """防抖检查"""
-        current_time = time.time()
-        last_time = self.last_events.get(file_path, 0)
-        
-        if current_time - last_time < self.debounce_seconds:
-            return False
-        
-        self.last_events[file_path] = current_time
-        return True
+    def reload_ignore(self):
+        """重新加载 .soulsyncignore，并按新规则调整目录监听"""
+        self.ignore = IgnoreMatcher.from_file(self.ignore_file)
+        print(f"[Watcher] Reloaded {IGNORE_FILE} ({len(self.ignore.patterns)} patterns)")
+        self._sync_watches()
     
-    def on_modified(self, event):
-        """文件被修改"""
-        if event.is_directory:
+    def _scan_directories(self, root: str) -> list:
+        """列出 root 及其下所有未被忽略的目录"""
+        directories = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            directories.append(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and not self._should_ignore(entry.path, True):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+        return directories
+    
+    def _sync_watches(self):
+        """让目录监听与当前的忽略规则一致"""
+        with self.watch_lock:
+            wanted = set()
+            for root in self.dir_roots:
+                if os.path.isdir(root):
+                    wanted.update(self._scan_directories(root))
+            for directory in list(self.dir_watches):
+                if directory not in wanted:
+                    self._unwatch_directory(directory)
+            for directory in wanted:
+                self._watch_directory(directory)
+    
+    def _watch_directory(self, directory: str) -> bool:
+        with self.watch_lock:
+            if directory in self.dir_watches or directory in self.file_watch_dirs:
+                return False
+            try:
+                self.dir_watches[directory] = self.observer.schedule(self, directory, recursive=False)
+                return True
+            except OSError as e:
+                print(f"[Watcher] Could not watch {directory}: {e}")
+                return False
+    
+    def _unwatch_directory(self, directory: str):
+        with self.watch_lock:
+            watch = self.dir_watches.pop(directory, None)
+            if watch is not None:
+                try:
+                    self.observer.unschedule(watch)
+                except (KeyError, OSError):
+                    pass
+    
+    def _in_dir_roots(self, path: str) -> bool:
+        return any(path == root or path.startswith(root + os.sep) for root in self.dir_roots)
+    
+    def _add_directory(self, directory: str):
+        """新建或移入的目录：注册监听，并补发其中已有文件的事件"""
+        if not self._in_dir_roots(directory) or self._should_ignore(directory, True):
             return
+        for sub_directory in self._scan_directories(directory):
+            if self._watch_directory(sub_directory):
+                try:
+                    with os.scandir(sub_directory) as entries:
+                        for entry in entries:
+                            if entry.is_file(follow_symlinks=False):
+                                self._queue_event('created', entry.path)
+                except OSError:
+                    continue
+    
+    def _remove_directory(self, directory: str):
+        """删除或移出的目录：注销它及其子目录的监听"""
+        with self.watch_lock:
+            for watched in list(self.dir_watches):
+                if watched == directory or watched.startswith(directory + os.sep):
+                    self._unwatch_directory(watched)
+    
+    def _queue_event(self, event_type: str, src_path: str):
+        """把原始事件交给合并器"""
+        event_path = os.path.abspath(src_path)
         
-        event_path = os.path.abspath(event.src_path)
+        if event_path == self.ignore_file:
+            self.reload_ignore()
+            return
         
         if self._should_ignore(event_path):
             return
         
-        if self._debounce_check(event_path):
-            relative_path = self._get_relative_path(event_path)
-            print(f"[Watcher] File modified: {relative_path}")
-            self._trigger_callback('modified', relative_path, event_path)
+        relative_path = self._get_relative_path(event_path)
+        self.coalescer.add(event_type, relative_path, event_path)
+    
+    def on_modified(self, event):
+        """文件被修改"""
+        if event.is_directory:
+            return
+        self._queue_event('modified', event.src_path)
     
     def on_created(self, event):
         """文件被创建"""
         if event.is_directory:
+            self._add_directory(os.path.abspath(event.src_path))
             return
-        
-        event_path = os.path.abspath(event.src_path)
-        
-        if self._should_ignore(event_path):
-            return
-        
-        if self._debounce_check(event_path):
-            relative_path = self._get_relative_path(event_path)
-            print(f"[Watcher] File created: {relative_path}")
-            self._trigger_callback('created', relative_path, event_path)
+        self._queue_event('created', event.src_path)
     
     def on_deleted(self, event):
         """文件被删除"""
         if event.is_directory:
+            self._remove_directory(os.path.abspath(event.src_path))
             return
-        
-        event_path = os.path.abspath(event.src_path)
-        
-        if self._should_ignore(event_path):
+        self._queue_event('deleted', event.src_path)
+    
+    def on_moved(self, event):
+        """文件被移动（编辑器保存时常见的临时文件改名）"""
+        if event.is_directory:
+            self._remove_directory(os.path.abspath(event.src_path))
+            self._add_directory(os.path.abspath(event.dest_path))
             return
-        
-        relative_path = self._get_relative_path(event_path)
-        print(f"[Watcher] File deleted: {relative_path}")
-        self._trigger_callback('deleted', relative_path, event_path)
+        self._queue_event('deleted', event.src_path)
+        self._queue_event('modified', event.dest_path)
+    
+    def _emit(self, event_type: str, relative_path: str, absolute_path: str = None):
+        """合并后的事件"""
+        if self.suppress and event_type != 'deleted':
+            if self.suppress(relative_path, absolute_path or os.path.join(self.workspace, relative_path)):
+                return
+        print(f"[Watcher] File {event_type}: {relative_path}")
+        self._trigger_callback(event_type, relative_path, absolute_path)
     
     def _trigger_callback(self, event_type: str, relative_path: str, absolute_path: str = None):
         """触发回调函数"""
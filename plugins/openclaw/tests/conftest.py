@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 插件模块按 src 目录平铺导入（与 benchmarks 相同）
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,76 @@
+import os
+import time
+
+from echo import EchoRegistry
+from manifest import SyncManifest
+from profiles import ProfilesClient
+from stub_server import StubCloudServer
+from sync import ProfileSync
+from sync_queue import SyncQueue
+from version_manager import VersionManager
+from watcher import OpenClawMultiWatcher
+
+FILES = 1000
+
+
+def wait_until(condition, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_pull_into_watched_workspace_uploads_nothing(tmp_path):
+    with StubCloudServer() as server:
+        server.state.tokens['tok'] = 'device'
+        with server.state.lock:
+            for i in range(FILES):
+                server.state.put_profile(f"memory/echo-{i:05d}.md", f"- remote note {i}\n")
+
+        workspace = str(tmp_path / 'workspace')
+        os.makedirs(workspace)
+        echo = EchoRegistry()
+        sync = ProfileSync(
+            ProfilesClient(server.url, 'tok'),
+            VersionManager(str(tmp_path / 'versions.json')),
+            workspace,
+            manifest=SyncManifest(str(tmp_path / 'manifest.json')),
+            echo=echo
+        )
+        queue = SyncQueue(sync.push_files, batch_window=0.05)
+        watcher = OpenClawMultiWatcher(
+            workspace,
+            ['memory/'],
+            lambda event_type, file_path, absolute_path=None: queue.submit(file_path),
+            debounce_seconds=0.1,
+            max_wait_seconds=0.5,
+            suppress=echo.is_echo
+        )
+        queue.start()
+        watcher.start()
+
+        def idle():
+            stats = queue.get_stats()
+            return (watcher.coalescer.get_stats()['pending'] == 0
+                    and stats['depth'] == 0 and stats['in_flight'] == 0)
+
+        try:
+            assert sync.pull_all()['files'] == FILES
+            time.sleep(0.3)
+            assert wait_until(idle)
+            assert server.state.stats['uploads'] == 0
+            assert queue.get_stats()['submitted'] == 0
+            assert echo.get_stats()['suppressed'] >= 1
+
+            # 之后用户自己的修改照常上传
+            file_path = 'memory/echo-00007.md'
+            with open(os.path.join(workspace, file_path), 'a', encoding='utf-8') as f:
+                f.write('- edited by the user\n')
+            assert wait_until(lambda: server.state.stats['uploads'] == 1)
+            assert server.state.profiles[file_path]['content'].endswith('- edited by the user\n')
+            assert queue.get_stats()['submitted'] == 1
+        finally:
+            watcher.stop()
+            queue.stop()
@@ -0,0 +1,43 @@
+from merge import merge_content, merge_lines
+
+
+def test_edit_of_unterminated_last_line_and_append_do_not_glue():
+    result = merge_lines('a\nb', 'a\nB', 'a\nb\nc')
+    assert result.clean
+    assert result.content == 'a\nB\nc'
+
+
+def test_final_newline_kept_when_one_side_has_it():
+    result = merge_lines('a\nb', 'a\nb\nc\n', 'a\nB')
+    assert result.content == 'a\nB\nc\n'
+
+
+def test_appends_to_memory_file_are_both_kept():
+    result = merge_content('MEMORY.md', '- one\n', '- one\n- two\n', '- one\n- three\n')
+    assert result.content == '- one\n- two\n- three\n'
+
+
+def test_identity_files_do_not_union_appends():
+    result = merge_content('SOUL.md', '# Soul\n', '# Soul\nI am X\n', '# Soul\nI am Y\n')
+    assert not result.clean
+
+
+def test_first_sync_conflict_without_base_is_not_merged(tmp_path):
+    from profiles import ProfilesClient
+    from stub_server import StubCloudServer
+    from sync import ProfileSync
+    from version_manager import VersionManager
+
+    with StubCloudServer() as server:
+        server.state.tokens['tok'] = 'device'
+        server.remote_write('SOUL.md', 'I am Y\n')
+        workspace = tmp_path / 'workspace'
+        workspace.mkdir()
+        (workspace / 'SOUL.md').write_text('I am X\n', encoding='utf-8')
+        sync = ProfileSync(ProfilesClient(server.url, 'tok'), VersionManager(str(tmp_path / 'versions.json')),
+                           str(workspace))
+
+        assert sync.resolve_conflict('SOUL.md') is None
+        assert sync.merge_stats['no_base'] == 1
+        assert server.state.profiles['SOUL.md']['content'] == 'I am Y\n'
+        assert (workspace / 'SOUL.md').read_text(encoding='utf-8') == 'I am X\n'
@@ -0,0 +1,39 @@
+import time
+
+from outbox import Outbox
+
+
+def test_unresolved_conflict_is_kept_and_retried(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'), retry_max=0.05, max_attempts=2)
+    outbox.add('SOUL.md')
+    started_at = time.time()
+
+    for _ in range(3):
+        outbox.conflict(['SOUL.md'], started_at, 'conflict')
+    assert outbox.conflicted() == ['SOUL.md']
+    assert outbox.get_stats()['conflicted'] == 1
+
+    time.sleep(0.06)
+    assert outbox.claim(10) == [('SOUL.md', 1)]
+
+    # 再次修改后按新修改处理
+    outbox.add('SOUL.md')
+    assert outbox.conflicted() == []
+    assert outbox.count() == 1
+    outbox.close()
+
+
+def test_old_database_gets_conflicted_column(tmp_path):
+    import sqlite3
+    db_file = str(tmp_path / 'outbox.db')
+    db = sqlite3.connect(db_file)
+    db.execute('CREATE TABLE outbox (path TEXT PRIMARY KEY, priority INTEGER NOT NULL, updated_at REAL NOT NULL,'
+               ' attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT)')
+    db.execute("INSERT INTO outbox (path, priority, updated_at) VALUES ('MEMORY.md', 1, 0)")
+    db.commit()
+    db.close()
+
+    outbox = Outbox(db_file)
+    assert outbox.get_stats()['conflicted'] == 0
+    assert outbox.claim(10) == [('MEMORY.md', 1)]
+    outbox.close()
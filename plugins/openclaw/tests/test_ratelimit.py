@@ -0,0 +1,24 @@
+import pytest
+
+from profiles import ProfilesClient
+from ratelimit import UploadLimiter
+from resilience import CircuitOpenError, Resilience, RetryPolicy
+from transport import Transport
+
+
+def test_circuit_rejection_does_not_shrink_concurrency():
+    limiter = UploadLimiter(rate=0, path_rate=0, concurrency=4, max_concurrency=8)
+    transport = Transport(resilience=Resilience(retry=RetryPolicy(max_attempts=1), failure_threshold=1,
+                                                reset_timeout=60))
+    transport.resilience.breaker('127.0.0.1:9').record_failure()
+    client = ProfilesClient('http://127.0.0.1:9', 'tok', transport=transport, limiter=limiter)
+
+    for _ in range(5):
+        with pytest.raises(CircuitOpenError):
+            client.upload_profile('MEMORY.md', 'x', 0)
+
+    stats = limiter.get_stats()
+    assert stats['concurrency_limit'] == 4
+    assert stats['decreases'] == 0
+    assert stats['in_flight'] == 0
+    assert stats['requests'] == 0
@@ -0,0 +1,60 @@
+import os
+
+from cursor import SyncCursor
+from manifest import SyncManifest
+from profiles import ProfilesClient
+from reconcile import Reconciler
+from stub_server import StubCloudServer
+from sync import ProfileSync
+from version_manager import VersionManager
+
+
+def make_sync(server, root) -> ProfileSync:
+    workspace = os.path.join(root, 'workspace')
+    os.makedirs(workspace, exist_ok=True)
+    return ProfileSync(
+        ProfilesClient(server.url, 'tok'),
+        VersionManager(os.path.join(root, 'versions.json')),
+        workspace,
+        manifest=SyncManifest(os.path.join(root, 'manifest.json')),
+        cursor=SyncCursor(os.path.join(root, 'sync_cursor.json'), scope=server.url)
+    )
+
+
+def test_first_start_then_catch_up_downloads_once(tmp_path):
+    with StubCloudServer() as server:
+        server.state.tokens['tok'] = 'device'
+        for i in range(20):
+            server.remote_write(f"memory/note-{i}.md", f"note {i}\n" * 200)
+        sync = make_sync(server, str(tmp_path))
+
+        summary = Reconciler(sync, ['memory/']).run()
+        assert summary['pulled'] == 20
+        assert sync.cursor.get() is not None
+
+        before = server.state.stats['bytes_sent']
+        assert sync.sync_since_cursor()['files'] == 0
+        assert server.state.stats['bytes_sent'] - before < 1000
+
+
+def test_warm_start_pulls_changes_once_and_advances_cursor(tmp_path):
+    with StubCloudServer() as server:
+        server.state.tokens['tok'] = 'device'
+        for i in range(20):
+            server.remote_write(f"memory/note-{i}.md", f"note {i}\n" * 200)
+        sync = make_sync(server, str(tmp_path))
+        sync.pull_all()
+        sync.sync_since_cursor()
+
+        server.remote_write('memory/note-3.md', 'changed while offline\n' * 200)
+        server.remote_write('memory/new.md', 'created while offline\n')
+        summary = Reconciler(sync, ['memory/']).run()
+        assert summary['pulled'] == 2
+        assert summary['pull_errors'] == 0
+
+        before = server.state.stats['bytes_sent']
+        assert sync.sync_since_cursor()['files'] == 0
+        assert server.state.stats['bytes_sent'] - before < 1000
+        workspace = sync.workspace
+        with open(os.path.join(workspace, 'memory/new.md'), encoding='utf-8') as f:
+            assert f.read() == 'created while offline\n'